@@ -0,0 +1,41 @@
+"""ingestion checkpoint
+
+Revision ID: 3b7d9e2f4a10
+Revises: 8e4b1f3c6a27
+Create Date: 2026-10-19 12:05:11.481230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d9e2f4a10'
+down_revision: Union[str, None] = '8e4b1f3c6a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ingestion_checkpoint',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('source_hash', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('total_folios', sa.Integer(), nullable=False),
+    sa.Column('completed_folios', sa.Integer(), nullable=False),
+    sa.Column('start_txn_id', sa.Integer(), nullable=False),
+    sa.Column('payload_path', sa.String(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'source_hash', name='uq_ingestion_checkpoint_source')
+    )
+    op.create_index(op.f('ix_ingestion_checkpoint_user_id'), 'ingestion_checkpoint', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ingestion_checkpoint_user_id'), table_name='ingestion_checkpoint')
+    op.drop_table('ingestion_checkpoint')
@@ -0,0 +1,37 @@
+"""portfolio history
+
+Revision ID: 5c1e7d2a9b40
+Revises: a09fb6f89f33
+Create Date: 2026-10-19 09:02:11.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e7d2a9b40'
+down_revision: Union[str, None] = 'a09fb6f89f33'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('portfolio_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('history_date', sa.Date(), nullable=False),
+    sa.Column('portfolio_value', sa.Float(), nullable=False),
+    sa.Column('invested', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'history_date', name='uq_portfolio_history_user_date')
+    )
+    op.create_index(op.f('ix_portfolio_history_user_id'), 'portfolio_history', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_portfolio_history_user_id'), table_name='portfolio_history')
+    op.drop_table('portfolio_history')
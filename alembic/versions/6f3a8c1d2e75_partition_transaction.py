@@ -0,0 +1,112 @@
+"""partition transaction by scheme
+
+Revision ID: 6f3a8c1d2e75
+Revises: 3b7d9e2f4a10
+Create Date: 2026-10-19 15:40:27.913402
+
+Rebuilds "transaction" as a PostgreSQL table partitioned by HASH (scheme_id) into
+TRANSACTION_PARTITIONS partitions (default 16). Scheme detail views, the ingestion
+diff and clear_database_for_identifier all filter on scheme_id, so the planner
+prunes them to the partitions holding those schemes; each partition keeps its own
+(scheme_id, transaction_date) index. A partitioned table's primary key must
+contain the partition key, so it becomes (id, scheme_id); ids still come from
+transaction_id_seq.
+
+The rows are copied with a single INSERT ... SELECT, in one transaction that holds
+an ACCESS EXCLUSIVE lock on "transaction" until it commits: reads and uploads wait
+for the whole copy, and there is no batched or online path. On a large deployment
+run it in a maintenance window. TRANSACTION_PARTITIONS=0 only adds the index and
+keeps the table as it is.
+
+scheme_id becomes NOT NULL. Rows without a scheme belong to no folio or user; the
+migration refuses to run while any exist, unless TRANSACTION_DELETE_ORPHANS=1, in
+which case it logs how many it deletes.
+
+The expected gains are not measured: partition_benchmark.py compares the two
+layouts on PostgreSQL but has not been run against production-sized data.
+"""
+import logging
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f3a8c1d2e75'
+down_revision: Union[str, None] = '3b7d9e2f4a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+COLUMNS = "id, scheme_id, transaction_date, description, amount, units, nav, balance, transaction_type, dividend_rate"
+COLUMN_DEFINITIONS = """
+    id INTEGER NOT NULL DEFAULT nextval('transaction_id_seq'),
+    scheme_id INTEGER NOT NULL REFERENCES scheme (id),
+    transaction_date DATE,
+    description VARCHAR,
+    amount FLOAT,
+    units FLOAT,
+    nav FLOAT,
+    balance FLOAT,
+    transaction_type VARCHAR,
+    dividend_rate FLOAT
+"""
+
+
+def _is_partitioned(bind) -> bool:
+    return bind.execute(sa.text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('\"transaction\"')"
+    )).scalar() or False
+
+
+def _swap_table(create_sql: str, after_create: Sequence[str] = ()) -> None:
+    """Moves the rows into a table made by create_sql that takes over the name and the id sequence."""
+    op.execute('ALTER TABLE "transaction" RENAME TO transaction_old')
+    op.execute('ALTER INDEX transaction_pkey RENAME TO transaction_old_pkey')
+    op.execute(create_sql)
+    for statement in after_create:
+        op.execute(statement)
+    op.execute(f'INSERT INTO "transaction" ({COLUMNS}) SELECT {COLUMNS} FROM transaction_old')
+    op.execute('ALTER SEQUENCE transaction_id_seq OWNED BY "transaction".id')
+    op.execute('DROP TABLE transaction_old')
+
+
+def upgrade() -> None:
+    partitions = int(os.getenv("TRANSACTION_PARTITIONS", "16"))
+    bind = op.get_bind()
+    # scheme_id becomes NOT NULL (and part of the key); rows without one are only deleted on request.
+    orphans = bind.execute(sa.text('SELECT count(*) FROM "transaction" WHERE scheme_id IS NULL')).scalar()
+    if orphans:
+        if os.getenv("TRANSACTION_DELETE_ORPHANS") != "1":
+            raise RuntimeError(
+                f"{orphans} transaction rows have no scheme_id. Inspect or move them, or set "
+                f"TRANSACTION_DELETE_ORPHANS=1 to delete them in this migration."
+            )
+        logger.warning(f"Deleting {orphans} transaction rows without a scheme_id")
+        op.execute('DELETE FROM "transaction" WHERE scheme_id IS NULL')
+    if bind.dialect.name == "postgresql" and partitions > 0:
+        _swap_table(
+            f'CREATE TABLE "transaction" ({COLUMN_DEFINITIONS}, PRIMARY KEY (id, scheme_id)) '
+            f'PARTITION BY HASH (scheme_id)',
+            [f'CREATE TABLE transaction_p{i:02d} PARTITION OF "transaction" '
+             f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})' for i in range(partitions)],
+        )
+    else:
+        with op.batch_alter_table('transaction') as batch_op:
+            batch_op.alter_column('scheme_id', existing_type=sa.Integer(), nullable=False)
+    # Created on the parent, so every partition gets (and any new partition inherits) the index.
+    op.create_index('ix_transaction_scheme_id_date', 'transaction', ['scheme_id', 'transaction_date'], unique=False)
+    if bind.dialect.name == "postgresql":
+        op.execute('ANALYZE "transaction"')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transaction_scheme_id_date', table_name='transaction')
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql" and _is_partitioned(bind):
+        _swap_table(f'CREATE TABLE "transaction" ({COLUMN_DEFINITIONS}, PRIMARY KEY (id))')
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.alter_column('scheme_id', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,59 @@
+"""scheme master
+
+Revision ID: 8e4b1f3c6a27
+Revises: 5c1e7d2a9b40
+Create Date: 2026-10-19 10:15:42.903127
+
+Moves amfi_code, rta, rta_code and scheme_type of schemes with an ISIN into
+scheme_master. Schemes without an ISIN keep them in their own columns, which stay
+as nullable fallbacks (Scheme.fallback_*), so no metadata is lost.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4b1f3c6a27'
+down_revision: Union[str, None] = '5c1e7d2a9b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('scheme_master',
+    sa.Column('isin', sa.String(), nullable=False),
+    sa.Column('amfi_code', sa.String(), nullable=True),
+    sa.Column('scheme_name', sa.String(), nullable=True),
+    sa.Column('scheme_type', sa.String(), nullable=True),
+    sa.Column('rta', sa.String(), nullable=True),
+    sa.Column('rta_code', sa.String(), nullable=True),
+    sa.Column('fmv_20180131', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('isin')
+    )
+    op.create_index(op.f('ix_scheme_master_amfi_code'), 'scheme_master', ['amfi_code'], unique=False)
+    # Seed the master from the per-user copies, newest row per ISIN wins.
+    op.execute(
+        "INSERT INTO scheme_master (isin, amfi_code, scheme_name, scheme_type, rta, rta_code) "
+        "SELECT DISTINCT ON (isin) isin, amfi_code, scheme_name, scheme_type, rta, rta_code "
+        "FROM scheme WHERE isin IS NOT NULL ORDER BY isin, id DESC"
+    )
+    op.create_index(op.f('ix_scheme_isin'), 'scheme', ['isin'], unique=False)
+    op.create_foreign_key('fk_scheme_isin_scheme_master', 'scheme', 'scheme_master', ['isin'], ['isin'])
+    # The master row now holds these; rows without an ISIN keep theirs.
+    op.execute(
+        "UPDATE scheme SET amfi_code = NULL, rta = NULL, rta_code = NULL, scheme_type = NULL "
+        "WHERE isin IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE scheme SET amfi_code = m.amfi_code, rta = m.rta, rta_code = m.rta_code, "
+        "scheme_type = m.scheme_type FROM scheme_master m WHERE m.isin = scheme.isin"
+    )
+    op.drop_constraint('fk_scheme_isin_scheme_master', 'scheme', type_='foreignkey')
+    op.drop_index(op.f('ix_scheme_isin'), table_name='scheme')
+    op.drop_index(op.f('ix_scheme_master_amfi_code'), table_name='scheme_master')
+    op.drop_table('scheme_master')
@@ -0,0 +1,26 @@
+"""user data version
+
+Revision ID: 9a2c4e6b8d13
+Revises: 6f3a8c1d2e75
+Create Date: 2026-10-19 18:12:44.305117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a2c4e6b8d13'
+down_revision: Union[str, None] = '6f3a8c1d2e75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'data_version')
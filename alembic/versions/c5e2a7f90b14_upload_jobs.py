@@ -0,0 +1,42 @@
+"""upload jobs
+
+Revision ID: c5e2a7f90b14
+Revises: 9a2c4e6b8d13
+Create Date: 2026-10-19 20:41:09.552810
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e2a7f90b14'
+down_revision: Union[str, None] = '9a2c4e6b8d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('upload_job',
+    sa.Column('job_id', sa.String(), nullable=False),
+    sa.Column('running_key', sa.String(), nullable=True),
+    sa.Column('last_event_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('job_id'),
+    sa.UniqueConstraint('running_key')
+    )
+    op.create_table('upload_event',
+    sa.Column('job_id', sa.String(), nullable=False),
+    sa.Column('event_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('payload', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['job_id'], ['upload_job.job_id'], ),
+    sa.PrimaryKeyConstraint('job_id', 'event_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('upload_event')
+    op.drop_table('upload_job')
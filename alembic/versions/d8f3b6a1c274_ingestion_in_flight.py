@@ -0,0 +1,31 @@
+"""ingestion in flight
+
+Revision ID: d8f3b6a1c274
+Revises: c5e2a7f90b14
+Create Date: 2026-10-19 21:17:52.104386
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f3b6a1c274'
+down_revision: Union[str, None] = 'c5e2a7f90b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ingestion_in_flight',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('start_txn_id', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ingestion_in_flight')
@@ -0,0 +1,274 @@
+# File: analytics.py
+import logging
+from datetime import date
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import AMC, Folio, Scheme, Transaction, Valuation
+
+logger = logging.getLogger("ANALYTICS")
+
+DAYS_IN_YEAR = 365.0
+MAX_NEWTON_ITERATIONS = 50
+MAX_BISECT_ITERATIONS = 200
+TOLERANCE = 1e-9
+# Bracket used when Newton does not converge for a group.
+RATE_LOWER_BOUND = -0.9999
+RATE_UPPER_BOUND = 100.0
+
+# casparser transaction types that move money between the investor and the fund.
+# CAS amounts are positive for money going in and negative for money coming out,
+# so the investor's cash flow is the negated amount.
+INVESTMENT_TYPES = {
+    "PURCHASE",
+    "PURCHASE_SIP",
+    "SWITCH_IN",
+    "SWITCH_IN_MERGER",
+    "REDEMPTION",
+    "SWITCH_OUT",
+    "SWITCH_OUT_MERGER",
+    "REVERSAL",
+}
+# Dividends paid out are money received by the investor.
+PAYOUT_TYPES = {"DIVIDEND_PAYOUT"}
+
+
+def cashflow_amount(transaction_type: Optional[str], amount: Optional[float]) -> float:
+    """
+    Returns the investor-side cash flow for a transaction (negative = money invested),
+    or 0.0 for rows that do not move money (taxes, stamp duty, reinvested dividends).
+    """
+    if amount is None:
+        return 0.0
+    if transaction_type in INVESTMENT_TYPES:
+        return -float(amount)
+    if transaction_type in PAYOUT_TYPES:
+        return abs(float(amount))
+    return 0.0
+
+
+def _npv(rates: np.ndarray, amounts: np.ndarray, years: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    with np.errstate(over="ignore", invalid="ignore"):
+        discount = np.power(1.0 + rates[groups], -years)
+    return np.bincount(groups, weights=amounts * discount, minlength=n_groups)
+
+
+def xirr_batch(
+    amounts: np.ndarray,
+    days: np.ndarray,
+    groups: np.ndarray,
+    n_groups: int,
+    guess: float = 0.1,
+) -> np.ndarray:
+    """
+    Solves XIRR for many independent cash-flow series at once.
+
+    The series are passed flattened: flow i belongs to series groups[i], has the
+    investor-side amount amounts[i] and happens on day days[i] (any day ordinal).
+    Newton iterations run for every series simultaneously; series that fail to
+    converge fall back to a vectorized bisection over a fixed bracket.
+
+    Args:
+        amounts: Cash flows, negative for investments and positive for proceeds.
+        days: Day ordinals of the flows.
+        groups: Series index (0..n_groups-1) of every flow.
+        n_groups: Number of series.
+        guess: Starting rate for Newton.
+
+    Returns:
+        An array of annual rates (0.1 == 10%), NaN where no rate exists.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    days = np.asarray(days, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    rates = np.full(n_groups, np.nan)
+    if n_groups == 0 or amounts.size == 0:
+        return rates
+
+    # A rate only exists when a series has both money going in and coming out.
+    has_outflow = np.bincount(groups, weights=(amounts < 0), minlength=n_groups) > 0
+    has_inflow = np.bincount(groups, weights=(amounts > 0), minlength=n_groups) > 0
+    solvable = has_outflow & has_inflow
+    if not solvable.any():
+        return rates
+
+    first_day = np.full(n_groups, np.inf)
+    np.minimum.at(first_day, groups, days)
+    years = (days - first_day[groups]) / DAYS_IN_YEAR
+
+    # Newton-Raphson on every series at once.
+    rate = np.full(n_groups, guess)
+    converged = ~solvable
+    for _ in range(MAX_NEWTON_ITERATIONS):
+        with np.errstate(all="ignore"):
+            discount = np.power(1.0 + rate[groups], -years)
+            npv = np.bincount(groups, weights=amounts * discount, minlength=n_groups)
+            slope = np.bincount(
+                groups, weights=-years * amounts * discount / (1.0 + rate[groups]), minlength=n_groups
+            )
+            step = np.where(converged | (slope == 0) | ~np.isfinite(slope), 0.0, npv / slope)
+        rate = rate - step
+        # Keep the iteration inside the domain of (1 + r) ** -t.
+        rate = np.where(rate <= -1.0, RATE_LOWER_BOUND, rate)
+        converged |= np.abs(step) < TOLERANCE
+        if converged.all():
+            break
+
+    npv = _npv(rate, amounts, years, groups, n_groups)
+    scale = np.bincount(groups, weights=np.abs(amounts), minlength=n_groups)
+    good = solvable & np.isfinite(rate) & (np.abs(npv) <= 1e-6 * np.maximum(scale, 1.0))
+    rates[good] = rate[good]
+
+    # Bisection fallback for the series Newton could not settle.
+    retry = solvable & ~good
+    if retry.any():
+        lo = np.full(n_groups, RATE_LOWER_BOUND)
+        hi = np.full(n_groups, RATE_UPPER_BOUND)
+        f_lo = _npv(lo, amounts, years, groups, n_groups)
+        f_hi = _npv(hi, amounts, years, groups, n_groups)
+        retry &= np.sign(f_lo) != np.sign(f_hi)
+        for _ in range(MAX_BISECT_ITERATIONS):
+            mid = (lo + hi) / 2.0
+            f_mid = _npv(mid, amounts, years, groups, n_groups)
+            same_side = np.sign(f_mid) == np.sign(f_lo)
+            lo = np.where(same_side, mid, lo)
+            f_lo = np.where(same_side, f_mid, f_lo)
+            hi = np.where(same_side, hi, mid)
+            if np.all((hi - lo)[retry] < TOLERANCE):
+                break
+        rates[retry] = ((lo + hi) / 2.0)[retry]
+
+    return rates
+
+
+def build_xirr_report(
+    schemes: Sequence[Tuple[int, str, int, str]],
+    transactions: Sequence[Tuple[int, date, Optional[float], Optional[str]]],
+    valuations: Sequence[Tuple[int, Optional[date], Optional[float]]],
+    as_of: Optional[date] = None,
+) -> dict:
+    """
+    Computes XIRR and CAGR per scheme, per AMC and for the whole portfolio in one solver call.
+
+    Args:
+        schemes: (scheme_id, scheme_name, amc_id, amc_name) rows.
+        transactions: (scheme_id, transaction_date, amount, transaction_type) rows.
+        valuations: (scheme_id, valuation_date, valuation_value) rows; the current
+            value is treated as a final inflow on the valuation date.
+        as_of: Date used for valuations without a date. Defaults to today.
+
+    Returns:
+        A dict with "schemes", "amcs" and "portfolio" entries.
+    """
+    as_of = as_of or date.today()
+    scheme_index = {row[0]: i for i, row in enumerate(schemes)}
+    amc_ids = sorted({row[2] for row in schemes})
+    amc_index = {amc_id: len(schemes) + i for i, amc_id in enumerate(amc_ids)}
+    amc_names = {row[2]: row[3] for row in schemes}
+    portfolio_group = len(schemes) + len(amc_ids)
+    n_groups = portfolio_group + 1
+    scheme_amc_group = np.array([amc_index[row[2]] for row in schemes], dtype=np.int64)
+
+    flow_scheme = []
+    flow_day = []
+    flow_amount = []
+    for scheme_id, txn_date, amount, txn_type in transactions:
+        if scheme_id not in scheme_index or txn_date is None:
+            continue
+        cash = cashflow_amount(txn_type, amount)
+        if cash:
+            flow_scheme.append(scheme_index[scheme_id])
+            flow_day.append(txn_date.toordinal())
+            flow_amount.append(cash)
+
+    current_value = np.zeros(len(schemes))
+    for scheme_id, valuation_date, value in valuations:
+        if scheme_id not in scheme_index or not value:
+            continue
+        idx = scheme_index[scheme_id]
+        current_value[idx] += float(value)
+        flow_scheme.append(idx)
+        flow_day.append((valuation_date or as_of).toordinal())
+        flow_amount.append(float(value))
+
+    scheme_group = np.asarray(flow_scheme, dtype=np.int64)
+    days = np.asarray(flow_day, dtype=np.int64)
+    amounts = np.asarray(flow_amount, dtype=np.float64)
+
+    # Every flow is counted three times: for its scheme, its AMC and the portfolio.
+    all_groups = np.concatenate(
+        [scheme_group, scheme_amc_group[scheme_group], np.full(scheme_group.size, portfolio_group)]
+    )
+    all_days = np.tile(days, 3)
+    all_amounts = np.tile(amounts, 3)
+    rates = xirr_batch(all_amounts, all_days, all_groups, n_groups)
+
+    # CAGR over the holding period: everything received (redemptions, payouts and
+    # the current value) against the money invested.
+    invested = np.bincount(
+        all_groups, weights=np.where(all_amounts < 0, -all_amounts, 0.0), minlength=n_groups
+    )
+    received = np.bincount(
+        all_groups, weights=np.where(all_amounts > 0, all_amounts, 0.0), minlength=n_groups
+    )
+    value = np.zeros(n_groups)
+    value[: len(schemes)] = current_value
+    np.add.at(value, scheme_amc_group, current_value)
+    value[portfolio_group] = current_value.sum()
+    first_day = np.full(n_groups, np.inf)
+    last_day = np.full(n_groups, -np.inf)
+    if all_days.size:
+        np.minimum.at(first_day, all_groups, all_days)
+        np.maximum.at(last_day, all_groups, all_days)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        years = (last_day - first_day) / DAYS_IN_YEAR
+        cagr = np.where((invested > 0) & (years > 0), np.power(received / invested, 1.0 / years) - 1.0, np.nan)
+
+    def entry(group: int, entry_id, name: str) -> dict:
+        return {
+            "id": entry_id,
+            "name": name,
+            "invested": float(invested[group]),
+            "current_value": float(value[group]),
+            "xirr_percent": None if np.isnan(rates[group]) else float(rates[group] * 100),
+            "cagr_percent": None if np.isnan(cagr[group]) else float(cagr[group] * 100),
+        }
+
+    return {
+        "schemes": [entry(i, row[0], row[1]) for i, row in enumerate(schemes)],
+        "amcs": [entry(amc_index[amc_id], amc_id, amc_names[amc_id]) for amc_id in amc_ids],
+        "portfolio": entry(portfolio_group, None, "Portfolio"),
+    }
+
+
+def get_user_xirr(db: Session, user_id: str) -> dict:
+    """
+    Computes the XIRR report for a user from stored transactions. GET /test/users/{user_id}/xirr
+    caches the response per user data version (see response_cache.py).
+    """
+    schemes = (
+        db.query(Scheme.id, Scheme.scheme_name, AMC.id, AMC.name)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .join(AMC, Scheme.amc_id == AMC.id)
+        .filter(Folio.user_id == user_id)
+        .all()
+    )
+    transactions = (
+        db.query(Transaction.scheme_id, Transaction.transaction_date, Transaction.amount, Transaction.transaction_type)
+        .join(Scheme, Transaction.scheme_id == Scheme.id)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .filter(Folio.user_id == user_id)
+        .all()
+    )
+    valuations = (
+        db.query(Valuation.scheme_id, Valuation.valuation_date, Valuation.valuation_value)
+        .join(Scheme, Valuation.scheme_id == Scheme.id)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .filter(Folio.user_id == user_id)
+        .all()
+    )
+    report = build_xirr_report(schemes, transactions, valuations)
+    logger.info(f"XIRR computed for user {user_id} over {len(schemes)} schemes and {len(transactions)} transactions")
+    return report
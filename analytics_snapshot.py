@@ -0,0 +1,255 @@
+# File: analytics_snapshot.py
+"""
+Columnar snapshots of the Transaction and Valuation tables for analytics jobs,
+so pandas jobs read files instead of scanning the production database.
+
+    python analytics_snapshot.py /data/snapshot
+    python analytics_snapshot.py /data/snapshot --format arrow --full
+
+Writes hive-partitioned datasets under the target directory:
+
+    transactions/user_bucket=3/year=2024/part-<first id>-<last id>-0.parquet
+    valuations/user_bucket=3/year=2025/part-0.parquet
+    _snapshot.json      format, buckets and the transaction id watermark
+
+user_bucket is crc32(user_id) % --buckets, so a job can pick one user's files
+without reading the rest. Ingestion only ever adds transactions, so each run
+appends the transactions with an id above the stored watermark. Ids are not
+committed in order, so the watermark stops below every ingestion still running
+(see safe_watermark). Valuations are
+updated in place but there is only one per scheme, so they are rewritten on
+every run. Rows deleted from the database (a removed account) stay in the
+snapshot until a --full rebuild.
+
+Read with pandas.read_parquet("<target>/transactions") or pyarrow.dataset.
+--format arrow writes uncompressed Arrow IPC files instead, which pyarrow
+memory-maps and reads without copying:
+pyarrow.dataset.dataset("<target>/transactions", format="ipc", partitioning="hive").
+
+Needs pyarrow, which only this tool imports.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Folio, IngestionInFlight, Scheme, Transaction, Valuation
+
+logger = logging.getLogger("SNAPSHOT")
+
+STATE_FILE = "_snapshot.json"
+DEFAULT_BUCKETS = 16
+BATCH_ROWS = 50_000
+# An in-flight marker older than this belongs to a crashed ingestion and no longer holds the watermark.
+IN_FLIGHT_TIMEOUT = timedelta(hours=1)
+FORMATS = {"parquet": "parquet", "arrow": "ipc"}  # --format: pyarrow.dataset format
+
+TRANSACTION_COLUMNS = ("id", "scheme_id", "transaction_date", "description", "amount", "units", "nav", "balance",
+                       "transaction_type", "dividend_rate")
+VALUATION_COLUMNS = ("id", "scheme_id", "valuation_date", "valuation_nav", "valuation_cost", "valuation_value")
+OWNER_COLUMNS = ("user_id", "folio_number", "isin")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError as e:
+        raise RuntimeError("Analytics snapshots need pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def user_bucket(user_id: str, buckets: int) -> int:
+    """Partition of a user's rows; stable across runs and processes, unlike hash()."""
+    return zlib.crc32(user_id.encode()) % buckets
+
+
+def _schemas(pa):
+    """Row schemas of the two datasets (partition columns last) and the partitioning schema."""
+    partition_fields = [pa.field("user_bucket", pa.int32()), pa.field("year", pa.int32())]
+    owner = [("user_id", pa.string()), ("folio_number", pa.string()), ("isin", pa.string())]
+    transaction = pa.schema([
+        ("id", pa.int64()), ("scheme_id", pa.int64()), ("transaction_date", pa.date32()),
+        ("description", pa.string()), ("amount", pa.float64()), ("units", pa.float64()), ("nav", pa.float64()),
+        ("balance", pa.float64()), ("transaction_type", pa.string()), ("dividend_rate", pa.float64()),
+    ] + owner + partition_fields)
+    valuation = pa.schema([
+        ("id", pa.int64()), ("scheme_id", pa.int64()), ("valuation_date", pa.date32()),
+        ("valuation_nav", pa.float64()), ("valuation_cost", pa.float64()), ("valuation_value", pa.float64()),
+    ] + owner + partition_fields)
+    return transaction, valuation, pa.schema(partition_fields)
+
+
+def safe_watermark(session: Session, now: Optional[datetime] = None) -> int:
+    """
+    The highest transaction id up to which no more rows can be committed.
+
+    Transactions commit out of id order: a running ingestion may commit ids below
+    max(id) later. Every ingestion (publish_statement) commits an IngestionInFlight
+    marker holding max(id) before it inserts anything, and deletes it in the transaction
+    that commits its last rows. The markers are read after max(id), so any row still
+    uncommitted below max(id) belongs to a marker seen here, and the watermark stops at
+    the lowest one. Markers older than IN_FLIGHT_TIMEOUT (a crashed process) are ignored.
+    """
+    high = session.query(func.max(Transaction.id)).scalar() or 0
+    cutoff = (now or datetime.utcnow()) - IN_FLIGHT_TIMEOUT
+    in_flight = (
+        session.query(func.min(IngestionInFlight.start_txn_id))
+        .filter(IngestionInFlight.started_at >= cutoff)
+        .scalar()
+    )
+    if in_flight is not None and in_flight < high:
+        logger.info(f"Ingestion in progress: snapshotting transactions up to id {in_flight} instead of {high}")
+        high = in_flight
+    return high
+
+
+def _record_batches(pa, session: Session, query, columns, date_column: str, schema, buckets: int,
+                    batch_rows: int) -> Iterator:
+    """Streams a query's rows (with yield_per) as RecordBatches with the partition columns added."""
+    result = session.execute(query.execution_options(yield_per=batch_rows))
+    names = list(columns) + list(OWNER_COLUMNS)
+    for rows in result.partitions():
+        data = {name: [row[i] for row in rows] for i, name in enumerate(names)}
+        data["user_bucket"] = [user_bucket(user_id, buckets) for user_id in data["user_id"]]
+        data["year"] = [d.year if d is not None else None for d in data[date_column]]
+        yield pa.RecordBatch.from_pydict(data, schema=schema)
+
+
+def _owned_rows(model, columns):
+    """Selects columns of model plus the owning user, folio and ISIN of its scheme."""
+    return (
+        select(*(getattr(model, c) for c in columns), Folio.user_id, Folio.folio_number, Scheme.isin)
+        .join(Scheme, model.scheme_id == Scheme.id)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+    )
+
+
+def _counted(batches, counts: dict, key: str):
+    for batch in batches:
+        counts[key] += batch.num_rows
+        yield batch
+
+
+def _remove_parts(directory: str, prefix: str) -> None:
+    """Deletes files left by a run that wrote but crashed before saving its watermark."""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.startswith(prefix):
+                os.remove(os.path.join(root, name))
+
+
+def _write(pa, batches, schema, partitioning, directory: str, fmt: str, basename: str) -> None:
+    pa.dataset.write_dataset(
+        batches, directory, schema=schema, format=FORMATS[fmt], partitioning=partitioning,
+        basename_template=f"{basename}-{{i}}.{'parquet' if fmt == 'parquet' else 'arrow'}",
+        existing_data_behavior="overwrite_or_ignore",  # keep the parts of earlier runs
+    )
+
+
+def load_state(target: str) -> dict:
+    path = os.path.join(target, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(target: str, state: dict) -> None:
+    path = os.path.join(target, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def snapshot(session_factory: Callable, target: str, fmt: str = "parquet", buckets: int = DEFAULT_BUCKETS,
+             full: bool = False, batch_rows: int = BATCH_ROWS) -> dict:
+    """
+    Appends new transactions to the snapshot in target and rewrites its valuations.
+
+    Args:
+        session_factory: Sessionmaker for the database to read.
+        target: Snapshot directory; created if missing.
+        fmt: "parquet" or "arrow" (uncompressed Arrow IPC, for memory-mapped reads).
+        buckets: Number of user_bucket partitions.
+        full: Discard the existing snapshot and export everything again.
+        batch_rows: Rows fetched per round trip and per record batch.
+
+    Returns:
+        Counts of rows written, the new watermark and the elapsed seconds.
+    """
+    pa = _pyarrow()
+    started = time.perf_counter()
+    state = {} if full else load_state(target)
+    if state and (state["format"], state["buckets"]) != (fmt, buckets):
+        raise ValueError(f"{target} holds a {state['format']} snapshot with {state['buckets']} buckets; "
+                         f"use --full to rebuild it as {fmt} with {buckets}")
+    if full:
+        shutil.rmtree(os.path.join(target, "transactions"), ignore_errors=True)
+    os.makedirs(target, exist_ok=True)
+    transaction_schema, valuation_schema, partition_schema = _schemas(pa)
+    partitioning = pa.dataset.partitioning(partition_schema, flavor="hive")
+    low = state.get("watermark", 0)
+
+    counts = {"transactions": 0, "valuations": 0}
+    with session_factory() as session:
+        high = safe_watermark(session)
+        if high > low:
+            query = (_owned_rows(Transaction, TRANSACTION_COLUMNS)
+                     .where(Transaction.id > low, Transaction.id <= high)
+                     .order_by(Transaction.id))
+            batches = _record_batches(pa, session, query, TRANSACTION_COLUMNS, "transaction_date",
+                                      transaction_schema, buckets, batch_rows)
+            directory = os.path.join(target, "transactions")
+            _remove_parts(directory, f"part-{low + 1}-")
+            _write(pa, _counted(batches, counts, "transactions"), transaction_schema, partitioning, directory, fmt,
+                   f"part-{low + 1}-{high}")
+
+        # Valuations go to a fresh directory that replaces the old one once complete.
+        staging = os.path.join(target, "valuations.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        query = _owned_rows(Valuation, VALUATION_COLUMNS).order_by(Valuation.id)
+        batches = _record_batches(pa, session, query, VALUATION_COLUMNS, "valuation_date", valuation_schema,
+                                  buckets, batch_rows)
+        _write(pa, _counted(batches, counts, "valuations"), valuation_schema, partitioning, staging, fmt, "part")
+        shutil.rmtree(os.path.join(target, "valuations"), ignore_errors=True)
+        os.replace(staging, os.path.join(target, "valuations"))
+
+    state = {
+        "format": fmt,
+        "buckets": buckets,
+        "watermark": max(high, low),
+        "transactions": state.get("transactions", 0) + counts["transactions"],
+        "valuations": counts["valuations"],
+        "updated_at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+    _save_state(target, state)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Snapshot {target}: {counts['transactions']} new transaction(s) up to id {state['watermark']}, "
+                f"{counts['valuations']} valuation(s) in {elapsed:.1f} s")
+    return dict(counts, watermark=state["watermark"], seconds=round(elapsed, 3))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(description="Write a partitioned columnar snapshot of transactions "
+                                                 "and valuations.")
+    parser.add_argument("target")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS, help="user hash partitions")
+    parser.add_argument("--full", action="store_true", help="rebuild instead of appending new rows")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+
+    from db import SessionLocal
+
+    print(json.dumps(snapshot(SessionLocal, args.target, args.format, args.buckets, args.full, args.batch_rows),
+                     indent=2))
@@ -0,0 +1,209 @@
+# File: bulk_import.py
+"""
+Offline bulk import of CAS files, for backfilling a partner's historical statements.
+
+    python bulk_import.py /data/partner-cas --password SECRET --workers 8
+    python bulk_import.py /data/json-dumps --email investor@example.com
+
+Walks the directory for .pdf, .json and .ndjson files, parses them in a process
+pool (the pool processes call casparser themselves, not the web server's
+pdf_workers parsers) and ingests the parsed statements through the batched ingestion pipeline
+(ingest_pipeline.publish_statement) into DATABASE_URL. At most --max-in-flight
+files are parsed but not yet ingested, so memory stays bounded however fast the
+parsers are. Every file is recorded in a manifest by content hash; files already
+imported successfully are skipped, so an interrupted run can simply be restarted.
+
+Statements are ingested for --email, or else for the investor email in each
+statement; that user must already be registered. The stored portfolio history of
+every imported user is refreshed once when the run ends (or is interrupted), not
+after every statement.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+
+from ingest_checkpoint import INGEST_CHUNK_FOLIOS, file_hash
+from ingest_pipeline import JsonFileSource, StageTimings, publish_statement
+from models import Transaction, User
+from pdf_workers import read_cas_pdf
+from portfolio_history import refresh_after_ingest
+
+logger = logging.getLogger("BULK_IMPORT")
+
+EXTENSIONS = (".pdf", ".json", ".ndjson")
+DEFAULT_MANIFEST = "bulk_import_manifest.jsonl"
+PROGRESS_EVERY = 50  # files
+
+
+def find_files(directory: str) -> Iterator[str]:
+    """Yields the CAS files under directory in a stable (sorted) order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def load_manifest(path: str) -> Set[str]:
+    """Returns the hashes of files the manifest records as imported."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash
+            if entry.get("status") == "ok":
+                done.add(entry["hash"])
+    return done
+
+
+def parse_file(path: str, password: str, email: Optional[str]) -> List[Tuple[Optional[str], dict]]:
+    """Runs in a pool process: returns (email, statement) for every statement in the file."""
+    if path.lower().endswith(".pdf"):
+        # Parsed right here: the pool process is already the worker, CasPdfSource would
+        # start a pdf_workers parser pool in every one of them.
+        data = json.loads(read_cas_pdf(path, password))
+        return [(email or (data.get("investor_info") or {}).get("email"), data)]
+    return [(statement_email, data) for statement_email, data, _ in JsonFileSource(path, email)]
+
+
+class BulkImporter:
+    """
+    Parses files in a process pool and ingests them in this process, keeping at most
+    max_in_flight parsed files waiting, and appends each outcome to the manifest.
+    """
+
+    def __init__(self, session_factory: Callable, manifest_path: str = DEFAULT_MANIFEST,
+                 password: str = "", email: Optional[str] = None, workers: int = 0,
+                 max_in_flight: int = 0, chunk_size: int = INGEST_CHUNK_FOLIOS):
+        self.session_factory = session_factory
+        self.manifest_path = manifest_path
+        self.password = password
+        self.email = email
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.chunk_size = chunk_size
+        self.timings = StageTimings()
+        self.counts = {"files": 0, "skipped": 0, "failed": 0, "statements": 0}
+        self.emails: Set[str] = set()  # users whose portfolio history needs a refresh
+
+    def _record(self, manifest, path: str, digest: str, status: str, **extra) -> None:
+        manifest.write(json.dumps(dict({"hash": digest, "path": path, "status": status}, **extra)) + "\n")
+        manifest.flush()
+
+    def _ingest(self, manifest, path: str, digest: str, future: Future) -> None:
+        self.counts["files"] += 1
+        try:
+            statements = future.result()
+        except Exception as e:
+            logger.error(f"Could not parse {path}: {e}")
+            self.counts["failed"] += 1
+            self._record(manifest, path, digest, "failed", error=f"parse: {e}")
+            return
+        rows_before = self.timings.rows
+        failed = 0
+        for index, (email, data) in enumerate(statements):
+            # Each statement of a file gets its own checkpoint, so a retry resumes inside the file.
+            source_hash = digest if len(statements) == 1 else f"{digest}:{index}"
+            if not publish_statement(self.session_factory, data, email, self.chunk_size, source_hash,
+                                     timings=self.timings, refresh_history=False):
+                failed += 1
+            if email:
+                self.emails.add(email)
+        self.counts["statements"] += len(statements)
+        if failed:
+            self.counts["failed"] += 1
+            self._record(manifest, path, digest, "failed", error=f"{failed} of {len(statements)} statement(s) failed")
+        else:
+            self._record(manifest, path, digest, "ok", statements=len(statements),
+                         rows=self.timings.rows - rows_before)
+
+    def _progress(self, started: float) -> None:
+        if self.counts["files"] % PROGRESS_EVERY == 0:
+            elapsed = time.perf_counter() - started
+            logger.info(f"{self.counts['files']} files, {self.timings.rows} rows in {elapsed:.0f} s "
+                        f"({self.counts['files'] / elapsed:.1f} files/s, {self.timings.rows / elapsed:.0f} rows/s)")
+
+    def _refresh_histories(self, start_txn_id: int) -> None:
+        # Reads never write the series, so it is stored here for every imported user.
+        with self.timings.stage("history"), self.session_factory() as db:
+            for email in sorted(self.emails):
+                user = db.query(User).filter(User.email == email).first()
+                if user:
+                    refresh_after_ingest(db, user.user_id, start_txn_id)
+
+    def run(self, directory: str) -> dict:
+        """Imports every new file under directory and returns the throughput report."""
+        done = load_manifest(self.manifest_path)
+        with self.session_factory() as db:
+            start_txn_id = db.query(func.max(Transaction.id)).scalar() or 0
+        started = time.perf_counter()
+        try:
+            self._import(directory, done, started)
+        finally:
+            self._refresh_histories(start_txn_id)
+        return self.report(time.perf_counter() - started)
+
+    def _import(self, directory: str, done: Set[str], started: float) -> None:
+        pending: Dict[Future, Tuple[str, str]] = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool, open(self.manifest_path, "a") as manifest:
+            for path in find_files(directory):
+                digest = file_hash(path)
+                if digest in done:
+                    self.counts["skipped"] += 1
+                    continue
+                done.add(digest)  # the same file twice in one run is imported once
+                if len(pending) >= self.max_in_flight:
+                    # Backpressure: ingest finished parses before submitting more work.
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        self._ingest(manifest, *pending.pop(future), future)
+                        self._progress(started)
+                pending[pool.submit(parse_file, path, self.password, self.email)] = (path, digest)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self._ingest(manifest, *pending.pop(future), future)
+                    self._progress(started)
+
+    def report(self, elapsed: float) -> dict:
+        return dict(
+            self.counts,
+            rows=self.timings.rows,
+            seconds=round(elapsed, 3),
+            files_per_second=round(self.counts["files"] / elapsed, 2) if elapsed else 0.0,
+            rows_per_second=round(self.timings.rows / elapsed, 1) if elapsed else 0.0,
+            stages={name: round(seconds, 3) for name, seconds in self.timings.seconds.items()},
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(description="Bulk import CAS PDFs and JSON dumps from a directory.")
+    parser.add_argument("directory")
+    parser.add_argument("--password", default="", help="password of the CAS PDFs")
+    parser.add_argument("--email", help="account to import into (default: each statement's investor email)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="hashes of processed files, for resuming")
+    parser.add_argument("--workers", type=int, default=0, help="parser processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="parsed files waiting to be ingested "
+                                                                     "(default: twice the workers)")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_FOLIOS, help="folios per commit")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+
+    importer = BulkImporter(SessionLocal, args.manifest, args.password, args.email, args.workers,
+                            args.max_in_flight, args.chunk_size)
+    result = importer.run(args.directory)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["failed"] else 0)
@@ -0,0 +1,247 @@
+# File: capital_gains.py
+import logging
+from collections import Counter
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import Folio, Scheme, SchemeMaster, Transaction, scheme_metadata
+from nav_history import get_nav_store, to_amfi_codes
+
+logger = logging.getLogger("GAINS")
+
+PURCHASE_TYPES = {
+    "PURCHASE",
+    "PURCHASE_SIP",
+    "SWITCH_IN",
+    "SWITCH_IN_MERGER",
+    "DIVIDEND_REINVEST",
+    "REVERSAL",
+}
+SALE_TYPES = {"REDEMPTION", "SWITCH_OUT", "SWITCH_OUT_MERGER"}
+
+EQUITY_LTCG_DAYS = 365
+DEBT_LTCG_DAYS = 365 * 3
+# Finance (No. 2) Act 2024: non-equity units transferred from 23-Jul-2024 are long term after 24 months.
+DEBT_LTCG_DAYS_2024 = 365 * 2
+DEBT_RULE_2024 = date(2024, 7, 23).toordinal()
+# Finance Act 2023: non-equity units bought from 1-Apr-2023 are always short term.
+DEBT_NO_LTCG_FROM = date(2023, 4, 1).toordinal()
+# Equity units bought before 1-Feb-2018 use the 31-Jan-2018 NAV as grandfathered cost.
+GRANDFATHER_CUTOFF = date(2018, 2, 1).toordinal()
+GRANDFATHER_NAV_DATE = date(2018, 1, 31)
+UNIT_EPSILON = 1e-6
+
+
+class LotQueue:
+    """
+    FIFO queue of purchase lots for one scheme, backed by preallocated arrays.
+
+    Lots are appended at the tail and consumed from the head; a redemption is
+    matched against the head lots with one cumulative sum instead of a loop.
+    """
+
+    __slots__ = ("days", "units", "unit_cost", "head", "tail")
+
+    def __init__(self, capacity: int):
+        self.days = np.empty(capacity, dtype=np.int64)
+        self.units = np.empty(capacity, dtype=np.float64)
+        self.unit_cost = np.empty(capacity, dtype=np.float64)
+        self.head = 0
+        self.tail = 0
+
+    def push(self, day: int, units: float, unit_cost: float) -> None:
+        self.days[self.tail] = day
+        self.units[self.tail] = units
+        self.unit_cost[self.tail] = unit_cost
+        self.tail += 1
+
+    def held(self) -> float:
+        return float(self.units[self.head:self.tail].sum())
+
+    def take(self, quantity: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+        """
+        Removes `quantity` units from the oldest lots.
+
+        Returns:
+            (purchase_days, units, unit_cost) of the matched pieces and the
+            quantity that could not be matched because the queue ran out.
+        """
+        live = self.units[self.head:self.tail]
+        cumulative = np.cumsum(live)
+        k = int(np.searchsorted(cumulative, quantity - UNIT_EPSILON))
+        if k >= live.size:
+            pieces = slice(self.head, self.tail)
+            matched = (self.days[pieces].copy(), live.copy(), self.unit_cost[pieces].copy())
+            self.head = self.tail
+            return matched + (quantity - float(cumulative[-1]) if live.size else quantity,)
+        pieces = slice(self.head, self.head + k + 1)
+        units = live[: k + 1].copy()
+        leftover = float(cumulative[k]) - quantity
+        units[-1] -= max(leftover, 0.0)
+        matched = (self.days[pieces].copy(), units, self.unit_cost[pieces].copy())
+        if leftover > UNIT_EPSILON:
+            self.units[self.head + k] = leftover
+            self.head += k
+        else:
+            self.head += k + 1
+        return matched + (0.0,)
+
+    def cancel_latest(self, quantity: float) -> None:
+        """Removes units from the newest lots, used for reversed purchases."""
+        while quantity > UNIT_EPSILON and self.tail > self.head:
+            last = self.tail - 1
+            removed = min(quantity, self.units[last])
+            self.units[last] -= removed
+            quantity -= removed
+            if self.units[last] <= UNIT_EPSILON:
+                self.tail -= 1
+
+
+def financial_year(day: int) -> str:
+    d = date.fromordinal(int(day))
+    start = d.year if d.month >= 4 else d.year - 1
+    return f"FY{start}-{str(start + 1)[-2:]}"
+
+
+def compute_capital_gains(
+    schemes: Sequence[Tuple[int, str, Optional[str], Optional[str], Optional[float]]],
+    transactions: Sequence[Tuple[int, date, Optional[float], Optional[float], Optional[str]]],
+) -> dict:
+    """
+    Matches redemptions against purchases FIFO for a whole portfolio in one pass.
+
+    Args:
+        schemes: (scheme_id, scheme_name, scheme_type, amfi_code, fmv_20180131) rows;
+            the 31-Jan-2018 NAV may be None.
+        transactions: (scheme_id, transaction_date, amount, units, transaction_type)
+            rows ordered by scheme, date and id.
+
+    Returns:
+        A dict with short/long term gains per financial year and per scheme and
+        financial year, plus schemes whose sales exceeded the recorded purchases.
+    """
+    scheme_index = {row[0]: i for i, row in enumerate(schemes)}
+    is_equity = np.array([(row[2] or "").upper() == "EQUITY" for row in schemes], dtype=bool)
+    capacity = Counter(row[0] for row in transactions)
+    queues: Dict[int, LotQueue] = {}
+
+    sale_scheme: List[np.ndarray] = []
+    sale_day: List[np.ndarray] = []
+    buy_day: List[np.ndarray] = []
+    matched_units: List[np.ndarray] = []
+    unit_cost: List[np.ndarray] = []
+    sale_price: List[np.ndarray] = []
+    unmatched: Dict[int, float] = {}
+
+    for scheme_id, txn_date, amount, units, txn_type in transactions:
+        if scheme_id not in scheme_index or txn_date is None or not units:
+            continue
+        queue = queues.get(scheme_id)
+        if queue is None:
+            queue = queues[scheme_id] = LotQueue(capacity[scheme_id])
+        day = txn_date.toordinal()
+        amount = float(amount or 0.0)
+        if units > 0 and txn_type in PURCHASE_TYPES:
+            queue.push(day, units, amount / units)
+        elif units < 0 and txn_type == "REVERSAL":
+            queue.cancel_latest(-units)
+        elif units < 0 and txn_type in SALE_TYPES:
+            days, lot_units, lot_cost, missing = queue.take(-units)
+            if missing > UNIT_EPSILON:
+                unmatched[scheme_id] = unmatched.get(scheme_id, 0.0) + missing
+            n = days.size
+            sale_scheme.append(np.full(n, scheme_index[scheme_id]))
+            sale_day.append(np.full(n, day))
+            buy_day.append(days)
+            matched_units.append(lot_units)
+            unit_cost.append(lot_cost)
+            sale_price.append(np.full(n, abs(amount) / -units))
+
+    report = {"financial_years": [], "schemes": [], "unmatched": []}
+    for scheme_id, missing in unmatched.items():
+        report["unmatched"].append({"scheme_id": scheme_id, "units": missing})
+        logger.warning(f"Scheme {scheme_id}: {missing:.3f} redeemed units have no matching purchase")
+    if not sale_day:
+        return report
+
+    s_idx = np.concatenate(sale_scheme)
+    s_day = np.concatenate(sale_day)
+    b_day = np.concatenate(buy_day)
+    units = np.concatenate(matched_units)
+    cost = np.concatenate(unit_cost) * units
+    proceeds = np.concatenate(sale_price) * units
+    equity = is_equity[s_idx]
+
+    # Grandfathered cost for equity bought before 1-Feb-2018 and sold after 31-Mar-2018.
+    grandfathered = equity & (b_day < GRANDFATHER_CUTOFF) & (s_day > date(2018, 3, 31).toordinal())
+    if grandfathered.any():
+        # Bundled 31-Jan-2018 NAVs from the scheme master first, the NAV history store otherwise.
+        master_nav = np.array([np.nan if row[4] is None else row[4] for row in schemes])[s_idx[grandfathered]]
+        codes = to_amfi_codes([row[3] for row in schemes])[s_idx[grandfathered]]
+        store_nav, _ = get_nav_store().as_of(codes, GRANDFATHER_NAV_DATE)
+        fmv_nav = np.where(np.isnan(master_nav), store_nav, master_nav)
+        fmv = np.where(np.isnan(fmv_nav), 0.0, fmv_nav * units[grandfathered])
+        cost[grandfathered] = np.maximum(cost[grandfathered], np.minimum(fmv, proceeds[grandfathered]))
+
+    held = s_day - b_day
+    debt_threshold = np.where(s_day >= DEBT_RULE_2024, DEBT_LTCG_DAYS_2024, DEBT_LTCG_DAYS)
+    long_term = np.where(equity, held > EQUITY_LTCG_DAYS, (held > debt_threshold) & (b_day < DEBT_NO_LTCG_FROM))
+    gain = proceeds - cost
+
+    fy_labels = np.array([financial_year(d) for d in s_day])
+    years, fy_idx = np.unique(fy_labels, return_inverse=True)
+    n_years = years.size
+    for i, fy in enumerate(years):
+        in_year = fy_idx == i
+        report["financial_years"].append({
+            "financial_year": str(fy),
+            "stcg": float(gain[in_year & ~long_term].sum()),
+            "ltcg": float(gain[in_year & long_term].sum()),
+            "equity_stcg": float(gain[in_year & ~long_term & equity].sum()),
+            "equity_ltcg": float(gain[in_year & long_term & equity].sum()),
+            "sale_value": float(proceeds[in_year].sum()),
+            "cost": float(cost[in_year].sum()),
+        })
+
+    # Per scheme and year, aggregated with one bincount per measure.
+    cell = s_idx * n_years + fy_idx
+    n_cells = len(schemes) * n_years
+    stcg = np.bincount(cell, weights=np.where(long_term, 0.0, gain), minlength=n_cells)
+    ltcg = np.bincount(cell, weights=np.where(long_term, gain, 0.0), minlength=n_cells)
+    for c in np.unique(cell):
+        scheme = schemes[c // n_years]
+        report["schemes"].append({
+            "scheme_id": scheme[0],
+            "scheme_name": scheme[1],
+            "financial_year": str(years[c % n_years]),
+            "stcg": float(stcg[c]),
+            "ltcg": float(ltcg[c]),
+        })
+    return report
+
+
+def get_user_capital_gains(db: Session, user_id: str) -> dict:
+    """Loads every scheme and unit-bearing transaction of a user in two queries and computes gains."""
+    schemes = (
+        db.query(Scheme.id, Scheme.scheme_name, scheme_metadata("scheme_type"), scheme_metadata("amfi_code"),
+                 SchemeMaster.fmv_20180131)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .outerjoin(SchemeMaster, Scheme.isin == SchemeMaster.isin)
+        .filter(Folio.user_id == user_id)
+        .all()
+    )
+    transactions = (
+        db.query(Transaction.scheme_id, Transaction.transaction_date, Transaction.amount,
+                 Transaction.units, Transaction.transaction_type)
+        .join(Scheme, Transaction.scheme_id == Scheme.id)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .filter(Folio.user_id == user_id, Transaction.units.isnot(None))
+        .order_by(Transaction.scheme_id, Transaction.transaction_date, Transaction.id)
+        .all()
+    )
+    report = compute_capital_gains(schemes, transactions)
+    logger.info(f"Capital gains computed for user {user_id} over {len(transactions)} transactions")
+    return report
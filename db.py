@@ -1,5 +1,18 @@
 # File: db.py
-from sqlalchemy import create_engine
+import logging
+import os
+import heapq
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from logging_config import logger, DBURL
@@ -11,11 +24,13 @@ DATABASE_URL = DBURL
 logger.info(f"DB URL fetched from .env file")
 logger.debug(f"from DB.PY Database : {DATABASE_URL}")
 
-# For SQLite, include connect_args; otherwise, remove or adjust accordingly
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+
+def _create_engine(url: str) -> Engine:
+    # For SQLite, include connect_args; otherwise, remove or adjust accordingly
+    return create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+
+
+engine = _create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -27,3 +42,178 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# --- Read replicas -----------------------------------------------------------
+# READ_DATABASE_URLS (comma separated) lists replicas of DATABASE_URL. Read-only
+# GET endpoints take their session from get_read_db, which picks a replica unless
+# the user wrote recently (read-your-writes); everything else uses the writer.
+# Without replicas get_read_db is get_db. Replicas can be PostgreSQL standbys or,
+# locally, copies of a SQLite file.
+
+READ_DATABASE_URLS = [url.strip() for url in os.getenv("READ_DATABASE_URLS", "").split(",") if url.strip()]
+# How long after an ingestion the user's reads stay on the writer; should exceed the replica lag.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "30"))
+# Set on upload responses, so the stickiness also holds in other worker processes.
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+
+read_engines: List[Engine] = [_create_engine(url) for url in READ_DATABASE_URLS]
+_recent_writes: Dict[str, float] = {}  # user id or email -> time.time() until which reads use the writer
+_recent_writes_lock = threading.Lock()
+
+
+def mark_recent_write(*keys: Optional[str]) -> float:
+    """
+    Sends the reads of a user (by user id and/or email) to the writer for READ_YOUR_WRITES_SECONDS.
+
+    Returns:
+        The time (time.time()) until which the reads are sticky.
+    """
+    now = time.time()
+    until = now + READ_YOUR_WRITES_SECONDS
+    with _recent_writes_lock:
+        for key in [key for key, expiry in _recent_writes.items() if expiry <= now]:
+            del _recent_writes[key]
+        for key in keys:
+            if key:
+                _recent_writes[key] = until
+    return until
+
+
+def has_recent_write(*keys: Optional[str]) -> bool:
+    now = time.time()
+    with _recent_writes_lock:
+        return any(_recent_writes.get(key, 0.0) > now for key in keys if key)
+
+
+def read_engine_for(request: Request) -> Optional[Engine]:
+    """The replica a request may read from, or None if it must use the writer."""
+    if not read_engines or request.method not in ("GET", "HEAD"):
+        return None
+    try:
+        if float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time():
+            return None
+    except ValueError:
+        pass
+    if has_recent_write(request.path_params.get("user_id"), getattr(request.state, "user_email", None)):
+        return None
+    return random.choice(read_engines)
+
+
+def get_read_db(request: Request, db=Depends(get_db)):
+    """
+    Session for read-only endpoints: on a replica when one is configured and the user has
+    no recent write, otherwise the writer session from get_db (which only connects if used).
+    """
+    reader = read_engine_for(request)
+    if reader is None:
+        yield db
+        return
+    read_db = SessionLocal(bind=reader)
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
+
+# --- Query instrumentation -------------------------------------------------
+# Every statement on any engine is counted into the QueryStats of the current
+# request (set by track_queries, see AuthLoggingMiddleware in main.py).
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOWEST_KEPT = 10  # statements a QueryStats keeps for diagnostics
+sql_logger = logging.getLogger("SQL")
+
+
+class QueryStats:
+    """
+    Number of statements and total DB time of one request or test block, plus its `keep`
+    slowest statements. Memory stays bounded however many statements the block runs.
+    """
+
+    __slots__ = ("count", "duration", "keep", "_slowest", "parent")
+
+    def __init__(self, parent: Optional["QueryStats"] = None, keep: int = SLOWEST_KEPT):
+        self.count = 0
+        self.duration = 0.0
+        self.keep = keep
+        self._slowest: List[Tuple[float, int, str]] = []  # min-heap of (elapsed, count, statement)
+        self.parent = parent  # enclosing block, which counts the same statements
+
+    def record(self, statement: str, elapsed: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.duration += elapsed
+            if len(stats._slowest) < stats.keep:
+                heapq.heappush(stats._slowest, (elapsed, stats.count, statement))
+            elif stats.keep and elapsed > stats._slowest[0][0]:
+                heapq.heapreplace(stats._slowest, (elapsed, stats.count, statement))
+            stats = stats.parent
+
+    def slowest(self) -> List[Tuple[str, float]]:
+        """The kept (statement, seconds) pairs, slowest first."""
+        return [(statement, elapsed) for elapsed, _, statement in sorted(self._slowest, reverse=True)]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\([^)]*\)s|\?|:\w+")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Normalises a statement for logging: literals and bind parameters become ?, IN lists collapse."""
+    statement = _LITERALS.sub("?", statement)
+    statement = _IN_LISTS.sub("(?...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+@contextmanager
+def track_queries(keep: int = SLOWEST_KEPT):
+    """
+    Collects QueryStats for the statements executed inside the block. The stats live in a
+    context variable: calls through run_in_threadpool or asyncio.to_thread copy the context
+    and are counted, but threads started with threading.Thread or a ThreadPoolExecutor (such
+    as the background upload job) begin with an empty context and are not.
+    """
+    stats = QueryStats(parent=_current_stats.get(), keep=keep)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+    context._query_timed = True
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # A statement that raised never reaches after_cursor_execute; drop its start time so
+    # the next statement on this connection is not timed against it.
+    context = exception_context.execution_context
+    if context is not None and getattr(context, "_query_timed", False):
+        context._query_timed = False
+        exception_context.connection.info["query_start"].pop()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_timed = False
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        # Parameter values may hold personal data; only their number is logged.
+        n_params = len(parameters) if parameters is not None else 0
+        shape = f"executemany x{n_params}" if executemany else f"{n_params} parameters"
+        sql_logger.warning(f"Slow query ({elapsed * 1000:.1f} ms, {shape}): {fingerprint(statement)}")
@@ -9,5 +9,10 @@ done
 echo "Running database migrations..."
 alembic upgrade head
 
+if [ "$APP_MODE" = "production" ]; then
+  echo "Starting FastAPI application with gunicorn (${WEB_WORKERS:-$(nproc)} workers)..."
+  exec gunicorn -c gunicorn.conf.py main:app
+fi
+
 echo "Starting FastAPI application..."
-exec uvicorn main:app --host 0.0.0.0 --port 8000
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools
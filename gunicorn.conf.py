@@ -0,0 +1,80 @@
+# File: gunicorn.conf.py
+# Production server settings, used by `gunicorn -c gunicorn.conf.py main:app` (see entrypoint.sh).
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "workers.TunedUvicornWorker"
+
+# Import the app once in the master so workers share its memory copy-on-write.
+preload_app = True
+
+# Recycle workers after a number of requests (jittered so they do not restart together).
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "100"))
+
+# PDF parsing can keep a worker busy for a long time; only kill truly stuck workers.
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+# After SIGTERM uvicorn gives open connections GRACEFUL_TIMEOUT (workers.py), then the shutdown
+# hook waits up to INGESTION_DRAIN_TIMEOUT for running ingestions (lifecycle.py). Gunicorn kills
+# the worker after graceful_timeout, so it must cover both plus the rest of the shutdown hook.
+SHUTDOWN_MARGIN_SECONDS = 15
+graceful_timeout = (int(os.getenv("GRACEFUL_TIMEOUT", "120"))
+                    + int(float(os.getenv("INGESTION_DRAIN_TIMEOUT", "120")))
+                    + SHUTDOWN_MARGIN_SECONDS)
+keepalive = 5
+
+# Per-worker resident memory cap; the worker is restarted gracefully once above it. 0 disables.
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "1024"))
+MEMORY_CHECK_INTERVAL = 10
+
+logger = logging.getLogger("GUNICORN")
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _watch_memory(worker):
+    while True:
+        time.sleep(MEMORY_CHECK_INTERVAL)
+        rss = _rss_mb()
+        if rss > WORKER_MAX_RSS_MB:
+            worker.log.warning(f"Worker {worker.pid} uses {rss:.0f} MB > {WORKER_MAX_RSS_MB} MB; recycling")
+            # Same path as a normal shutdown: stop accepting, finish in-flight requests, exit.
+            os.kill(worker.pid, signal.SIGTERM)
+            return
+
+
+def pre_fork(server, worker):
+    # Move everything loaded by the preloaded app out of the GC's reach, so collections
+    # in the workers do not touch (and un-share) those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Never reuse connections opened by the master before the fork, on the writer or a replica.
+    from db import engine, read_engines
+    for pooled in [engine] + read_engines:
+        pooled.dispose(close=False)
+
+
+def post_worker_init(worker):
+    if WORKER_MAX_RSS_MB > 0:
+        threading.Thread(target=_watch_memory, args=(worker,), name="memory-watchdog", daemon=True).start()
+
+
+def worker_exit(server, worker):
+    server.log.info(f"Worker {worker.pid} exited")
@@ -0,0 +1,106 @@
+# File: ingest_checkpoint.py
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import IngestionCheckpoint, IngestionInFlight, Transaction, User
+
+logger = logging.getLogger("CHECKPOINT")
+
+# Folios committed per transaction in chunked ingestion; 0 ingests a statement in one transaction.
+INGEST_CHUNK_FOLIOS = int(os.getenv("INGEST_CHUNK_FOLIOS", "10"))
+# Parsed statements of unfinished jobs are kept here so a retry does not parse the PDF again.
+PAYLOAD_DIR = os.getenv("INGEST_PAYLOAD_DIR", os.path.join("upload", "checkpoints"))
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def statement_hash(data: dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def save_payload(source_hash: str, data: dict) -> str:
+    os.makedirs(PAYLOAD_DIR, exist_ok=True)
+    path = os.path.join(PAYLOAD_DIR, f"{source_hash}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+    return path
+
+
+def load_resumable_payload(session: Session, email: str, source_hash: str) -> Optional[dict]:
+    """Returns the saved statement of an unfinished job for this user and source, if there is one."""
+    checkpoint = (
+        session.query(IngestionCheckpoint)
+        .join(User, IngestionCheckpoint.user_id == User.user_id)
+        .filter(User.email == email, IngestionCheckpoint.source_hash == source_hash,
+                IngestionCheckpoint.status != "completed")
+        .first()
+    )
+    if checkpoint is None or not checkpoint.payload_path or not os.path.exists(checkpoint.payload_path):
+        return None
+    with open(checkpoint.payload_path) as f:
+        data = json.load(f)
+    logger.info(f"Resuming ingestion at folio {checkpoint.completed_folios + 1} of {checkpoint.total_folios}")
+    return data
+
+
+def begin_checkpoint(session: Session, user_id: str, source_hash: str, total_folios: int,
+                     start_txn_id: int, payload_path: Optional[str] = None) -> IngestionCheckpoint:
+    """
+    Returns the checkpoint to continue from: the unfinished one for this source, or a fresh one.
+    A completed job for the same source starts over, so re-uploading a statement re-merges it.
+    """
+    checkpoint = session.query(IngestionCheckpoint).filter_by(user_id=user_id, source_hash=source_hash).first()
+    if checkpoint is not None and checkpoint.status != "completed" and checkpoint.total_folios == total_folios:
+        checkpoint.status = "running"
+        checkpoint.payload_path = payload_path or checkpoint.payload_path
+    else:
+        if checkpoint is None:
+            checkpoint = IngestionCheckpoint(user_id=user_id, source_hash=source_hash)
+            session.add(checkpoint)
+        checkpoint.status = "running"
+        checkpoint.total_folios = total_folios
+        checkpoint.completed_folios = 0
+        checkpoint.start_txn_id = start_txn_id
+        checkpoint.payload_path = payload_path
+    session.flush()
+    return checkpoint
+
+
+def begin_in_flight(session: Session) -> int:
+    """
+    Registers an ingestion that is about to insert transactions and commits, so the marker
+    is visible before any of its ids are allocated (see analytics_snapshot.safe_watermark).
+    Returns the marker's id for end_in_flight.
+    """
+    marker = IngestionInFlight(start_txn_id=session.query(func.max(Transaction.id)).scalar() or 0)
+    session.add(marker)
+    session.commit()
+    return marker.id
+
+
+def end_in_flight(session: Session, marker_id: int) -> None:
+    """Removes the marker; the caller commits, together with the ingestion's last rows."""
+    session.query(IngestionInFlight).filter(IngestionInFlight.id == marker_id).delete(synchronize_session=False)
+
+
+def finish_checkpoint(checkpoint: IngestionCheckpoint) -> None:
+    """Marks the job completed and removes its saved statement; the caller commits."""
+    if checkpoint.payload_path and os.path.exists(checkpoint.payload_path):
+        os.remove(checkpoint.payload_path)
+    checkpoint.payload_path = None
+    checkpoint.completed_folios = checkpoint.total_folios
+    checkpoint.status = "completed"
@@ -0,0 +1,92 @@
+# File: ingest_lock.py
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger("INGEST_LOCK")
+
+# Longest time an ingestion waits for another ingestion of the same user.
+INGEST_LOCK_TIMEOUT = int(os.getenv("INGEST_LOCK_TIMEOUT", "600"))
+
+
+class IngestLockTimeout(Exception):
+    pass
+
+
+def lock_key(user_key: str) -> int:
+    """Stable signed 64-bit advisory lock key for a user."""
+    digest = hashlib.sha256(f"ingest:{user_key}".encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+# In-process fallback: one lock per user, kept only while someone holds or waits for it.
+_local_locks: Dict[str, List] = {}  # user key -> [lock, number of holders and waiters]
+_local_guard = threading.Lock()
+
+
+@contextmanager
+def _local_lock(user_key: str) -> Iterator[None]:
+    with _local_guard:
+        entry = _local_locks.setdefault(user_key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        if not entry[0].acquire(timeout=INGEST_LOCK_TIMEOUT):
+            raise IngestLockTimeout(f"Another ingestion for {user_key} is still running")
+        try:
+            yield
+        finally:
+            entry[0].release()
+    finally:
+        with _local_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _local_locks[user_key]
+
+
+@contextmanager
+def _advisory_lock(engine: Engine, user_key: str) -> Iterator[Connection]:
+    # A session-level advisory lock, so it survives the commits of chunked ingestion.
+    # The connection holding it is yielded for the ingestion to run on: an ingestion
+    # then takes one pooled connection, not one for the lock plus one for the session.
+    key = lock_key(user_key)
+    with engine.connect() as conn:
+        try:
+            # SET LOCAL ends with this transaction; the lock (session-level) does not.
+            conn.execute(text(f"SET LOCAL lock_timeout = '{INGEST_LOCK_TIMEOUT}s'"))
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+        except Exception as e:
+            conn.rollback()
+            raise IngestLockTimeout(f"Another ingestion for {user_key} is still running") from e
+        conn.commit()
+        try:
+            yield conn
+        finally:
+            conn.rollback()  # whatever the ingestion left open
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+            conn.commit()
+
+
+@contextmanager
+def user_ingest_lock(engine: Engine, user_key: str) -> Iterator[Optional[Connection]]:
+    """
+    Serialises ingestions of one user; ingestions of different users never wait for each other.
+
+    PostgreSQL uses an advisory lock, which also covers other workers and hosts.
+    Other databases (SQLite in tests and development) fall back to an in-process
+    lock, which only serialises ingestions within this process.
+
+    Yields:
+        The connection holding the advisory lock, which the ingestion should use for
+        its session; None for the in-process lock.
+    """
+    user_key = user_key.strip().lower()
+    lock = _advisory_lock(engine, user_key) if engine.dialect.name == "postgresql" else _local_lock(user_key)
+    with lock as conn:
+        logger.debug(f"Ingestion lock acquired for {user_key}")
+        yield conn
@@ -0,0 +1,699 @@
+# File: ingest_pipeline.py
+"""
+Staged ingestion of CAS statements: normalize -> resolve keys -> diff -> bulk write.
+
+A source yields (email, statement, source_hash) for each statement it holds,
+where statement is casparser's JSON layout:
+
+    CasPdfSource("cas.pdf", "password", email)     # parses the PDF with casparser
+    JsonFileSource("output.json", email)           # a .json file, or one statement per line in .ndjson
+    StatementStream(statements)                    # statements, or (email, statement) pairs, from memory
+
+    ingest(JsonFileSource("output.json", "you@example.com"))
+
+or from the command line:
+
+    python ingest_pipeline.py output.json --email you@example.com
+
+The time spent in each stage is accumulated per ingestion and logged with the result.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, exists, func, insert, update
+from sqlalchemy.orm import Session
+
+from db import mark_recent_write
+from ingest_checkpoint import (begin_checkpoint, begin_in_flight, end_in_flight, file_hash, finish_checkpoint,
+                               statement_hash)
+from ingest_lock import IngestLockTimeout, user_ingest_lock
+from ingest_progress import report as report_progress
+from models import Folio, IngestionCheckpoint, Scheme, StatementPeriod, Transaction, User, Valuation
+from pdf_workers import parse_cas_pdf
+from portfolio_history import refresh_after_ingest
+from scheme_master import discard_pending, ensure_scheme_master, get_amc_id
+
+# The PDF logger, so pipeline messages keep appearing in the upload report.
+logger = logging.getLogger("PDF")
+
+STAGES = ("read", "normalize", "resolve", "diff", "write")
+
+
+def parse_date(date_str: str) -> date:
+    """
+    Try multiple date formats.
+    Formats include:
+      - "YYYY-MM-DD" (e.g., "2025-03-05")
+      - "YYYY-MMM-DD" (e.g., "2025-Mar-05")
+      - "DD-MMM-YYYY" (e.g., "01-Jan-2025")
+    """
+    for fmt in ("%Y-%m-%d", "%Y-%b-%d", "%d-%b-%Y"):
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except (ValueError, TypeError):
+            continue
+    raise ValueError(f"Date format for '{date_str}' not recognized.")
+
+
+def _number(value) -> Optional[float]:
+    """casparser writes numbers as strings ("3000.000"); empty values stay None."""
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+class StageTimings:
+    """
+    Wall-clock seconds spent in each pipeline stage, summed over all batches of an ingestion,
+    and the number of rows the write stage inserted or updated.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.rows = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+
+    def summary(self) -> str:
+        ordered = [s for s in STAGES if s in self.seconds] + [s for s in self.seconds if s not in STAGES]
+        return ", ".join(f"{name} {self.seconds[name] * 1000:.1f} ms" for name in ordered)
+
+
+# --- Sources ---
+
+class CasPdfSource:
+    """A CAS PDF, parsed with casparser."""
+
+    def __init__(self, path: str, password: str, email: str):
+        self.path = path
+        self.password = password
+        self.email = email
+
+    def read(self) -> dict:
+        # Parsed in a separate, resource-limited process (see pdf_workers.py).
+        return json.loads(parse_cas_pdf(self.path, self.password))
+
+    def __iter__(self) -> Iterator[Tuple[str, dict, Optional[str]]]:
+        yield self.email, self.read(), file_hash(self.path)
+
+
+class JsonFileSource:
+    """
+    A statement saved as JSON (e.g. output.json), or an .ndjson file with one statement per line.
+    Without an email, each statement is ingested for its investor_info email.
+    """
+
+    def __init__(self, path: str, email: Optional[str] = None):
+        self.path = path
+        self.email = email
+
+    def __iter__(self) -> Iterator[Tuple[str, dict, Optional[str]]]:
+        with open(self.path) as f:
+            if not self.path.endswith(".ndjson"):
+                data = json.load(f)
+                yield self.email or _statement_email(data), data, None
+                return
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    yield self.email or _statement_email(data), data, None
+
+
+class StatementStream:
+    """
+    Statements already in memory or produced lazily, e.g. synthetic_cas.iter_statements().
+    Items are statements, or (email, statement) pairs; email overrides both.
+    """
+
+    def __init__(self, statements: Iterable, email: Optional[str] = None):
+        self.statements = statements
+        self.email = email
+
+    def __iter__(self) -> Iterator[Tuple[str, dict, Optional[str]]]:
+        for item in self.statements:
+            item_email, data = item if isinstance(item, tuple) else (None, item)
+            yield self.email or item_email or _statement_email(data), data, None
+
+
+def _statement_email(data: dict) -> Optional[str]:
+    return (data.get("investor_info") or {}).get("email")
+
+
+# --- Stage 1: normalize ---
+
+def _is_iso_date(value) -> bool:
+    return isinstance(value, str) and len(value) == 10 and value[4] == "-" and value[7] == "-"
+
+
+def _index_transactions(transactions: list) -> Tuple[list, list]:
+    """
+    Returns a scheme's transactions in date order together with their sort keys, for bisect.
+
+    casparser writes ISO dates ("2025-03-05") in date order, so normally the keys are the
+    date strings themselves and nothing is parsed here; other layouts are parsed and sorted.
+    """
+    keys = [txn.get("date") for txn in transactions]
+    if all(_is_iso_date(k) for k in keys) and all(a <= b for a, b in zip(keys, keys[1:])):
+        return transactions, keys
+    order = sorted(range(len(transactions)), key=lambda i: parse_date(keys[i]))
+    return [transactions[i] for i in order], [parse_date(keys[i]) for i in order]
+
+
+def _transaction_row(txn: dict) -> dict:
+    return {
+        "transaction_date": parse_date(txn.get("date")),
+        "description": txn.get("description"),
+        "amount": _number(txn.get("amount")),
+        "units": _number(txn.get("units")),
+        "nav": _number(txn.get("nav")),
+        "balance": _number(txn.get("balance")),
+        "transaction_type": txn.get("type"),
+        "dividend_rate": _number(txn.get("dividend_rate")),
+    }
+
+
+def transaction_rows(scheme: dict, start: Optional[date] = None, end: Optional[date] = None) -> List[dict]:
+    """
+    Ready-to-insert rows for a normalized scheme's transactions dated start..end (inclusive;
+    None means unbounded). The range is found by binary search, so transactions outside it
+    are never converted.
+    """
+    keys = scheme["date_keys"]
+    iso = bool(keys) and isinstance(keys[0], str)
+    lo = 0 if start is None else bisect_left(keys, start.isoformat() if iso else start)
+    hi = len(keys) if end is None else bisect_right(keys, end.isoformat() if iso else end)
+    return [_transaction_row(txn) for txn in scheme["transactions"][lo:hi]]
+
+
+def normalize_statement(data: dict) -> dict:
+    """
+    Parses the statement period, scheme figures and valuations and drops entries that cannot
+    be stored. Transactions are only put in date order here; they are converted to rows
+    (transaction_rows) once the diff knows which of them are new.
+
+    Returns:
+        {"from", "to", "name", "folios": [{"folio", "amc", "pan", "schemes": [...]}]}, where each
+        scheme keeps casparser's keys, a ready-to-insert "valuation" row, and its "transactions"
+        in date order with their "date_keys".
+    """
+    sp_data = data.get("statement_period")
+    if not sp_data:
+        raise ValueError("Missing 'statement_period' in JSON data.")
+    statement = {
+        "from": parse_date(sp_data.get("from")),
+        "to": parse_date(sp_data.get("to")),
+        "name": (data.get("investor_info") or {}).get("name"),
+        "folios": [],
+    }
+    logger.debug(f"New Statement from: {statement['from']} to {statement['to']}")
+    for folio_data in data.get("folios", []):
+        folio_number = folio_data.get("folio")
+        if not folio_data.get("amc"):
+            logger.warning(f"Skipping folio {folio_number} because AMC name is missing.")
+            continue
+        schemes = []
+        for scheme_data in folio_data.get("schemes", []):
+            if not (scheme_data.get("isin") or scheme_data.get("amfi")):
+                logger.warning(f"Skipping scheme addition for folio {folio_number} due to missing both ISIN and AMFI code.")
+                continue
+            valuation_data = scheme_data.get("valuation")
+            transactions, date_keys = _index_transactions(scheme_data.get("transactions", []))
+            schemes.append(dict(
+                scheme_data,
+                open=_number(scheme_data.get("open")),
+                close=_number(scheme_data.get("close")),
+                close_calculated=_number(scheme_data.get("close_calculated")),
+                valuation={
+                    "valuation_date": parse_date(valuation_data.get("date")),
+                    "valuation_nav": _number(valuation_data.get("nav")),
+                    "valuation_value": _number(valuation_data.get("value")),
+                    "valuation_cost": _number(valuation_data.get("cost")),
+                } if valuation_data else None,
+                transactions=transactions,
+                date_keys=date_keys,
+            ))
+        statement["folios"].append({
+            "folio": folio_number, "amc": folio_data.get("amc"), "pan": folio_data.get("PAN"), "schemes": schemes,
+        })
+    return statement
+
+
+# --- Stage 2: resolve keys ---
+
+def uncovered_ranges(new_from: date, new_to: date, stored_from: date, stored_to: date) -> List[Tuple[date, date]]:
+    """The parts of new_from..new_to outside stored_from..stored_to; all bounds are inclusive."""
+    ranges = []
+    if new_from < stored_from:
+        ranges.append((new_from, min(new_to, stored_from - timedelta(days=1))))
+    if new_to > stored_to:
+        ranges.append((max(new_from, stored_to + timedelta(days=1)), new_to))
+    return ranges
+
+
+def statement_coverage(session: Session, user: User, statement: dict) -> Dict[int, dict]:
+    """
+    The user's stored statement periods and, for each, the date ranges of the statement
+    it does not cover: {period id: {"from", "to", "uncovered": [(start, end), ...]}}.
+
+    Computed once per statement, before any folio is written. Periods are never changed
+    in place (see widen_periods), so every batch of a chunked ingestion, and a resumed
+    one, diffs against the periods as they were before the statement.
+    """
+    return {
+        sp_id: {"from": sp_from, "to": sp_to,
+                "uncovered": uncovered_ranges(statement["from"], statement["to"], sp_from, sp_to)}
+        for sp_id, sp_from, sp_to in session.query(
+            StatementPeriod.id, StatementPeriod.from_date, StatementPeriod.to_date
+        ).filter(StatementPeriod.user_id == user.user_id)
+    }
+
+
+def resolve_keys(session: Session, user: User, folios: List[dict]) -> dict:
+    """
+    Looks up everything the diff needs in a fixed number of queries: the user's existing
+    folios (with their statement periods), their schemes and valuations, and the AMC ids
+    and scheme master ISINs of the statement (creating master rows that are missing).
+    """
+    numbers = [f["folio"] for f in folios]
+    existing_folios = dict(
+        session.query(Folio.folio_number, Folio.statement_period_id)
+        .filter(Folio.user_id == user.user_id, Folio.folio_number.in_(numbers))
+    )
+    existing_schemes: Dict[Tuple[str, str], int] = {}
+    valuation_ids: Dict[int, int] = {}
+    if existing_folios:
+        existing_schemes = {
+            (folio_id, name): scheme_id
+            for scheme_id, folio_id, name in session.query(Scheme.id, Scheme.folio_id, Scheme.scheme_name)
+            .filter(Scheme.folio_id.in_(list(existing_folios)))
+        }
+        if existing_schemes:
+            valuation_ids = dict(
+                session.query(Valuation.scheme_id, Valuation.id)
+                .filter(Valuation.scheme_id.in_(list(existing_schemes.values())))
+            )
+
+    amc_ids: Dict[str, int] = {}
+    isins: Dict[Tuple[str, str], Optional[str]] = {}
+    for folio in folios:
+        if folio["amc"] not in amc_ids:
+            amc_ids[folio["amc"]] = get_amc_id(session, folio["amc"])
+        for scheme in folio["schemes"]:
+            key = (folio["folio"], scheme.get("scheme"))
+            if key not in existing_schemes:
+                isins[key] = ensure_scheme_master(session, scheme)
+    return {
+        "folios": existing_folios, "schemes": existing_schemes, "valuations": valuation_ids,
+        "amc_ids": amc_ids, "isins": isins,
+    }
+
+
+# --- Stage 3: diff ---
+
+def diff_statement(user: User, statement: dict, folios: List[dict], keys: dict) -> dict:
+    """
+    Works out which rows the folios add or change, compared with what is stored.
+
+    New folios and new schemes are taken whole. For a folio that already exists, only
+    transactions in the ranges its stored statement period does not cover are added
+    (found by binary search, so an overlap costs nothing), and valuations are replaced
+    if the statement ends later than the stored period.
+    """
+    new_from, new_to = statement["from"], statement["to"]
+    coverage = statement["coverage"]
+    plan = {"folios": [], "schemes": [], "valuations": [], "valuation_updates": [], "transactions": []}
+
+    def add_scheme(folio_number: str, amc_id: int, scheme: dict) -> None:
+        isin = keys["isins"][(folio_number, scheme.get("scheme"))]
+        plan["schemes"].append(({
+            "folio_id": folio_number,
+            "amc_id": amc_id,
+            "scheme_name": scheme.get("scheme"),
+            "advisor": scheme.get("advisor"),
+            "isin": isin,
+            # Kept on the scheme only when no master row holds it.
+            "fallback_amfi_code": None if isin else scheme.get("amfi"),
+            "fallback_rta": None if isin else scheme.get("rta"),
+            "fallback_rta_code": None if isin else scheme.get("rta_code"),
+            "fallback_scheme_type": None if isin else scheme.get("type"),
+            "nominees": scheme.get("nominees"),
+            "open_units": scheme["open"],
+            "close_units": scheme["close"],
+            "close_calculated_units": scheme["close_calculated"],
+        }, scheme["valuation"], transaction_rows(scheme)))
+
+    for folio in folios:
+        folio_number = folio["folio"]
+        amc_id = keys["amc_ids"][folio["amc"]]
+        if folio_number not in keys["folios"]:
+            logger.debug(f"Adding New Folio {folio_number} for statement {new_from} to {new_to}")
+            plan["folios"].append({"folio_number": folio_number, "pan": folio["pan"],
+                                   "user_id": user.user_id, "amc_id": amc_id})
+            for scheme in folio["schemes"]:
+                add_scheme(folio_number, amc_id, scheme)
+            continue
+
+        logger.info(f"Existing Folio found {folio_number} with AMC {folio['amc']}")
+        stored = coverage.get(keys["folios"][folio_number])
+        # A folio without a stored period has nothing covered.
+        uncovered = stored["uncovered"] if stored else [(new_from, new_to)]
+        for scheme in folio["schemes"]:
+            scheme_id = keys["schemes"].get((folio_number, scheme.get("scheme")))
+            if scheme_id is None:
+                add_scheme(folio_number, amc_id, scheme)
+                continue
+            for start, end in uncovered:
+                plan["transactions"].extend(dict(row, scheme_id=scheme_id)
+                                            for row in transaction_rows(scheme, start, end))
+            if scheme["valuation"] and (stored is None or new_to > stored["to"]):
+                if scheme_id in keys["valuations"]:
+                    plan["valuation_updates"].append(dict(scheme["valuation"], id=keys["valuations"][scheme_id]))
+                else:
+                    plan["valuations"].append(dict(scheme["valuation"], scheme_id=scheme_id))
+    return plan
+
+
+# --- Stage 4: bulk write ---
+
+def _statement_period_id(session: Session, user: User, period_from: date, period_to: date) -> int:
+    sp_id = session.query(StatementPeriod.id).filter_by(from_date=period_from, to_date=period_to,
+                                                        user_id=user.user_id).scalar()
+    if sp_id:
+        logger.info("Using existing statement period")
+        return sp_id
+    sp_id = session.execute(
+        insert(StatementPeriod).returning(StatementPeriod.id),
+        {"from_date": period_from, "to_date": period_to, "user_id": user.user_id},
+    ).scalar_one()
+    logger.debug(f"Created new statement period: {sp_id} ({period_from} to {period_to})")
+    return sp_id
+
+
+def widen_periods(session: Session, user: User, statement: dict, folios: List[dict]) -> None:
+    """
+    Records that the folios now cover the statement period as well as their stored one.
+
+    Statement periods are shared by folios, and folios missing from this statement must
+    keep their old coverage. So the folios are moved to a period spanning both (reusing
+    one with those dates, e.g. the statement's own), and a period left without folios is
+    deleted. A stored period is never changed in place.
+    """
+    new_from, new_to = statement["from"], statement["to"]
+    numbers = [f["folio"] for f in folios]
+    groups: Dict[int, List[str]] = {}
+    for number, sp_id in session.query(Folio.folio_number, Folio.statement_period_id).filter(
+        Folio.user_id == user.user_id, Folio.folio_number.in_(numbers)
+    ):
+        groups.setdefault(sp_id, []).append(number)
+    periods = {
+        sp_id: (sp_from, sp_to)
+        for sp_id, sp_from, sp_to in session.query(StatementPeriod.id, StatementPeriod.from_date, StatementPeriod.to_date)
+        .filter(StatementPeriod.user_id == user.user_id)
+    }
+    by_dates = {dates: sp_id for sp_id, dates in periods.items()}
+    for sp_id, group in groups.items():
+        stored = periods.get(sp_id)
+        dates = (new_from, new_to) if stored is None else (min(stored[0], new_from), max(stored[1], new_to))
+        if dates == stored:
+            continue
+        target = by_dates.get(dates)
+        if target is None:
+            target = by_dates[dates] = _statement_period_id(session, user, *dates)
+        logger.info(f"Updating StatementPeriod for {len(group)} folio(s) from "
+                    f"{stored[0] if stored else None} - {stored[1] if stored else None} to {dates[0]} - {dates[1]}")
+        session.execute(update(Folio).where(Folio.folio_number.in_(group)).values(statement_period_id=target))
+        if sp_id is not None:
+            session.execute(delete(StatementPeriod).where(
+                StatementPeriod.id == sp_id, ~exists().where(Folio.statement_period_id == sp_id)
+            ))
+
+
+def write_plan(session: Session, user: User, statement: dict, plan: dict) -> int:
+    """
+    Applies a plan with one multi-row statement per table. Flushes, but never commits.
+    Returns the number of rows inserted or updated.
+    """
+    session.flush()
+    if plan["folios"]:
+        sp_id = _statement_period_id(session, user, statement["from"], statement["to"])
+        session.execute(insert(Folio), [dict(row, statement_period_id=sp_id) for row in plan["folios"]])
+    transactions = list(plan["transactions"])
+    valuations = list(plan["valuations"])
+    if plan["schemes"]:
+        scheme_ids = session.execute(
+            insert(Scheme).returning(Scheme.id, sort_by_parameter_order=True),
+            [scheme_row for scheme_row, _, _ in plan["schemes"]],
+        ).scalars().all()
+        for scheme_id, (_, valuation, scheme_txns) in zip(scheme_ids, plan["schemes"]):
+            if valuation:
+                valuations.append(dict(valuation, scheme_id=scheme_id))
+            transactions.extend(dict(txn, scheme_id=scheme_id) for txn in scheme_txns)
+    if valuations:
+        session.execute(insert(Valuation), valuations)
+    if plan["valuation_updates"]:
+        session.execute(update(Valuation), plan["valuation_updates"])
+    if transactions:
+        session.execute(insert(Transaction), transactions)
+    logger.debug(f"Wrote {len(plan['folios'])} folio(s), {len(plan['schemes'])} scheme(s), "
+                 f"{len(transactions)} transaction(s)")
+    return (len(plan["folios"]) + len(plan["schemes"]) + len(valuations)
+            + len(plan["valuation_updates"]) + len(transactions))
+
+
+def publish_folios(session: Session, user: User, statement: dict, folios: List[dict],
+                   timings: StageTimings) -> None:
+    """Runs the resolve, diff and write stages for some folios of a normalized statement."""
+    with timings.stage("resolve"):
+        keys = resolve_keys(session, user, folios)
+    with timings.stage("diff"):
+        plan = diff_statement(user, statement, folios, keys)
+    with timings.stage("write"):
+        rows = write_plan(session, user, statement, plan)
+        widen_periods(session, user, statement, folios)
+        if rows:
+            # Committed with the rows, so cached responses of the old data stop matching (response_cache.py).
+            session.execute(update(User).where(User.user_id == user.user_id)
+                            .values(data_version=User.data_version + 1))
+        timings.rows += rows
+
+
+def _publish_in_batches(session: Session, user: User, statement: dict, checkpoint: IngestionCheckpoint,
+                        chunk_size: int, timings: StageTimings) -> None:
+    """
+    Publishes folios from checkpoint.completed_folios on, committing every chunk_size folios
+    together with the checkpoint. If a batch fails it is replayed folio by folio, so the
+    folios before the failing one are committed; then the error is re-raised.
+    """
+    folios = statement["folios"]
+    total = len(folios)
+    if checkpoint.completed_folios:
+        logger.info(f"Skipping {checkpoint.completed_folios} folio(s) committed by an earlier attempt")
+        report_progress("commit", f"Resuming after {checkpoint.completed_folios} folio(s) committed earlier",
+                        folios_committed=checkpoint.completed_folios, folios_total=total, rows=timings.rows)
+    for batch_start in range(checkpoint.completed_folios, total, chunk_size):
+        batch = folios[batch_start:batch_start + chunk_size]
+        rows_before = timings.rows
+        savepoint = session.begin_nested()
+        try:
+            publish_folios(session, user, statement, batch, timings)
+            savepoint.commit()
+        except Exception:
+            savepoint.rollback()
+            # Cache entries staged by the rolled back batch must not be published.
+            discard_pending(session)
+            timings.rows = rows_before
+            for offset, folio in enumerate(batch):
+                rows_before = timings.rows
+                savepoint = session.begin_nested()
+                try:
+                    publish_folios(session, user, statement, [folio], timings)
+                    savepoint.commit()
+                except Exception:
+                    savepoint.rollback()
+                    discard_pending(session)
+                    timings.rows = rows_before
+                    checkpoint.completed_folios = batch_start + offset
+                    checkpoint.status = "failed"
+                    session.commit()
+                    logger.error(f"Folio {batch_start + offset + 1} of {total} failed; "
+                                 f"{checkpoint.completed_folios} folio(s) are committed and a retry resumes there")
+                    raise
+        checkpoint.completed_folios = batch_start + len(batch)
+        session.commit()
+        logger.info(f"Committed folios {batch_start + 1}-{checkpoint.completed_folios} of {total}")
+        report_progress("commit", f"Committed folios {batch_start + 1}-{checkpoint.completed_folios} of {total}",
+                        folios_committed=checkpoint.completed_folios, folios_total=total, rows=timings.rows)
+
+
+def _publish_locked(session: Session, data: dict, email: str, chunk_size: int, source_hash: Optional[str],
+                    payload_path: Optional[str], timings: StageTimings, refresh_history: bool) -> bool:
+    """Body of publish_statement, run while holding the user's ingestion lock."""
+    rows_before = timings.rows
+    in_flight = begin_in_flight(session)
+    try:
+        with timings.stage("normalize"):
+            statement = normalize_statement(data)
+        if not email:
+            raise ValueError("Investor email is missing.")
+
+        user = session.query(User).filter_by(email=email).first()
+        logger.debug(f"User fetched for {email} is {user}")
+        if not user:
+            logger.error(f"User with email {email} not found.")
+            raise ValueError("User not found.")
+        if not user.full_name:
+            user.full_name = statement["name"]
+            session.flush()
+        last_txn_id = session.query(func.max(Transaction.id)).scalar() or 0
+        total = len(statement["folios"])
+        report_progress("start", f"Storing {total} folio(s)", folios_committed=0, folios_total=total)
+        with timings.stage("resolve"):
+            statement["coverage"] = statement_coverage(session, user, statement)
+
+        if chunk_size > 0:
+            checkpoint = begin_checkpoint(session, user.user_id, source_hash or statement_hash(data),
+                                          len(statement["folios"]), last_txn_id, payload_path)
+            last_txn_id = checkpoint.start_txn_id
+            session.commit()
+            _publish_in_batches(session, user, statement, checkpoint, chunk_size, timings)
+            finish_checkpoint(checkpoint)
+        else:
+            publish_folios(session, user, statement, statement["folios"], timings)
+
+        with timings.stage("write"):
+            end_in_flight(session, in_flight)
+            session.commit()
+        if chunk_size <= 0:
+            report_progress("commit", f"Committed {total} folio(s)", folios_committed=total, folios_total=total,
+                            rows=timings.rows)
+        mark_recent_write(user.user_id, email)  # replicas may not have the statement yet
+        if refresh_history:
+            report_progress("history", "Updating portfolio history")
+            refresh_after_ingest(session, user.user_id, last_txn_id)
+        logger.info(f"Finished DB query. Stage timings: {timings.summary()}")
+        return True
+
+    except Exception as e:
+        session.rollback()
+        try:
+            end_in_flight(session, in_flight)
+            session.commit()
+        except Exception as cleanup_error:  # the marker then expires (analytics_snapshot.IN_FLIGHT_TIMEOUT)
+            logger.warning(f"Could not remove in-flight marker {in_flight}: {cleanup_error}")
+        if chunk_size <= 0:
+            timings.rows = rows_before  # nothing was committed
+        if str(e) == "User not found.":
+            logger.error("Error publishing JSON to DB, Exception: Is user registered?!", exc_info=False)
+            logger.warning("Unauthorised access to add data to db")
+        logger.exception(f"Error publishing JSON to DB, Exception: {e}")
+        # The exception text may hold SQL and parameter values; the progress stream gets none of it.
+        report_progress("error", "Could not store the statement.")
+        return False
+
+
+def publish_statement(session_factory: Callable[[], Session], data: dict, email: str, chunk_size: int = 0,
+                      source_hash: Optional[str] = None, payload_path: Optional[str] = None,
+                      timings: Optional[StageTimings] = None, refresh_history: bool = True) -> bool:
+    """
+    Merges one casparser statement into the account of the user with this email.
+
+    Args:
+        session_factory: Creates the session the ingestion runs in (a sessionmaker; it is
+            called with bind= to run on the connection holding the ingestion lock).
+        data: The statement, in casparser's JSON layout.
+        email: Email of the registered user the statement belongs to.
+        chunk_size: With chunk_size > 0 folios are committed in batches of that size and
+            progress is kept in an IngestionCheckpoint keyed by source_hash (default: a hash
+            of the statement), so a retry of the same source resumes after the last good folio.
+        source_hash: Identifies the source for checkpointing, e.g. the hash of the PDF.
+        payload_path: Saved copy of the statement, recorded on the checkpoint for retries.
+        timings: Accumulates the time spent per stage; a fresh one is used if omitted.
+        refresh_history: Update the stored portfolio history. Bulk imports turn this off and
+            call portfolio_history.refresh_after_ingest once per user at the end.
+
+    Returns:
+        True if the statement was stored, False if it failed (the error is logged).
+    """
+    timings = timings if timings is not None else StageTimings()
+    session = session_factory()
+    try:
+        # Ingestions of the same user are serialised (see ingest_lock.py), so concurrent
+        # uploads cannot both insert the same folio or transactions.
+        with user_ingest_lock(session.get_bind(), email or "") as lock_conn:
+            if lock_conn is not None:
+                # Run on the lock's connection, so waiting for a pooled connection can
+                # never hold up an ingestion that already has the lock.
+                session.close()
+                session = session_factory(bind=lock_conn)
+            try:
+                return _publish_locked(session, data, email, chunk_size, source_hash, payload_path, timings,
+                                       refresh_history)
+            finally:
+                session.close()  # before the lock is released on the same connection
+    except IngestLockTimeout as e:
+        logger.error(f"Error publishing JSON to DB, Exception: {e}")
+        report_progress("error", "Another upload for this account is still being stored.")
+        return False
+    finally:
+        session.close()
+
+
+def ingest(source: Iterable[Tuple[str, dict, Optional[str]]], session_factory: Optional[Callable] = None,
+           chunk_size: int = 0) -> dict:
+    """
+    Publishes every statement of a source.
+
+    Returns:
+        {"statements": n, "failed": n, "rows": n, "seconds": {stage: seconds}} over the whole source.
+    """
+    if session_factory is None:
+        from db import SessionLocal
+        session_factory = SessionLocal
+    timings = StageTimings()
+    report = {"statements": 0, "failed": 0, "seconds": timings.seconds}
+    items = iter(source)
+    while True:
+        with timings.stage("read"):
+            item = next(items, None)
+        if item is None:
+            break
+        email, data, source_hash = item
+        report["statements"] += 1
+        if not publish_statement(session_factory, data, email, chunk_size, source_hash, timings=timings):
+            report["failed"] += 1
+    report["rows"] = timings.rows
+    logger.info(f"Ingested {report['statements'] - report['failed']} of {report['statements']} statement(s); "
+                f"{timings.summary()}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(description="Ingest CAS statements from a PDF, a JSON file or an NDJSON file.")
+    parser.add_argument("path", help="CAS .pdf, statement .json (e.g. output.json) or .ndjson")
+    parser.add_argument("--email", help="account to ingest into (default: the statement's investor email)")
+    parser.add_argument("--password", default="", help="PDF password")
+    parser.add_argument("--chunk-size", type=int, default=0, help="folios per commit (0: one transaction)")
+    args = parser.parse_args()
+    if args.path.lower().endswith(".pdf"):
+        if not args.email:
+            parser.error("--email is required for PDFs")
+        source = CasPdfSource(args.path, args.password, args.email)
+    else:
+        source = JsonFileSource(args.path, args.email)
+    result = ingest(source, chunk_size=args.chunk_size)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["failed"] else 0)
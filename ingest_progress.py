@@ -0,0 +1,362 @@
+# File: ingest_progress.py
+"""
+Structured progress of running ingestions, streamed to the browser as Server-Sent Events.
+
+Each upload gets a ProgressChannel. The ingestion code calls report() from its worker
+thread; the channel of the job running in that thread is found through a context
+variable, so nothing has to be passed down and nothing goes through logging. A channel
+keeps at most PROGRESS_MAX_EVENTS events (older ones are dropped, and a late subscriber
+sees the gap in the ids) and publishing never waits for subscribers. Finished channels
+are kept for PROGRESS_RETENTION_SECONDS so a reconnecting client can read the outcome.
+
+With several web workers the event stream (and every reconnect) may be served by a
+worker that does not run the job, so uploads are also registered in the upload_job
+table and their events copied to upload_event by a background writer. Another worker
+streams such a job by polling those tables, and a repeated upload finds the running
+job through upload_job.running_key, which is unique. The worker running a job refreshes
+upload_job.updated_at; a job not refreshed for PROGRESS_STALE_SECONDS (its worker died)
+is marked failed, so the file can be uploaded again.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from db import SessionLocal
+from models import UploadEvent, UploadJob
+
+logger = logging.getLogger("PROGRESS")
+
+PROGRESS_MAX_EVENTS = int(os.getenv("PROGRESS_MAX_EVENTS", "200"))
+PROGRESS_MAX_JOBS = int(os.getenv("PROGRESS_MAX_JOBS", "1000"))
+PROGRESS_RETENTION_SECONDS = float(os.getenv("PROGRESS_RETENTION_SECONDS", "600"))
+PROGRESS_STALE_SECONDS = float(os.getenv("PROGRESS_STALE_SECONDS", "120"))
+HEARTBEAT_SECONDS = 15.0
+POLL_SECONDS = 1.0  # how often a stream of a job in another worker reads upload_event
+TOUCH_SECONDS = 30.0  # how often the worker running a job refreshes upload_job.updated_at
+RECONNECT_MS = 2000  # EventSource retry delay
+TERMINAL_EVENTS = ("done", "failed")
+
+
+class ProgressChannel:
+    """Bounded event buffer of one ingestion job, written by one thread and read by any number of streams."""
+
+    poll_seconds: Optional[float] = None  # None: streams wait for publish() to wake them
+
+    def __init__(self, job_id: str, max_events: int = PROGRESS_MAX_EVENTS, stored: bool = False):
+        self.job_id = job_id
+        self.stored = stored  # events are copied to upload_event for the other workers
+        self.events: deque = deque(maxlen=max_events)
+        self.last_id = 0
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, kind: str, message: str, **data) -> dict:
+        with self._lock:
+            if self.finished:
+                return {}
+            self.last_id += 1
+            event = dict(data, id=self.last_id, event=kind, message=message, time=round(time.time(), 3))
+            self.events.append(event)
+            if kind in TERMINAL_EVENTS:
+                self.finished_at = time.monotonic()
+            waiters = list(self._waiters)
+        if self.stored:
+            _writer.put(self.job_id, event, self.events.maxlen)
+        for loop, wakeup in waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:  # the stream's event loop is gone
+                pass
+        return event
+
+    def since(self, last_id: int = 0) -> List[dict]:
+        with self._lock:
+            return [event for event in self.events if event["id"] > last_id]
+
+    def messages(self) -> List[str]:
+        return [event["message"] for event in self.since()]
+
+    async def _read(self, last_id: int) -> List[dict]:
+        return self.since(last_id)
+
+    async def stream(self, last_id: int = 0, heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[Optional[dict]]:
+        """
+        Yields the events after last_id as they are published, and None every heartbeat
+        seconds without one. Ends after the terminal event.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = (loop, wakeup)
+        with self._lock:
+            self._waiters.append(waiter)
+        try:
+            last_sent = loop.time()
+            while True:
+                wakeup.clear()
+                for event in await self._read(last_id):
+                    last_id = event["id"]
+                    last_sent = loop.time()
+                    yield event
+                if self.finished and last_id >= self.last_id:
+                    return
+                try:
+                    await asyncio.wait_for(wakeup.wait(), min(heartbeat, self.poll_seconds or heartbeat))
+                except asyncio.TimeoutError:
+                    if loop.time() - last_sent >= heartbeat:
+                        last_sent = loop.time()
+                        yield None
+        finally:
+            with self._lock:
+                self._waiters.remove(waiter)
+
+
+class StoredChannel(ProgressChannel):
+    """A job running in another worker, read from upload_job and upload_event."""
+
+    poll_seconds = POLL_SECONDS
+
+    def publish(self, kind: str, message: str, **data) -> dict:
+        raise RuntimeError(f"Job {self.job_id} runs in another worker")
+
+    def since(self, last_id: int = 0) -> List[dict]:
+        with SessionLocal() as db:
+            job = db.get(UploadJob, self.job_id)
+            if job is None:  # pruned
+                self.finished_at = self.finished_at or time.monotonic()
+                return []
+            _abandon_if_stale(db, job)
+            rows = (
+                db.query(UploadEvent.payload)
+                .filter(UploadEvent.job_id == self.job_id, UploadEvent.event_id > last_id)
+                .order_by(UploadEvent.event_id)
+                .all()
+            )
+        self.last_id = job.last_event_id
+        if job.finished_at is not None and self.finished_at is None:
+            self.finished_at = time.monotonic()
+        return [json.loads(payload) for payload, in rows]
+
+    async def _read(self, last_id: int) -> List[dict]:
+        return await asyncio.to_thread(self.since, last_id)
+
+
+def _abandon_if_stale(db, job: UploadJob) -> bool:
+    """Marks an unfinished job whose worker stopped refreshing it as failed. Returns True if it did."""
+    now = datetime.utcnow()
+    if job.finished_at is not None or job.updated_at > now - timedelta(seconds=PROGRESS_STALE_SECONDS):
+        return False
+    event_id = job.last_event_id + 1
+    updated = (
+        db.query(UploadJob)
+        .filter(UploadJob.job_id == job.job_id, UploadJob.last_event_id == job.last_event_id,
+                UploadJob.finished_at.is_(None))
+        .update({"running_key": None, "finished_at": now, "last_event_id": event_id}, synchronize_session=False)
+    )
+    if updated:
+        db.add(UploadEvent(job_id=job.job_id, event_id=event_id, payload=json.dumps({
+            "id": event_id, "event": "failed", "message": "The upload was interrupted; please upload the file again.",
+            "time": round(time.time(), 3),
+        })))
+        logger.warning(f"Upload job {job.job_id} was not refreshed for {PROGRESS_STALE_SECONDS:.0f} s; marked failed")
+    db.commit()
+    db.refresh(job)
+    return True
+
+
+class _EventWriter:
+    """
+    Copies the events of this worker's stored channels to upload_event from a background
+    thread, so publish() never waits for the database, and keeps updated_at of the jobs
+    still running here fresh. Write errors are logged; the job itself is not affected.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[str, dict, int]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def put(self, job_id: str, event: dict, keep: int) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():  # also after a fork
+                self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((job_id, event, keep))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Waits until the queued events are written. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                items = [self._queue.get(timeout=TOUCH_SECONDS)]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(items)
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not store {len(items)} progress event(s): {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _write(self, items: List[Tuple[str, dict, int]]) -> None:
+        now = datetime.utcnow()
+        with _jobs_lock:
+            running = [job_id for job_id, channel in _jobs.items() if channel.stored and not channel.finished]
+        if not items and not running:
+            return
+        with SessionLocal() as db:
+            for job_id, event, keep in items:
+                db.add(UploadEvent(job_id=job_id, event_id=event["id"], payload=json.dumps(event)))
+                values = {"last_event_id": event["id"], "updated_at": now}
+                if event["event"] in TERMINAL_EVENTS:
+                    values.update(running_key=None, finished_at=now)
+                db.query(UploadJob).filter(UploadJob.job_id == job_id).update(values, synchronize_session=False)
+                db.query(UploadEvent).filter(
+                    UploadEvent.job_id == job_id, UploadEvent.event_id <= event["id"] - keep
+                ).delete(synchronize_session=False)
+            if running:
+                db.query(UploadJob).filter(UploadJob.job_id.in_(running), UploadJob.finished_at.is_(None)).update(
+                    {"updated_at": now}, synchronize_session=False)
+            db.commit()
+
+
+_writer = _EventWriter()
+_jobs: "OrderedDict[str, ProgressChannel]" = OrderedDict()  # jobs started by this worker
+_jobs_lock = threading.Lock()
+
+
+def flush_events(timeout: float = 5.0) -> bool:
+    """Writes the pending events of this worker, e.g. before it exits."""
+    return _writer.flush(timeout)
+
+
+def _prune() -> None:
+    now = time.monotonic()
+    for job_id, channel in list(_jobs.items()):
+        if channel.finished and (now - channel.finished_at > PROGRESS_RETENTION_SECONDS
+                                 or len(_jobs) > PROGRESS_MAX_JOBS):
+            del _jobs[job_id]
+
+
+def _prune_stored(db) -> None:
+    cutoff = datetime.utcnow() - timedelta(seconds=PROGRESS_RETENTION_SECONDS)
+    expired = select(UploadJob.job_id).where(UploadJob.finished_at < cutoff)
+    db.query(UploadEvent).filter(UploadEvent.job_id.in_(expired)).delete(synchronize_session=False)
+    db.query(UploadJob).filter(UploadJob.finished_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+
+
+def start_job(email: str, source_hash: str) -> Tuple[ProgressChannel, bool]:
+    """
+    Returns the channel of the unfinished upload of this file by this user, in any
+    worker, or a new one.
+
+    Returns:
+        (channel, created): created is False when the upload is already running, so a
+        client that retries gets the running job instead of a second ingestion.
+    """
+    key = f"{email}:{source_hash}"
+    with _jobs_lock:
+        _prune()
+    with SessionLocal() as db:
+        _prune_stored(db)
+        for _ in range(3):
+            job = db.query(UploadJob).filter(UploadJob.running_key == key).first()
+            if job is not None:
+                local = get_job(job.job_id)
+                if local is not None and local.finished:  # its terminal event is not written yet
+                    db.query(UploadJob).filter(UploadJob.job_id == job.job_id).update(
+                        {"running_key": None}, synchronize_session=False)
+                    db.commit()
+                    continue
+                if not _abandon_if_stale(db, job):
+                    logger.info(f"Upload already running as job {job.job_id}; not starting it again")
+                    return local or StoredChannel(job.job_id), False
+            channel = ProgressChannel(uuid.uuid4().hex, stored=True)
+            db.add(UploadJob(job_id=channel.job_id, running_key=key, last_event_id=0,
+                             updated_at=datetime.utcnow()))
+            try:
+                db.commit()
+            except IntegrityError:  # another worker registered the same upload just now
+                db.rollback()
+                continue
+            with _jobs_lock:
+                _jobs[channel.job_id] = channel
+            return channel, True
+    raise RuntimeError(f"Could not register the upload of {source_hash}")
+
+
+def get_job(job_id: str) -> Optional[ProgressChannel]:
+    """The job's channel: this worker's own, or one that reads the job of another worker."""
+    with _jobs_lock:
+        channel = _jobs.get(job_id)
+    if channel is not None:
+        return channel
+    with SessionLocal() as db:
+        if db.get(UploadJob, job_id) is None:
+            return None
+    return StoredChannel(job_id)
+
+
+_current: ContextVar[Optional[ProgressChannel]] = ContextVar("ingest_progress", default=None)
+
+
+@contextmanager
+def reporting_to(channel: ProgressChannel):
+    """Sends report() calls made in this thread (inside the block) to channel."""
+    token = _current.set(channel)
+    try:
+        yield channel
+    finally:
+        _current.reset(token)
+
+
+def report(kind: str, message: str, **data) -> None:
+    """Publishes an event to the channel of the ingestion running in this thread, if any."""
+    channel = _current.get()
+    if channel is not None:
+        channel.publish(kind, message, **data)
+
+
+def format_sse(event: Optional[dict]) -> str:
+    """One Server-Sent Events message; None becomes a comment that keeps proxies from timing out."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def sse_stream(channel: ProgressChannel, last_id: int = 0) -> AsyncIterator[str]:
+    """The channel as an event stream, resuming after last_id (the browser's Last-Event-ID)."""
+    yield f"retry: {RECONNECT_MS}\n\n"
+    async for event in channel.stream(last_id):
+        yield format_sse(event)
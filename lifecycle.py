@@ -0,0 +1,61 @@
+# File: lifecycle.py
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("LIFECYCLE")
+
+INGESTION_DRAIN_TIMEOUT = float(os.getenv("INGESTION_DRAIN_TIMEOUT", "120"))
+
+
+class InFlightTracker:
+    """
+    Counts running units of work (e.g. ingestions) so shutdown can wait for them.
+
+    Ingestions run in worker threads; if the client disconnects the request is
+    cancelled but the thread keeps going, so the server's own connection
+    draining is not enough to avoid killing a half-finished ingestion.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.active = 0
+        self.draining = False
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def track(self):
+        with self._cond:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """Runs func inside track(); meant to be the target handed to a worker thread."""
+        with self.track():
+            return func(*args, **kwargs)
+
+    def drain(self, timeout: float = INGESTION_DRAIN_TIMEOUT) -> bool:
+        """Stops new work and waits up to `timeout` seconds for running work. Returns True if idle."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.draining = True
+            if self.active:
+                logger.info(f"Waiting for {self.active} in-flight {self.name}(s) to finish")
+            while self.active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Shutdown with {self.active} {self.name}(s) still running")
+                    return False
+                self._cond.wait(remaining)
+        logger.info(f"No in-flight {self.name}s; shutdown can proceed")
+        return True
+
+
+ingestions = InFlightTracker("ingestion")
@@ -0,0 +1,187 @@
+# File: loadtest.py
+"""
+Local load generator for the main request paths.
+
+Start the app (e.g. `RATE_LIMIT=1000000 python main.py`, optionally with
+DATABASE_URL=sqlite:///./load.db), then:
+
+    python loadtest.py --seed --duration 30 --concurrency 16
+    python loadtest.py --baseline benchmarks/loadtest_baseline.json           # fail on regression
+    python loadtest.py --baseline benchmarks/loadtest_baseline.json --save-baseline
+
+--seed publishes a synthetic CAS statement for the load-test user straight into
+DATABASE_URL, so it must point at the same database as the server. The upload
+scenario needs a real CAS PDF (--pdf/--pdf-password) because /uploading parses PDFs.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger("LOADTEST")
+
+SCENARIOS = ("login", "portfolio", "upload")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def seed_database(email: str, transactions: int) -> None:
+    """Publishes a synthetic statement for email into DATABASE_URL (the user must exist)."""
+    from routes.pdf_converter import publish_to_db
+    from synthetic_cas import generate_cas
+
+    publish_to_db(generate_cas(transactions_per_scheme=transactions, email=email), email)
+
+
+def lookup_user_id(email: str) -> Optional[str]:
+    from db import SessionLocal
+    from models import User
+
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.email == email).first()
+        return user.user_id if user else None
+
+
+async def prepare_user(client: httpx.AsyncClient, args) -> Optional[str]:
+    response = await client.post("/auth/register", json={"email": args.email, "password": args.password})
+    if response.status_code == 200:
+        return response.json()["user_id"]
+    return args.user_id or lookup_user_id(args.email)
+
+
+def build_request(scenario: str, args, user_id: Optional[str], pdf: Optional[bytes]) -> dict:
+    if scenario == "login":
+        return {"method": "POST", "url": "/auth/login", "data": {"username": args.email, "password": args.password}}
+    if scenario == "portfolio":
+        return {"method": "GET", "url": f"/test/users/{user_id}/portfolio"}
+    return {
+        "method": "POST",
+        "url": "/uploading",
+        "files": {"file": (os.path.basename(args.pdf), pdf, "application/pdf")},
+        "data": {"password": args.pdf_password, "email": args.email},
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, request: dict, concurrency: int, duration: float) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def user_loop():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += 0 if ok else 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Returns a message for every scenario that is slower (p95) or has lower throughput than the baseline."""
+    regressions = []
+    for scenario, current in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {current['p95_ms']:.1f} ms vs baseline {base['p95_ms']:.1f} ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: {current['rps']:.1f} req/s vs baseline {base['rps']:.1f} req/s")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{scenario}: {current['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+
+async def main(args) -> int:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    pdf = None
+    if "upload" in scenarios:
+        if not args.pdf:
+            logger.warning("Skipping upload scenario: no --pdf given")
+            scenarios.remove("upload")
+        else:
+            with open(args.pdf, "rb") as f:
+                pdf = f.read()
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        user_id = await prepare_user(client, args)
+        if args.seed:
+            seed_database(args.email, args.transactions)
+        if "portfolio" in scenarios and not user_id:
+            logger.error("No user id for the portfolio scenario; pass --user-id")
+            return 2
+        results = {}
+        for scenario in scenarios:
+            request = build_request(scenario, args, user_id, pdf)
+            results[scenario] = await run_scenario(client, request, args.concurrency, args.duration)
+            print(f"{scenario:10s} " + "  ".join(f"{k}={v:.1f}" for k, v in results[scenario].items()))
+
+    report = {"base_url": args.base_url, "concurrency": args.concurrency, "duration": args.duration, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /auth/login, the portfolio endpoint and /uploading.")
+    parser.add_argument("--base-url", default="http://localhost:8100")
+    parser.add_argument("--scenarios", default="login,portfolio,upload", help=f"comma separated, from {SCENARIOS}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--email", default="loadtest@example.com")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--user-id", help="user id for the portfolio scenario if the user already exists")
+    parser.add_argument("--seed", action="store_true", help="publish a synthetic statement for the user first")
+    parser.add_argument("--transactions", type=int, default=24, help="transactions per scheme when seeding")
+    parser.add_argument("--pdf", help="CAS PDF for the upload scenario")
+    parser.add_argument("--pdf-password", default="")
+    parser.add_argument("--output", help="write the full report as JSON")
+    parser.add_argument("--baseline", help="baseline JSON to compare against (or write with --save-baseline)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    sys.exit(asyncio.run(main(parser.parse_args())))
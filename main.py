@@ -1,72 +1,146 @@
-from fastapi import FastAPI, Request, HTTPException, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, Request, Response, HTTPException, UploadFile, File, Form
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import time
 import os
+import threading
 from collections import defaultdict
 from starlette.middleware.base import BaseHTTPMiddleware
 from jose import JWTError, jwt
 from auth import SECRET_KEY, ALGORITHM  
 import uvicorn
-import importlib
-import pkgutil
-from routes import __name__ as routes_pkg_name
+from routes import include_routers
 from routes.pdf_converter import convertpdf, process_log_messages
+from ingest_checkpoint import file_hash
+from ingest_progress import ProgressChannel, flush_events, get_job, sse_stream, start_job
 # from routes.dash import get_user_dashboard
-from db import engine, Base
-from routes import auth, users
+from db import engine, Base, track_queries, READ_YOUR_WRITES_COOKIE, READ_YOUR_WRITES_SECONDS
 from logging_config import logger  # Import the configured logger
+from static_files import PrecompressedStaticFiles
+from page_cache import static_page_response, render_upload_result
+from lifecycle import ingestions
+from pdf_workers import close_pool
+from profiler import ProfilingMiddleware, profiling_enabled
 
 app = FastAPI(title="Full Stack FastAPI App") # for dev
 #app = FastAPI(docs_url=None, redoc_url=None)  # Disable docs in production
 logger.info("Application started")
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-# Configure Jinja2 templates
-templates = Jinja2Templates(directory="templates")
+# Mount static files (serves pre-built .br/.gz variants, see static_files.py)
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
 @app.get("/", response_class=HTMLResponse)
 def read_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    # index.html has no per-request context, so it is rendered once and served from memory.
+    return static_page_response(request, "index.html")
 
 
-#in prod the uploading function needs to move to /users and need to add user checks as per users path rule
-@app.post("/uploading", response_class=HTMLResponse)
-async def upload_file(
-    file: UploadFile = File(...),
-    password: str = Form(...),
-    email: str = Form(...)
-):
+@app.get("/upload", response_class=HTMLResponse)
+def read_upload_page(request: Request):
+    return static_page_response(request, "upload.html")
+
+
+async def save_upload(file: UploadFile) -> str:
     # Define the upload folder and ensure it exists.
     pwd = os.getcwd()
     UPLOAD_FOLDER = os.path.join(pwd, "upload")
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    
+
     file_location = os.path.join(UPLOAD_FOLDER, file.filename)
     with open(file_location, "wb") as f:
         content = await file.read()
         f.write(content)
+    return file_location
+
+
+#in prod the uploading function needs to move to /users and need to add user checks as per users path rule
+@app.post("/uploading", response_class=HTMLResponse)
+async def upload_file(
+    response: Response,
+    file: UploadFile = File(...),
+    password: str = Form(...),
+    email: str = Form(...)
+):
+    if ingestions.draining:
+        return HTMLResponse(render_upload_result([], error="Server is restarting, please retry shortly."),
+                            status_code=503, headers={"Retry-After": "30"})
+    file_location = await save_upload(file)
     # (Optionally) Process the 'password' for file encryption or validation.
     try:
         logger.info(f"Received file '{file.filename}' with provided password.")
-        temp = convertpdf(file_location,password,email)
-        response = process_log_messages (temp)
-        html_content = f"<html><body><h1>{response}</h1></body></html>"
-        return html_content
+        # Parse in a worker thread so the event loop keeps serving other requests; the thread
+        # itself is tracked so shutdown waits for it even if the client has gone away.
+        temp = await run_in_threadpool(ingestions.call, convertpdf, file_location, password, email)
+        if temp is not None and READ_YOUR_WRITES_SECONDS > 0:
+            # The next dashboard requests may go to another worker; keep them off the replicas too.
+            response.set_cookie(READ_YOUR_WRITES_COOKIE, f"{time.time() + READ_YOUR_WRITES_SECONDS:.0f}",
+                                max_age=int(READ_YOUR_WRITES_SECONDS), httponly=True, samesite="lax")
+        return process_log_messages(temp)
     except Exception as e:
         logger.info(f"Error in execution {e}")
-        response = e
-        html_content = f"<html><body><h1>{response}</h1></body></html>"
-        return html_content
-    
+        return render_upload_result([], error=str(e))
+
+
+def run_upload_job(channel: ProgressChannel, file_location: str, password: str, email: str, source_hash: str):
+    try:
+        ingestions.call(convertpdf, file_location, password, email, channel, source_hash)
+    except Exception as e:
+        logger.error(f"Upload job {channel.job_id} failed: {e}", exc_info=True)
+        channel.publish("failed", "The upload could not be processed.")
+
+
+@app.post("/uploads", status_code=202)
+async def start_upload(
+    file: UploadFile = File(...),
+    password: str = Form(...),
+    email: str = Form(...)
+):
+    """
+    Starts ingesting a CAS PDF in the background and returns the job whose progress
+    GET /uploads/{job_id}/events streams. Uploading the same file again while it is
+    still being ingested returns the running job, whichever worker runs it.
+    """
+    if ingestions.draining:
+        return JSONResponse({"detail": "Server is restarting, please retry shortly."}, status_code=503,
+                            headers={"Retry-After": "30"})
+    file_location = await save_upload(file)
+    source_hash = await run_in_threadpool(file_hash, file_location)
+    channel, created = await run_in_threadpool(start_job, email, source_hash)
+    if created:
+        logger.info(f"Received file '{file.filename}'; ingesting as job {channel.job_id}")
+        threading.Thread(target=run_upload_job, args=(channel, file_location, password, email, source_hash),
+                         name=f"upload-{channel.job_id[:8]}", daemon=True).start()
+    response = JSONResponse({"job_id": channel.job_id, "events": f"/uploads/{channel.job_id}/events",
+                             "already_running": not created}, status_code=202)
+    if READ_YOUR_WRITES_SECONDS > 0:
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, f"{time.time() + READ_YOUR_WRITES_SECONDS:.0f}",
+                            max_age=int(READ_YOUR_WRITES_SECONDS), httponly=True, samesite="lax")
+    return response
+
+
+@app.get("/uploads/{job_id}/events")
+async def upload_events(job_id: str, request: Request):
+    """Server-Sent Events with the job's progress; EventSource reconnects resume from Last-Event-ID."""
+    channel = await run_in_threadpool(get_job, job_id)
+    if channel is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    try:
+        last_id = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_id = 0
+    return StreamingResponse(sse_stream(channel, last_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+include_routers(app)
+
 
-for _, module_name, _ in pkgutil.iter_modules(['routes']):
-    module = importlib.import_module(f"routes.{module_name}")
-    if hasattr(module, "router"):  # Only add modules that define 'router'
-        app.include_router(module.router)
+@app.on_event("shutdown")
+def drain_ingestions():
+    # Runs after the server stopped accepting connections (SIGTERM); let running ingestions commit.
+    ingestions.drain()
+    flush_events()  # so other workers see how the jobs of this one ended
+    close_pool()
 
 
 class AuthLoggingMiddleware(BaseHTTPMiddleware):
@@ -97,12 +171,17 @@ class AuthLoggingMiddleware(BaseHTTPMiddleware):
 
         logger.info(f"User: {user_email} | Request: {request.method} {request.url}")
         request.state.user_email = user_email
-        response = await call_next(request)
+        with track_queries() as queries:
+            response = await call_next(request)
         process_time = time.time() - start_time
-        logger.info(f"Response: {response.status_code} | Time taken: {process_time:.4f} sec")
+        logger.info(
+            f"Response: {response.status_code} | Time taken: {process_time:.4f} sec"
+            f" | Queries: {queries.count} ({queries.duration * 1000:.1f} ms)"
+        )
+        response.headers.append("Server-Timing", f"{queries.server_timing()}, app;dur={process_time * 1000:.1f}")
         return response
 
-RATE_LIMIT = 5  
+RATE_LIMIT = int(os.getenv("RATE_LIMIT", "5"))  # raise for load tests
 TIME_WINDOW = 60  # 1 minute instead of 5 minutes
 
 request_counts = defaultdict(list)  # Safer way to handle missing keys
@@ -125,8 +204,22 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         request_counts[client_ip].append(current_time)
         return await call_next(request)
 
+if profiling_enabled():
+    # Innermost, so a profile covers only the request handler. Not installed at all otherwise.
+    app.add_middleware(ProfilingMiddleware)
 app.add_middleware(AuthLoggingMiddleware)  
 app.add_middleware(RateLimitMiddleware)  
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8100, reload=False, server_header=False) #true for dev env
+    # Single-process dev server; production runs gunicorn with gunicorn.conf.py (APP_MODE=production).
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8100,
+        reload=False,  # true for dev env
+        server_header=False,
+        workers=int(os.getenv("WEB_WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "120")),
+    )
@@ -1,5 +1,5 @@
 # File: models.py
-from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey, ARRAY, UniqueConstraint, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, ForeignKey, ARRAY, JSON, UniqueConstraint, Index, Boolean, func
 from db import Base
 from sqlalchemy.orm import relationship
 
@@ -10,6 +10,8 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     full_name = Column(String)
+    # Incremented by every ingestion that changes the user's data; part of the response cache keys.
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
     folios = relationship("Folio", back_populates="user")  # Relationship with Folio
 
 class StatementPeriod(Base):
@@ -47,6 +49,16 @@ class Folio(Base):
         UniqueConstraint('folio_number', name='uq_folio_statement_period'),
     )
 
+class SchemeMaster(Base):
+    __tablename__ = 'scheme_master'
+    isin = Column(String, primary_key=True)
+    amfi_code = Column(String, nullable=True, index=True)
+    scheme_name = Column(String, nullable=True)
+    scheme_type = Column(String, nullable=True)
+    rta = Column(String, nullable=True)
+    rta_code = Column(String, nullable=True)
+    fmv_20180131 = Column(Float, nullable=True)  # Grandfathered NAV for capital gains
+
 class Scheme(Base):
     __tablename__ = 'scheme'
     id = Column(Integer, primary_key=True, index=True)
@@ -54,23 +66,41 @@ class Scheme(Base):
     amc_id = Column(Integer, ForeignKey('amc.id'), nullable=False)
     scheme_name = Column(String)
     advisor = Column(String, nullable=True)
-    rta_code = Column(String, nullable=True)
-    rta = Column(String, nullable=True)
-    scheme_type = Column(String, nullable=True)
-    isin = Column(String, nullable=True)       # Scheme-specific ISIN
-    amfi_code = Column(String, nullable=True)    # Scheme-specific AMFI code
-    nominees = Column(ARRAY(String), nullable=True)
+    isin = Column(String, ForeignKey('scheme_master.isin'), nullable=True, index=True)  # Shared scheme metadata
+    # SQLite (tests, benchmarks) has no ARRAY type; store the list as JSON there.
+    nominees = Column(ARRAY(String).with_variant(JSON, "sqlite"), nullable=True)
     open_units = Column(Float, nullable=True)
     close_units = Column(Float, nullable=True)
     close_calculated_units = Column(Float, nullable=True)
     folio = relationship("Folio", back_populates="schemes")
     amc = relationship("AMC", back_populates="schemes")
+    # Metadata of schemes without a master row (no ISIN, and an AMFI code casparser_isin does
+    # not know). Read scheme.amfi_code etc., or scheme_metadata() in queries.
+    fallback_amfi_code = Column("amfi_code", String, nullable=True)
+    fallback_rta = Column("rta", String, nullable=True)
+    fallback_rta_code = Column("rta_code", String, nullable=True)
+    fallback_scheme_type = Column("scheme_type", String, nullable=True)
+    master = relationship("SchemeMaster")
+    amfi_code = property(lambda self: _master_or_fallback(self, "amfi_code"))
+    rta = property(lambda self: _master_or_fallback(self, "rta"))
+    rta_code = property(lambda self: _master_or_fallback(self, "rta_code"))
+    scheme_type = property(lambda self: _master_or_fallback(self, "scheme_type"))
     valuation = relationship("Valuation", back_populates="scheme", uselist=False, cascade="all, delete-orphan")
     transactions = relationship("Transaction", back_populates="scheme", cascade="all, delete-orphan")
     __table_args__ = (
         UniqueConstraint('folio_id', 'scheme_name', name='uq_scheme_folio'),
     )
 
+def _master_or_fallback(scheme: Scheme, name: str):
+    master = scheme.master
+    return getattr(master, name) if master is not None else getattr(scheme, f"fallback_{name}")
+
+
+def scheme_metadata(name: str):
+    """amfi_code, rta, rta_code or scheme_type of a scheme in a query that outer-joins SchemeMaster."""
+    return func.coalesce(getattr(SchemeMaster, name), getattr(Scheme, f"fallback_{name}")).label(name)
+
+
 class Valuation(Base):
     __tablename__ = 'valuation'
     id = Column(Integer, primary_key=True)
@@ -83,8 +113,10 @@ class Valuation(Base):
 
 class Transaction(Base):
     __tablename__ = 'transaction'
+    # On PostgreSQL the table is hash-partitioned by scheme_id (migration 6f3a8c1d2e75) and its
+    # primary key is (id, scheme_id). Filter on scheme_id so a query only touches its partitions.
     id = Column(Integer, primary_key=True)
-    scheme_id = Column(Integer, ForeignKey('scheme.id'))
+    scheme_id = Column(Integer, ForeignKey('scheme.id'), nullable=False)
     transaction_date = Column(Date, nullable=True)
     description = Column(String, nullable=True)
     amount = Column(Float, nullable=True)
@@ -94,3 +126,53 @@ class Transaction(Base):
     transaction_type = Column(String, nullable=True)
     dividend_rate = Column(Float, nullable=True)
     scheme = relationship("Scheme", back_populates="transactions")
+
+    __table_args__ = (
+        Index('ix_transaction_scheme_id_date', 'scheme_id', 'transaction_date'),
+    )
+
+class PortfolioHistory(Base):
+    __tablename__ = 'portfolio_history'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey('users.user_id'), nullable=False, index=True)
+    history_date = Column(Date, nullable=False)
+    portfolio_value = Column(Float, nullable=False)
+    invested = Column(Float, nullable=False)
+    __table_args__ = (
+        UniqueConstraint('user_id', 'history_date', name='uq_portfolio_history_user_date'),
+    )
+
+class UploadJob(Base):
+    __tablename__ = 'upload_job'
+    job_id = Column(String, primary_key=True)
+    running_key = Column(String, unique=True, nullable=True)  # "email:file hash" until the job finishes
+    last_event_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)  # refreshed by the worker running the job
+    finished_at = Column(DateTime, nullable=True)
+
+class UploadEvent(Base):
+    __tablename__ = 'upload_event'
+    job_id = Column(String, ForeignKey('upload_job.job_id'), primary_key=True)
+    event_id = Column(Integer, primary_key=True, autoincrement=False)
+    payload = Column(String, nullable=False)  # the event as JSON
+
+class IngestionInFlight(Base):
+    __tablename__ = 'ingestion_in_flight'
+    id = Column(Integer, primary_key=True)
+    start_txn_id = Column(Integer, nullable=False)  # max(transaction.id) before the ingestion inserted anything
+    started_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class IngestionCheckpoint(Base):
+    __tablename__ = 'ingestion_checkpoint'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey('users.user_id'), nullable=False, index=True)
+    source_hash = Column(String, nullable=False)  # sha256 of the uploaded file (or statement JSON)
+    status = Column(String, nullable=False, default="running")  # running / failed / completed
+    total_folios = Column(Integer, nullable=False)
+    completed_folios = Column(Integer, nullable=False, default=0)  # folios [0, n) are committed
+    start_txn_id = Column(Integer, nullable=False, default=0)  # max(transaction.id) when the job started
+    payload_path = Column(String, nullable=True)  # parsed statement kept for retries
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+    __table_args__ = (
+        UniqueConstraint('user_id', 'source_hash', name='uq_ingestion_checkpoint_source'),
+    )
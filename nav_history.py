@@ -0,0 +1,196 @@
+# File: nav_history.py
+import argparse
+import glob
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger("NAV")
+
+NAV_STORE_PATH = os.getenv("NAV_STORE_PATH", os.path.join("data", "nav_history"))
+
+# Day ordinals fit in 20 bits, so (code, day) packs into one sortable int64 key.
+DAY_BITS = 20
+COLUMNS = ("codes", "days", "navs")
+
+
+def _pack(codes: np.ndarray, days: np.ndarray) -> np.ndarray:
+    return (codes.astype(np.int64) << DAY_BITS) | days.astype(np.int64)
+
+
+def parse_amfi_nav_file(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parses an AMFI NAV text dump into (codes, days, navs) column arrays.
+
+    Both the daily NAVAll.txt layout and the historical NAV report layout are
+    accepted; columns are located from the header line. Section headings, blank
+    lines and rows with a non-numeric NAV ("N.A.") are skipped.
+
+    Args:
+        path: Path to the ';' separated dump.
+
+    Returns:
+        AMFI scheme codes, NAV dates as day ordinals and NAV values.
+    """
+    codes, days, navs = [], [], []
+    code_col = nav_col = date_col = None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            parts = line.strip().split(";")
+            if len(parts) < 4:
+                continue
+            if code_col is None:
+                header = [p.strip().lower() for p in parts]
+                if "scheme code" in header:
+                    code_col = header.index("scheme code")
+                    nav_col = header.index("net asset value")
+                    date_col = header.index("date")
+                continue
+            try:
+                code = int(parts[code_col])
+                nav = float(parts[nav_col])
+                nav_date = datetime.strptime(parts[date_col].strip(), "%d-%b-%Y").date()
+            except (ValueError, IndexError):
+                continue
+            codes.append(code)
+            days.append(nav_date.toordinal())
+            navs.append(nav)
+    if code_col is None:
+        raise ValueError(f"No AMFI header found in '{path}'.")
+    logger.info(f"Parsed {len(codes)} NAV rows from {path}")
+    return (
+        np.asarray(codes, dtype=np.int64),
+        np.asarray(days, dtype=np.int32),
+        np.asarray(navs, dtype=np.float64),
+    )
+
+
+class NavStore:
+    """
+    Column-oriented NAV history keyed by AMFI code and date.
+
+    Rows are kept sorted by (code, date) in three parallel arrays, so an as-of
+    lookup for any number of (code, date) pairs is a single searchsorted call.
+    On disk each column is a .npy file that is memory-mapped on load.
+    """
+
+    def __init__(self, codes=None, days=None, navs=None):
+        self.codes = np.asarray(codes if codes is not None else [], dtype=np.int64)
+        self.days = np.asarray(days if days is not None else [], dtype=np.int32)
+        self.navs = np.asarray(navs if navs is not None else [], dtype=np.float64)
+        self._keys = _pack(self.codes, self.days)
+
+    def __len__(self) -> int:
+        return int(self.codes.size)
+
+    @classmethod
+    def load(cls, path: str = NAV_STORE_PATH) -> "NavStore":
+        if not os.path.exists(os.path.join(path, "codes.npy")):
+            logger.info(f"No NAV history found at {path}; starting empty.")
+            return cls()
+        columns = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in COLUMNS]
+        return cls(*columns)
+
+    def save(self, path: str = NAV_STORE_PATH) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name in COLUMNS:
+            # Write to a temp file first so readers never see a half-written column.
+            tmp = os.path.join(path, f"{name}.tmp.npy")
+            np.save(tmp, getattr(self, name))
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+        logger.info(f"Saved {len(self)} NAV rows to {path}")
+
+    def merge(self, codes: np.ndarray, days: np.ndarray, navs: np.ndarray) -> "NavStore":
+        """Returns a new store with the given rows added; new rows win on duplicate (code, date)."""
+        all_codes = np.concatenate([self.codes, codes])
+        all_days = np.concatenate([self.days, days])
+        all_navs = np.concatenate([self.navs, navs])
+        keys = _pack(all_codes, all_days)
+        # Stable sort keeps input order among equal keys, so the last one is the newest.
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        keep = np.ones(keys.size, dtype=bool)
+        keep[:-1] = keys[1:] != keys[:-1]
+        order = order[keep]
+        return NavStore(all_codes[order], all_days[order], all_navs[order])
+
+    def as_of(self, codes: Sequence[int], on: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Looks up the latest NAV on or before a date for many schemes at once.
+
+        Args:
+            codes: AMFI codes.
+            on: A single date for all codes, or one date (or day ordinal) per code.
+
+        Returns:
+            (navs, nav_days): NAV values and the day ordinal they were published on;
+            NaN and -1 where the scheme has no NAV on or before the date.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        if isinstance(on, date):
+            days = np.full(codes.size, on.toordinal(), dtype=np.int64)
+        else:
+            days = np.asarray([d.toordinal() if isinstance(d, date) else d for d in on], dtype=np.int64)
+        navs = np.full(codes.size, np.nan)
+        nav_days = np.full(codes.size, -1, dtype=np.int64)
+        if not len(self):
+            return navs, nav_days
+        idx = np.searchsorted(self._keys, _pack(codes, days), side="right") - 1
+        found = idx >= 0
+        found[found] &= self.codes[idx[found]] == codes[found]
+        navs[found] = self.navs[idx[found]]
+        nav_days[found] = self.days[idx[found]]
+        return navs, nav_days
+
+
+_store: Optional[NavStore] = None
+_store_lock = threading.Lock()
+
+
+def get_nav_store() -> NavStore:
+    """Returns the process-wide NAV store, loading it from NAV_STORE_PATH on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = NavStore.load()
+    return _store
+
+
+def bulk_load(paths: Sequence[str], store_path: str = NAV_STORE_PATH) -> NavStore:
+    """Parses AMFI NAV dumps, merges them into the store on disk and refreshes the in-process copy."""
+    global _store
+    store = NavStore.load(store_path)
+    for path in paths:
+        store = store.merge(*parse_amfi_nav_file(path))
+    store.save(store_path)
+    with _store_lock:
+        _store = NavStore.load(store_path)
+    return _store
+
+
+def to_amfi_codes(values: Iterable[Optional[str]]) -> np.ndarray:
+    """Converts Scheme.amfi_code strings to ints, using -1 for missing or malformed codes."""
+    out = []
+    for value in values:
+        try:
+            out.append(int(value))
+        except (TypeError, ValueError):
+            out.append(-1)
+    return np.asarray(out, dtype=np.int64)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load AMFI NAV text dumps into the NAV history store.")
+    parser.add_argument("paths", nargs="+", help="NAV dump files or glob patterns")
+    parser.add_argument("--store", default=NAV_STORE_PATH, help="NAV store directory")
+    args = parser.parse_args()
+    files = sorted({p for pattern in args.paths for p in glob.glob(pattern)})
+    loaded = bulk_load(files, args.store)
+    print(f"NAV store at {args.store} now holds {len(loaded)} rows from {len(files)} file(s).")
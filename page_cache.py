@@ -0,0 +1,57 @@
+# File: page_cache.py
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.templating import Jinja2Templates
+
+logger = logging.getLogger("PAGES")
+
+# Templates are compiled once per process; auto_reload would re-stat the file on every render.
+templates = Jinja2Templates(directory="templates", auto_reload=False, autoescape=True)
+
+_pages: Dict[str, Tuple[bytes, str]] = {}
+_pages_lock = threading.Lock()
+
+
+def render_static_page(name: str) -> Tuple[bytes, str]:
+    """
+    Renders a template whose output does not depend on the request, once per process.
+
+    Returns:
+        The encoded HTML and its strong ETag.
+    """
+    with _pages_lock:
+        cached = _pages.get(name)
+    if cached is None:
+        body = templates.get_template(name).render().encode("utf-8")
+        cached = (body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+        with _pages_lock:
+            _pages[name] = cached
+        logger.info(f"Rendered and cached {name} ({len(body)} bytes)")
+    return cached
+
+
+def static_page_response(request: Request, name: str) -> Response:
+    """Serves a cached static-context page, answering If-None-Match with 304."""
+    body, etag = render_static_page(name)
+    headers = {"etag": etag, "cache-control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=body, headers=headers)
+
+
+def clear_page_cache() -> None:
+    with _pages_lock:
+        _pages.clear()
+
+
+def render_upload_result(messages: Optional[List[str]], error: Optional[str] = None) -> str:
+    """Renders the ingestion report shown after an upload. All values are HTML-escaped."""
+    return templates.get_template("upload_result.html").render(
+        messages=messages or [],
+        error=error,
+    )
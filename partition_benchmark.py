@@ -0,0 +1,191 @@
+# File: partition_benchmark.py
+"""
+Lookup latency of a plain versus a HASH (scheme_id)-partitioned transaction table,
+the layout of migration 6f3a8c1d2e75, at a size no test database reaches.
+
+    python partition_benchmark.py --rows 100000000 --schemes 2000000 --partitions 16
+    python partition_benchmark.py --reuse --lookups 5000      # measure again on the filled tables
+
+Needs a PostgreSQL DATABASE_URL. Everything lives in the partition_bench schema
+(--drop removes it afterwards). Both tables get the same synthetic rows and the
+same (scheme_id, transaction_date) index, then the script times:
+
+  scheme    one scheme's transactions by date (scheme detail view, ingestion diff)
+  user      deleting one user's schemes by id list, as clear_database_for_identifier
+            does; rolled back, so the tables stay the same
+
+and reports p50/p95/p99 per table, plus how many tables EXPLAIN says each query
+reads. Filling 100M rows takes a while and roughly 15 GB per table.
+
+It has not been run yet, so migration 6f3a8c1d2e75 has no measured speed-up behind it.
+"""
+import argparse
+import json
+import logging
+import random
+import time
+from typing import List
+
+from sqlalchemy import bindparam, create_engine, text
+
+from loadtest import percentile
+
+logger = logging.getLogger("PARTITION_BENCH")
+
+SCHEMA = "partition_bench"
+TABLES = ("plain", "hashed")
+FILL_CHUNK = 10_000_000
+COLUMNS = """
+    id BIGINT NOT NULL,
+    scheme_id INTEGER NOT NULL,
+    transaction_date DATE,
+    description VARCHAR,
+    amount FLOAT,
+    units FLOAT,
+    nav FLOAT,
+    balance FLOAT,
+    transaction_type VARCHAR,
+    dividend_rate FLOAT
+"""
+QUERIES = {
+    "scheme": "SELECT * FROM {table} WHERE scheme_id = :scheme_id ORDER BY transaction_date",
+    # An expanding IN list: psycopg2 sends the ids as literals, so the planner can prune.
+    "user": "DELETE FROM {table} WHERE scheme_id IN :scheme_ids",
+}
+
+
+def statement(query: str, table: str, explain: bool = False):
+    sql = QUERIES[query].format(table=f"{SCHEMA}.{table}")
+    clause = text(("EXPLAIN (FORMAT JSON) " if explain else "") + sql)
+    return clause.bindparams(bindparam("scheme_ids", expanding=True)) if query == "user" else clause
+
+
+def create_tables(conn, partitions: int) -> None:
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    conn.execute(text(f"CREATE TABLE {SCHEMA}.plain ({COLUMNS}, PRIMARY KEY (id))"))
+    conn.execute(text(f"CREATE TABLE {SCHEMA}.hashed ({COLUMNS}, PRIMARY KEY (id, scheme_id)) "
+                      f"PARTITION BY HASH (scheme_id)"))
+    for i in range(partitions):
+        conn.execute(text(f"CREATE TABLE {SCHEMA}.hashed_p{i:02d} PARTITION OF {SCHEMA}.hashed "
+                          f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"))
+    conn.commit()
+
+
+def fill(conn, table: str, rows: int, schemes: int) -> None:
+    """Inserts rows spread evenly over the schemes, then indexes and analyzes the table."""
+    for start in range(1, rows + 1, FILL_CHUNK):
+        stop = min(rows, start + FILL_CHUNK - 1)
+        conn.execute(text(
+            f"INSERT INTO {SCHEMA}.{table} "
+            f"SELECT g, 1 + g % :schemes, DATE '2000-01-01' + ((g / :schemes) % 9000)::int, 'SIP Purchase', "
+            f"1000.0, 10.0, 100.0, g * 0.01, 'PURCHASE_SIP', NULL "
+            f"FROM generate_series(CAST(:start AS BIGINT), CAST(:stop AS BIGINT)) AS g"
+        ), {"schemes": schemes, "start": start, "stop": stop})
+        conn.commit()
+        logger.info(f"{table}: {stop:,} of {rows:,} rows")
+    conn.execute(text(f"CREATE INDEX ON {SCHEMA}.{table} (scheme_id, transaction_date)"))
+    conn.execute(text(f"ANALYZE {SCHEMA}.{table}"))
+    conn.commit()
+
+
+def tables_read(conn, query: str, table: str, params: dict) -> int:
+    """Number of distinct tables (partitions) in the plan of a query."""
+    plan = conn.execute(statement(query, table, explain=True), params).scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    relations, nodes = set(), [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    conn.rollback()
+    return len(relations)
+
+
+def summarize(latencies: List[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "queries": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def measure(conn, table: str, scheme_ids: List[int], schemes_per_user: int) -> dict:
+    """Times the scheme lookups, then one rolled-back delete per user of schemes_per_user schemes."""
+    scheme_query, scheme_latencies = statement("scheme", table), []
+    for scheme_id in scheme_ids:
+        started = time.perf_counter()
+        conn.execute(scheme_query, {"scheme_id": scheme_id}).fetchall()
+        scheme_latencies.append(time.perf_counter() - started)
+    conn.rollback()
+
+    users = [scheme_ids[i:i + schemes_per_user] for i in range(0, len(scheme_ids), schemes_per_user)]
+    user_query, user_latencies = statement("user", table), []
+    for user_schemes in users:
+        started = time.perf_counter()
+        conn.execute(user_query, {"scheme_ids": user_schemes})
+        user_latencies.append(time.perf_counter() - started)
+        conn.rollback()
+
+    return {
+        "scheme": dict(summarize(scheme_latencies),
+                       tables_read=tables_read(conn, "scheme", table, {"scheme_id": scheme_ids[0]})),
+        "user": dict(summarize(user_latencies),
+                     tables_read=tables_read(conn, "user", table, {"scheme_ids": users[0]})),
+    }
+
+
+def run(database_url: str, rows: int, schemes: int, partitions: int, lookups: int, schemes_per_user: int,
+        reuse: bool, drop: bool, seed: int) -> dict:
+    engine = create_engine(database_url)
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("partition_benchmark.py needs a PostgreSQL DATABASE_URL")
+    try:
+        with engine.connect() as conn:
+            if not reuse:
+                create_tables(conn, partitions)
+                for table in TABLES:
+                    started = time.perf_counter()
+                    fill(conn, table, rows, schemes)
+                    logger.info(f"{table}: filled in {time.perf_counter() - started:.0f} s")
+            stored = conn.execute(text(  # the ANALYZE estimate; count(*) would scan 100M rows
+                f"SELECT reltuples::bigint FROM pg_class WHERE oid = '{SCHEMA}.plain'::regclass"
+            )).scalar()
+            schemes = conn.execute(text(f"SELECT max(scheme_id) FROM {SCHEMA}.plain")).scalar()
+            partitions = conn.execute(text(
+                f"SELECT count(*) FROM pg_inherits WHERE inhparent = '{SCHEMA}.hashed'::regclass"
+            )).scalar()
+            conn.rollback()
+            scheme_ids = random.Random(seed).sample(range(1, schemes + 1), min(lookups, schemes))
+            results = {table: measure(conn, table, scheme_ids, schemes_per_user) for table in TABLES}
+            if drop:
+                conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+                conn.commit()
+    finally:
+        engine.dispose()
+    return {"rows": stored, "schemes": schemes, "partitions": partitions, **results}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(description="Compare lookups on a plain and a hash-partitioned "
+                                                 "transaction table.")
+    parser.add_argument("--database-url", default=None, help="default: DATABASE_URL")
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    parser.add_argument("--schemes", type=int, default=2_000_000)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--lookups", type=int, default=2000, help="scheme lookups per table")
+    parser.add_argument("--schemes-per-user", type=int, default=20, help="schemes deleted per user")
+    parser.add_argument("--reuse", action="store_true", help="measure the tables of an earlier run")
+    parser.add_argument("--drop", action="store_true", help="drop the partition_bench schema at the end")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from logging_config import DBURL
+
+    report = run(args.database_url or DBURL, args.rows, args.schemes, args.partitions, args.lookups,
+                 args.schemes_per_user, args.reuse, args.drop, args.seed)
+    print(json.dumps(report, indent=2))
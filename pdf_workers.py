@@ -0,0 +1,323 @@
+# File: pdf_workers.py
+"""
+Parses CAS PDFs in worker subprocesses, so a malformed or huge file cannot stall or
+take down the web worker.
+
+Each web worker owns a pool of at most PDF_PARSE_WORKERS parser processes, started
+on first use with the "spawn" method (no inherited threads, locks or DB connections).
+A parser imports casparser once and then serves up to PDF_PARSE_JOBS_PER_WORKER jobs
+before it is replaced. Per job:
+
+  timeout   PDF_PARSE_TIMEOUT_SECONDS of wall time, then the parser is killed
+  CPU       PDF_PARSE_CPU_SECONDS (soft RLIMIT_CPU, raised before each job)
+  memory    PDF_PARSE_MEMORY_MB of address space (soft RLIMIT_AS; Linux does not enforce
+            an RSS limit, and a parser that hits this one is replaced)
+
+A parser that crashes, is killed or overruns a limit fails only its own job, with a
+PdfParseError. Latencies and outcomes are kept for GET /admin/pdf-workers.
+PDF_PARSE_WORKERS=0 parses in the calling thread, as before.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger("PDF_WORKERS")
+
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "2"))
+PDF_PARSE_TIMEOUT_SECONDS = float(os.getenv("PDF_PARSE_TIMEOUT_SECONDS", "120"))
+PDF_PARSE_CPU_SECONDS = int(os.getenv("PDF_PARSE_CPU_SECONDS", "120"))
+PDF_PARSE_MEMORY_MB = int(os.getenv("PDF_PARSE_MEMORY_MB", "1024"))
+PDF_PARSE_JOBS_PER_WORKER = int(os.getenv("PDF_PARSE_JOBS_PER_WORKER", "50"))
+STARTUP_TIMEOUT_SECONDS = 60.0
+LATENCY_SAMPLES = 1000
+OUTCOMES = ("ok", "failed", "timeout", "crashed")
+
+
+class PdfParseError(Exception):
+    pass
+
+
+class PdfParseTimeout(PdfParseError):
+    pass
+
+
+class PdfParseCrashed(PdfParseError):
+    pass
+
+
+# --- Parser process ----------------------------------------------------------
+
+def _cpu_seconds_used() -> float:
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _set_soft_limit(limit: int, value: int) -> None:
+    """
+    Changes only the soft limit. The hard limit stays as it was: without root (CAP_SYS_RESOURCE)
+    a lowered hard limit could not be raised for the next job.
+    """
+    import resource
+    _, hard = resource.getrlimit(limit)
+    resource.setrlimit(limit, (value if hard == resource.RLIM_INFINITY else min(value, hard), hard))
+
+
+def _limit_cpu(seconds: int) -> None:
+    """Lets the process use `seconds` more CPU time; then SIGXCPU ends it."""
+    import resource
+    _set_soft_limit(resource.RLIMIT_CPU, int(_cpu_seconds_used()) + seconds)
+
+
+def _limit_memory(megabytes: int) -> None:
+    import resource
+    _set_soft_limit(resource.RLIMIT_AS, megabytes * 1024 * 1024)
+
+
+def read_cas_pdf(path: str, password: str) -> str:
+    """The default job: casparser's JSON output for a PDF."""
+    import casparser
+    return casparser.read_cas_pdf(path, password, output="json")
+
+
+def _serve(conn, cpu_seconds: int, memory_mb: int) -> None:
+    """Main loop of a parser process: receives (func, args), sends ("ok", result) or ("error", message)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is for the server, which stops the parsers
+    try:
+        import casparser  # noqa: F401  (imported once, before the first job)
+    except ImportError:
+        pass
+    try:
+        if memory_mb > 0:
+            _limit_memory(memory_mb)
+    except (ValueError, OSError) as e:
+        logger.warning(f"PDF parser runs without a memory limit: {e}")
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        func, args = job
+        try:
+            if cpu_seconds > 0:
+                _limit_cpu(cpu_seconds)
+            conn.send(("ok", func(*args)))
+        except MemoryError:
+            conn.send(("fatal", f"ran out of memory (limit {memory_mb} MB)"))
+            return  # the heap may be fragmented or half-freed; start afresh
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class ParserProcess:
+    """One parser subprocess and the parent's end of its pipe."""
+
+    def __init__(self, context, cpu_seconds: int, memory_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn, cpu_seconds, memory_mb),
+                                       name="pdf-parser", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.spent = False  # must not get another job
+        if not self.conn.poll(STARTUP_TIMEOUT_SECONDS):
+            self.kill()
+            raise PdfParseCrashed("PDF parser did not start")
+        try:
+            self.conn.recv()
+        except EOFError:
+            self.kill()
+            raise PdfParseCrashed(f"PDF parser exited on startup ({self.process.exitcode})")
+        logger.info(f"Started PDF parser {self.process.pid}")
+
+    def run(self, func: Callable, args: tuple, timeout: float):
+        self.jobs += 1
+        self.conn.send((func, args))
+        if not self.conn.poll(timeout):
+            self.kill()
+            raise PdfParseTimeout(f"PDF parsing took longer than {timeout:.0f} s")
+        try:
+            status, value = self.conn.recv()
+        except (EOFError, OSError):
+            self.process.join(5)
+            raise PdfParseCrashed(f"PDF parser died: {self._exit_reason()}")
+        if status == "fatal":
+            self.spent = True
+        if status != "ok":
+            raise PdfParseError(value)
+        return value
+
+    def _exit_reason(self) -> str:
+        code = self.process.exitcode
+        if code is None:
+            return "no exit code"
+        if code == -signal.SIGXCPU or code == -signal.SIGKILL:
+            return f"CPU time limit or killed (signal {-code})"
+        if code < 0:
+            return f"signal {-code}"
+        return f"exit code {code}"
+
+    @property
+    def alive(self) -> bool:
+        return not self.spent and self.process.is_alive()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+# --- Pool ---------------------------------------------------------------------
+
+class ParserPool:
+    """
+    At most `size` parser processes. A caller waits for a free one, so the number of
+    PDFs parsed at the same time (and their memory) is bounded as well.
+    """
+
+    def __init__(self, size: int = PDF_PARSE_WORKERS, timeout: float = PDF_PARSE_TIMEOUT_SECONDS,
+                 cpu_seconds: int = PDF_PARSE_CPU_SECONDS, memory_mb: int = PDF_PARSE_MEMORY_MB,
+                 jobs_per_worker: int = PDF_PARSE_JOBS_PER_WORKER):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.jobs_per_worker = jobs_per_worker
+        self._context = multiprocessing.get_context("spawn")
+        # Free slots; None means "start a parser when this slot is used".
+        self._slots: "queue.LifoQueue[Optional[ParserProcess]]" = queue.LifoQueue()
+        for _ in range(size):
+            self._slots.put(None)
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+        self._counts = dict.fromkeys(OUTCOMES, 0)
+        self._started = 0
+        self._closed = False
+
+    def run(self, func: Callable, *args):
+        """Runs func(*args) in a parser process and returns its (picklable) result."""
+        parser = self._slots.get()
+        started = time.monotonic()
+        outcome = "crashed"
+        try:
+            if self._closed:
+                raise PdfParseError("PDF parser pool is closed")
+            if parser is not None and not parser.alive:
+                parser = None
+            if parser is None:
+                parser = ParserProcess(self._context, self.cpu_seconds, self.memory_mb)
+                with self._lock:
+                    self._started += 1
+            result = parser.run(func, args, self.timeout)
+            outcome = "ok"
+            return result
+        except PdfParseTimeout:
+            outcome = "timeout"
+            raise
+        except PdfParseCrashed:
+            raise
+        except PdfParseError:
+            outcome = "failed"
+            raise
+        finally:
+            self._record(outcome, time.monotonic() - started)
+            if parser is not None and outcome in ("timeout", "crashed"):
+                if parser.process.is_alive():
+                    parser.kill()
+                parser = None
+            elif parser is not None and (self._closed or not parser.alive or parser.jobs >= self.jobs_per_worker):
+                if parser.jobs >= self.jobs_per_worker:
+                    logger.info(f"Recycling PDF parser {parser.process.pid} after {parser.jobs} jobs")
+                parser.stop()
+                parser = None
+            self._slots.put(parser)
+
+    def _record(self, outcome: str, elapsed: float) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+            self._latencies.append(elapsed)
+        if outcome != "ok":
+            logger.warning(f"PDF parse {outcome} after {elapsed:.1f} s")
+
+    def stats(self) -> dict:
+        """Job outcomes, failure rate and latency percentiles (over the last LATENCY_SAMPLES jobs)."""
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = sorted(self._latencies)
+            started = self._started
+        jobs = sum(counts.values())
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(round(q * (len(latencies) - 1))))], 3)
+
+        return {
+            "jobs": jobs,
+            **counts,
+            "failure_rate": round((jobs - counts["ok"]) / jobs, 4) if jobs else None,
+            "p50_seconds": percentile(0.50),
+            "p95_seconds": percentile(0.95),
+            "p99_seconds": percentile(0.99),
+            "parsers_started": started,
+        }
+
+    def close(self) -> None:
+        """Stops the idle parsers; parsers busy with a job are stopped when it returns."""
+        self._closed = True
+        idle = []
+        while True:
+            try:
+                idle.append(self._slots.get_nowait())
+            except queue.Empty:
+                break
+        for parser in idle:
+            if parser is not None:
+                parser.stop()
+            self._slots.put(None)
+
+
+_pool: Optional[ParserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ParserPool:
+    """The pool of this (web worker) process, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParserPool()
+        return _pool
+
+
+def parse_cas_pdf(path: str, password: str) -> str:
+    """casparser's JSON output for a PDF, parsed in a parser process unless PDF_PARSE_WORKERS=0."""
+    if PDF_PARSE_WORKERS <= 0:
+        return read_cas_pdf(path, password)
+    return get_pool().run(read_cas_pdf, path, password)
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,218 @@
+# File: portfolio_export.py
+import csv
+import io
+import json
+import logging
+import os
+from typing import Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models import AMC, Folio, Scheme, SchemeMaster, StatementPeriod, Transaction, User, Valuation, scheme_metadata
+
+logger = logging.getLogger("EXPORT")
+
+# Transactions fetched per round trip (a server-side cursor on PostgreSQL) and lines per response chunk.
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+EXPORT_FORMATS = {
+    # format: (media type, file extension)
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "cas": ("application/json", "json"),
+}
+
+CSV_COLUMNS = ("folio_number", "amc", "scheme_id", "scheme_name", "isin", "amfi_code", "transaction_date",
+               "description", "amount", "units", "nav", "balance", "transaction_type", "dividend_rate")
+
+Event = Tuple[str, Optional[object]]
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def walk_portfolio(session: Session, user_id: str, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[Event]:
+    """
+    Yields a user's portfolio as ("folio" | "scheme" | "transaction", row) events in nested
+    order, with ("scheme_end", None) and ("folio_end", None) closing each level.
+
+    Folios and schemes are read up front (a user has tens of them). Transactions come from
+    one query streamed with yield_per, in the same folio/scheme order, so memory does not
+    grow with the number of transactions.
+    """
+    folios = (
+        session.query(Folio.folio_number, Folio.pan, AMC.name.label("amc"),
+                      StatementPeriod.from_date, StatementPeriod.to_date)
+        .join(AMC, Folio.amc_id == AMC.id)
+        .outerjoin(StatementPeriod, Folio.statement_period_id == StatementPeriod.id)
+        .filter(Folio.user_id == user_id)
+        .order_by(Folio.folio_number)
+        .all()
+    )
+    schemes = (
+        session.query(Scheme.id, Scheme.folio_id, Scheme.scheme_name, Scheme.advisor, Scheme.isin, Scheme.nominees,
+                      Scheme.open_units, Scheme.close_units, Scheme.close_calculated_units,
+                      scheme_metadata("amfi_code"), scheme_metadata("scheme_type"), scheme_metadata("rta"),
+                      scheme_metadata("rta_code"),
+                      Valuation.valuation_date, Valuation.valuation_nav, Valuation.valuation_cost,
+                      Valuation.valuation_value)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .outerjoin(SchemeMaster, Scheme.isin == SchemeMaster.isin)
+        .outerjoin(Valuation, Valuation.scheme_id == Scheme.id)
+        .filter(Folio.user_id == user_id)
+        .order_by(Scheme.folio_id, Scheme.id)
+        .all()
+    )
+    transactions = iter(session.execute(
+        select(Transaction.scheme_id, Transaction.transaction_date, Transaction.description, Transaction.amount,
+               Transaction.units, Transaction.nav, Transaction.balance, Transaction.transaction_type,
+               Transaction.dividend_rate)
+        .join(Scheme, Transaction.scheme_id == Scheme.id)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .where(Folio.user_id == user_id)
+        .order_by(Scheme.folio_id, Transaction.scheme_id, Transaction.transaction_date, Transaction.id)
+        .execution_options(yield_per=batch_rows)
+    ))
+    next_txn = next(transactions, None)
+    scheme_index = 0
+    for folio in folios:
+        yield "folio", folio
+        while scheme_index < len(schemes) and schemes[scheme_index].folio_id == folio.folio_number:
+            scheme = schemes[scheme_index]
+            scheme_index += 1
+            yield "scheme", scheme
+            while next_txn is not None and next_txn.scheme_id == scheme.id:
+                yield "transaction", next_txn
+                next_txn = next(transactions, None)
+            yield "scheme_end", None
+        yield "folio_end", None
+
+
+def _ndjson_lines(events: Iterable[Event]) -> Iterator[str]:
+    for kind, row in events:
+        if kind == "folio":
+            record = {"type": "folio", "folio_number": row.folio_number, "amc": row.amc, "pan": row.pan,
+                      "statement_period": {"from": _iso(row.from_date), "to": _iso(row.to_date)}}
+        elif kind == "scheme":
+            record = {"type": "scheme", "id": row.id, "folio_number": row.folio_id, "scheme_name": row.scheme_name,
+                      "isin": row.isin, "amfi_code": row.amfi_code, "advisor": row.advisor,
+                      "nominees": row.nominees, "open_units": row.open_units, "close_units": row.close_units,
+                      "close_calculated_units": row.close_calculated_units}
+            if row.valuation_date is not None or row.valuation_value is not None:
+                yield json.dumps(record) + "\n"
+                record = {"type": "valuation", "scheme_id": row.id, "date": _iso(row.valuation_date),
+                          "nav": row.valuation_nav, "cost": row.valuation_cost, "value": row.valuation_value}
+        elif kind == "transaction":
+            record = {"type": "transaction", "scheme_id": row.scheme_id, "date": _iso(row.transaction_date),
+                      "description": row.description, "amount": row.amount, "units": row.units, "nav": row.nav,
+                      "balance": row.balance, "transaction_type": row.transaction_type,
+                      "dividend_rate": row.dividend_rate}
+        else:
+            continue
+        yield json.dumps(record) + "\n"
+
+
+def _csv_lines(events: Iterable[Event]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(CSV_COLUMNS)
+    folio = scheme = None
+    for kind, row in events:
+        if kind == "folio":
+            folio = row
+        elif kind == "scheme":
+            scheme = row
+        elif kind == "transaction":
+            yield line((folio.folio_number, folio.amc, scheme.id, scheme.scheme_name, scheme.isin, scheme.amfi_code,
+                        _iso(row.transaction_date), row.description, row.amount, row.units, row.nav, row.balance,
+                        row.transaction_type, row.dividend_rate))
+
+
+def _cas_lines(events: Iterable[Event], user: User, period: Tuple) -> Iterator[str]:
+    """The portfolio as one casparser-shaped statement (see output.json), written piece by piece."""
+    period_from, period_to = period
+    head = {
+        "statement_period": {"from": period_from.strftime("%d-%b-%Y") if period_from else None,
+                             "to": period_to.strftime("%d-%b-%Y") if period_to else None},
+        "investor_info": {"name": user.full_name, "email": user.email, "address": "", "mobile": ""},
+        "cas_type": "DETAILED",
+        "file_type": "EXPORT",
+    }
+    # Everything up to the folio list, without the closing brace.
+    yield json.dumps(head)[:-1] + ', "folios": ['
+    first_folio = first_scheme = first_txn = True
+    for kind, row in events:
+        if kind == "folio":
+            folio = {"folio": row.folio_number, "amc": row.amc, "PAN": row.pan}
+            yield ("" if first_folio else ", ") + json.dumps(folio)[:-1] + ', "schemes": ['
+            first_folio, first_scheme = False, True
+        elif kind == "scheme":
+            scheme = {
+                "scheme": row.scheme_name, "advisor": row.advisor, "rta_code": row.rta_code, "rta": row.rta,
+                "type": row.scheme_type, "isin": row.isin, "amfi": row.amfi_code, "nominees": row.nominees or [],
+                "open": row.open_units, "close": row.close_units, "close_calculated": row.close_calculated_units,
+                "valuation": {"date": _iso(row.valuation_date), "nav": row.valuation_nav,
+                              "cost": row.valuation_cost, "value": row.valuation_value},
+            }
+            yield ("" if first_scheme else ", ") + json.dumps(scheme)[:-1] + ', "transactions": ['
+            first_scheme, first_txn = False, True
+        elif kind == "transaction":
+            txn = {"date": _iso(row.transaction_date), "description": row.description, "amount": row.amount,
+                   "units": row.units, "nav": row.nav, "balance": row.balance, "type": row.transaction_type,
+                   "dividend_rate": row.dividend_rate}
+            yield ("" if first_txn else ", ") + json.dumps(txn)
+            first_txn = False
+        else:  # scheme_end / folio_end
+            yield "]}"
+    yield "]}\n"
+
+
+def export_stream(bind: Engine, user_id: str, fmt: str = "ndjson",
+                  batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """
+    Streams a user's folios, schemes, valuations and transactions as NDJSON, CSV (one row per
+    transaction) or a casparser-compatible JSON statement that the ingestion pipeline reads back.
+
+    Runs in its own session, opened when the response starts streaming and closed when it ends,
+    so it does not depend on the request's session staying open. Output is sent in chunks of
+    about batch_rows lines.
+    """
+    session = Session(bind=bind)
+    try:
+        events = walk_portfolio(session, user_id, batch_rows)
+        if fmt == "csv":
+            lines = _csv_lines(events)
+        elif fmt == "cas":
+            user = session.get(User, user_id)
+            period = (
+                session.query(StatementPeriod.from_date, StatementPeriod.to_date)
+                .filter(StatementPeriod.user_id == user_id)
+                .order_by(StatementPeriod.from_date)
+                .all()
+            )
+            lines = _cas_lines(events, user, (min((p[0] for p in period), default=None),
+                                              max((p[1] for p in period), default=None)))
+        else:
+            lines = _ndjson_lines(events)
+        chunk, sent = [], 0
+        for line in lines:
+            sent += 1
+            chunk.append(line)
+            if len(chunk) >= batch_rows:
+                yield "".join(chunk).encode()
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode()
+        logger.info(f"Exported {sent} {fmt} lines for user {user_id}")
+    finally:
+        session.close()
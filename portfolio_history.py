@@ -0,0 +1,305 @@
+# File: portfolio_history.py
+import logging
+from datetime import date, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert
+from sqlalchemy.orm import Session
+
+from analytics import cashflow_amount
+from models import Folio, PortfolioHistory, Scheme, SchemeMaster, Transaction, Valuation, scheme_metadata
+from nav_history import DAY_BITS, get_nav_store, to_amfi_codes
+
+logger = logging.getLogger("HISTORY")
+
+
+def _pack(idx: np.ndarray, days: np.ndarray) -> np.ndarray:
+    return (idx.astype(np.int64) << DAY_BITS) | days.astype(np.int64)
+
+
+def _step_lookup(n_schemes, event_scheme, event_day, event_value, grid, default):
+    """
+    Evaluates per-scheme step functions on a day grid.
+
+    Events must already be ordered so that, for equal (scheme, day), the last
+    one is the end-of-day value. Returns an (n_schemes, len(grid)) array that
+    holds the latest event value on or before each grid day, or default[s].
+    """
+    out = np.repeat(np.asarray(default, dtype=np.float64)[:, None], grid.size, axis=1)
+    if not len(event_scheme):
+        return out
+    keys = _pack(np.asarray(event_scheme), np.asarray(event_day))
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = np.asarray(event_value, dtype=np.float64)[order]
+    schemes = np.asarray(event_scheme, dtype=np.int64)[order]
+    query = _pack(np.repeat(np.arange(n_schemes), grid.size), np.tile(grid, n_schemes))
+    idx = np.searchsorted(keys, query, side="right") - 1
+    hit = idx >= 0
+    hit[hit] &= schemes[idx[hit]] == np.repeat(np.arange(n_schemes), grid.size)[hit]
+    flat = out.reshape(-1)
+    flat[hit] = values[idx[hit]]
+    return out
+
+
+def compute_history(
+    start: date,
+    end: date,
+    amfi_codes: Sequence[Optional[str]],
+    opening_units: Sequence[float],
+    opening_navs: Sequence[float],
+    opening_invested: float,
+    transactions: Sequence[Tuple[int, date, Optional[float], Optional[float], Optional[float], Optional[float], Optional[str]]],
+    valuations: Sequence[Tuple[int, Optional[date], Optional[float]]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes daily portfolio value and invested amount for start..end.
+
+    Only transactions inside the window are replayed; everything before it is
+    summarised by the opening state, so extending the series costs time
+    proportional to the new tail.
+
+    Args:
+        start, end: Inclusive window.
+        amfi_codes: AMFI code per scheme (index = scheme position).
+        opening_units: Units held per scheme at the end of start - 1.
+        opening_navs: Last known NAV per scheme before start (NaN if unknown).
+        opening_invested: Net amount invested at the end of start - 1.
+        transactions: (scheme_pos, date, units, balance, nav, amount, type) rows
+            inside the window, ordered by date and id.
+        valuations: (scheme_pos, valuation_date, valuation_nav) rows.
+
+    Returns:
+        (days, portfolio_value, invested) arrays, days as day ordinals.
+    """
+    first, last = start.toordinal(), end.toordinal()
+    grid = np.arange(first, last + 1, dtype=np.int64)
+    n_schemes = len(amfi_codes)
+    invested_delta = np.zeros(grid.size)
+
+    unit_scheme, unit_day, unit_value = [], [], []
+    nav_scheme, nav_day, nav_value = [], [], []
+    running = list(opening_units)
+    for pos, txn_date, units, balance, nav, amount, txn_type in transactions:
+        if txn_date is None or not first <= txn_date.toordinal() <= last:
+            continue
+        day = txn_date.toordinal()
+        invested_delta[day - first] -= cashflow_amount(txn_type, amount)
+        if units is not None:
+            running[pos] = balance if balance is not None else running[pos] + units
+            unit_scheme.append(pos)
+            unit_day.append(day)
+            unit_value.append(running[pos])
+        if nav:
+            nav_scheme.append(pos)
+            nav_day.append(day)
+            nav_value.append(nav)
+    for pos, valuation_date, valuation_nav in valuations:
+        if valuation_date is not None and valuation_nav and first <= valuation_date.toordinal() <= last:
+            nav_scheme.append(pos)
+            nav_day.append(valuation_date.toordinal())
+            nav_value.append(valuation_nav)
+
+    units = _step_lookup(n_schemes, unit_scheme, unit_day, unit_value, grid, opening_units)
+    known_nav = _step_lookup(n_schemes, nav_scheme, nav_day, nav_value, grid, opening_navs)
+    known_day = _step_lookup(n_schemes, nav_scheme, nav_day, nav_day, grid, np.full(n_schemes, -1.0))
+
+    # Prefer the NAV history store when it has a price at least as recent as the statement's.
+    codes = to_amfi_codes(amfi_codes)
+    store_nav, store_day = get_nav_store().as_of(np.repeat(codes, grid.size), np.tile(grid, n_schemes))
+    store_nav = store_nav.reshape(n_schemes, grid.size)
+    store_day = store_day.reshape(n_schemes, grid.size)
+    nav = np.where(~np.isnan(store_nav) & (store_day >= known_day), store_nav, known_nav)
+
+    value = np.nansum(units * np.nan_to_num(nav), axis=0) if n_schemes else np.zeros(grid.size)
+    invested = opening_invested + np.cumsum(invested_delta)
+    return grid, value, invested
+
+
+def _compute_tail(db: Session, user_id: str, since: Optional[date], until: date
+                  ) -> Optional[Tuple[date, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Computes the series from the earlier of `since` and the day after the last stored
+    point up to `until`, continuing from the stored points before it. Only reads.
+
+    Returns:
+        (start, days, portfolio_value, invested), or None if there is nothing to compute.
+    """
+    last_stored = db.query(func.max(PortfolioHistory.history_date)).filter(PortfolioHistory.user_id == user_id).scalar()
+    first_txn = (
+        db.query(func.min(Transaction.transaction_date))
+        .join(Scheme, Transaction.scheme_id == Scheme.id)
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .filter(Folio.user_id == user_id)
+        .scalar()
+    )
+    if first_txn is None:
+        return None
+    start = first_txn if last_stored is None else last_stored + timedelta(days=1)
+    if since is not None:
+        start = min(start, since)
+    start = max(start, first_txn)
+    if start > until:
+        return None
+
+    schemes = (
+        db.query(Scheme.id, scheme_metadata("amfi_code"))
+        .join(Folio, Scheme.folio_id == Folio.folio_number)
+        .outerjoin(SchemeMaster, Scheme.isin == SchemeMaster.isin)
+        .filter(Folio.user_id == user_id)
+        .order_by(Scheme.id)
+        .all()
+    )
+    position = {scheme_id: i for i, (scheme_id, _) in enumerate(schemes)}
+    scheme_ids = list(position)
+
+    # Opening state: the latest unit-bearing transaction of every scheme before the window.
+    ranked = (
+        db.query(
+            Transaction.scheme_id,
+            Transaction.balance,
+            Transaction.nav,
+            func.row_number()
+            .over(partition_by=Transaction.scheme_id, order_by=(Transaction.transaction_date.desc(), Transaction.id.desc()))
+            .label("rn"),
+        )
+        .filter(
+            Transaction.scheme_id.in_(scheme_ids),
+            Transaction.transaction_date < start,
+            Transaction.units.isnot(None),
+        )
+        .subquery()
+    )
+    opening_units = np.zeros(len(schemes))
+    opening_navs = np.full(len(schemes), np.nan)
+    for scheme_id, balance, nav in db.query(ranked.c.scheme_id, ranked.c.balance, ranked.c.nav).filter(ranked.c.rn == 1):
+        opening_units[position[scheme_id]] = balance or 0.0
+        opening_navs[position[scheme_id]] = nav if nav else np.nan
+
+    opening_invested = (
+        db.query(PortfolioHistory.invested)
+        .filter(PortfolioHistory.user_id == user_id, PortfolioHistory.history_date < start)
+        .order_by(PortfolioHistory.history_date.desc())
+        .limit(1)
+        .scalar()
+    )
+    if opening_invested is None:
+        opening_invested = 0.0
+        if start > first_txn:
+            # No stored point to continue from; fold in everything before the window.
+            earlier = db.query(Transaction.amount, Transaction.transaction_type).filter(
+                Transaction.scheme_id.in_(scheme_ids), Transaction.transaction_date < start
+            )
+            opening_invested = -sum(cashflow_amount(txn_type, amount) for amount, txn_type in earlier)
+
+    transactions = [
+        (position[row[0]],) + tuple(row[1:])
+        for row in db.query(
+            Transaction.scheme_id,
+            Transaction.transaction_date,
+            Transaction.units,
+            Transaction.balance,
+            Transaction.nav,
+            Transaction.amount,
+            Transaction.transaction_type,
+        )
+        .filter(Transaction.scheme_id.in_(scheme_ids), Transaction.transaction_date >= start)
+        .order_by(Transaction.transaction_date, Transaction.id)
+    ]
+    valuations = [
+        (position[scheme_id], valuation_date, valuation_nav)
+        for scheme_id, valuation_date, valuation_nav in db.query(
+            Valuation.scheme_id, Valuation.valuation_date, Valuation.valuation_nav
+        ).filter(Valuation.scheme_id.in_(scheme_ids))
+    ]
+
+    days, values, invested = compute_history(
+        start, until, [code for _, code in schemes], opening_units, opening_navs,
+        opening_invested, transactions, valuations,
+    )
+    return start, days, values, invested
+
+
+def refresh_portfolio_history(db: Session, user_id: str, since: Optional[date] = None, until: Optional[date] = None) -> int:
+    """
+    Extends (or repairs) the stored daily series for a user.
+
+    Recomputation starts at the earlier of `since` (e.g. the oldest newly
+    ingested transaction) and the day after the last stored point; rows from
+    that day on are replaced. Returns the number of rows written.
+    """
+    until = until or date.today()
+    tail = _compute_tail(db, user_id, since, until)
+    if tail is None:
+        return 0
+    start, days, values, invested = tail
+    db.execute(
+        delete(PortfolioHistory).where(
+            PortfolioHistory.user_id == user_id, PortfolioHistory.history_date >= start
+        )
+    )
+    db.execute(
+        insert(PortfolioHistory),
+        [
+            {
+                "user_id": user_id,
+                "history_date": date.fromordinal(int(day)),
+                "portfolio_value": float(value),
+                "invested": float(inv),
+            }
+            for day, value, inv in zip(days, values, invested)
+        ],
+    )
+    db.commit()
+    logger.info(f"Portfolio history for user {user_id} refreshed from {start} to {until} ({len(days)} days)")
+    return len(days)
+
+
+def refresh_after_ingest(db: Session, user_id: str, after_txn_id: int) -> None:
+    """
+    Updates the stored series after an ingestion that inserted transactions with ids
+    above after_txn_id. Failures are logged and never fail the ingestion itself.
+    """
+    try:
+        since = (
+            db.query(func.min(Transaction.transaction_date))
+            .join(Scheme, Transaction.scheme_id == Scheme.id)
+            .join(Folio, Scheme.folio_id == Folio.folio_number)
+            .filter(Folio.user_id == user_id, Transaction.id > after_txn_id)
+            .scalar()
+        )
+        refresh_portfolio_history(db, user_id, since=since)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Portfolio history refresh failed for user {user_id}: {e}")
+
+
+def get_portfolio_history(db: Session, user_id: str, frequency: str = "daily") -> List[PortfolioHistory]:
+    """
+    Returns the stored series for a user. The days since the last stored point (the
+    series is written at ingestion) are computed on the fly and not stored, so this
+    only reads and can run on a replica. Monthly series hold the last point of every month.
+    """
+    rows = (
+        db.query(PortfolioHistory)
+        .filter(PortfolioHistory.user_id == user_id)
+        .order_by(PortfolioHistory.history_date)
+        .all()
+    )
+    tail = _compute_tail(db, user_id, None, date.today())
+    if tail is not None:
+        _, days, values, invested = tail
+        rows += [
+            PortfolioHistory(user_id=user_id, history_date=date.fromordinal(int(day)),
+                             portfolio_value=float(value), invested=float(inv))
+            for day, value, inv in zip(days, values, invested)
+        ]
+    if frequency == "monthly":
+        rows = [
+            row for i, row in enumerate(rows)
+            if i == len(rows) - 1
+            or (row.history_date.year, row.history_date.month)
+            != (rows[i + 1].history_date.year, rows[i + 1].history_date.month)
+        ]
+    return rows
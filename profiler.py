@@ -0,0 +1,148 @@
+# File: profiler.py
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+logger = logging.getLogger("PROFILER")
+
+# Profiling is off unless a token is configured; without it neither the middleware
+# nor the admin endpoints do anything, so normal requests pay nothing.
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_HEADER = "X-Profile"
+MAX_WINDOW_SECONDS = 300
+
+_session_lock = threading.Lock()  # one profiling session at a time
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILER_TOKEN)
+
+
+def token_valid(token: Optional[str]) -> bool:
+    return profiling_enabled() and token is not None and hmac.compare_digest(token, PROFILER_TOKEN)
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every other thread at a fixed interval.
+
+    Stacks are aggregated in the folded format ("thread;outer;...;inner count"),
+    which flamegraph.pl, speedscope and inferno read directly. The profiled code
+    is never instrumented, so overhead is one stack walk per thread per interval.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample_once(self, own_ident: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample_once(own_ident)
+
+    def start(self) -> "SamplingProfiler":
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self.samples
+
+    def write_folded(self, path: str) -> str:
+        """Saves the samples to path in folded format and returns it."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Profile with {sum(self.samples.values())} samples over {self.duration:.2f} s written to {path}")
+        return path
+
+
+def profile_path(label: str) -> str:
+    safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_") or "profile"
+    return os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}.folded")
+
+
+def profile_window(seconds: float, label: str = "window") -> Optional[str]:
+    """
+    Profiles the whole process for `seconds` in a background thread.
+    Returns the path the profile will be written to, or None if a session is already running.
+    """
+    if not _session_lock.acquire(blocking=False):
+        return None
+    path = profile_path(label)
+    profiler = SamplingProfiler().start()
+
+    def finish():
+        try:
+            profiler.stop()
+            profiler.write_folded(path)
+        finally:
+            _session_lock.release()
+
+    timer = threading.Timer(min(seconds, MAX_WINDOW_SECONDS), finish)
+    timer.daemon = True
+    timer.start()
+    logger.info(f"Profiling the process for {seconds} s into {path}")
+    return path
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """
+    Profiles a single request when it carries `X-Profile: <PROFILER_TOKEN>`.
+
+    The profile file name is returned in the X-Profile-File response header.
+    Other threads keep running while sampling, so concurrent requests show up
+    in the profile under their own thread names.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        if not token_valid(request.headers.get(PROFILE_HEADER)):
+            return await call_next(request)
+        if not _session_lock.acquire(blocking=False):
+            logger.info(f"Profiler busy; serving {request.url.path} unprofiled")
+            return await call_next(request)
+        try:
+            profiler = SamplingProfiler().start()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.stop()
+            path = profiler.write_folded(profile_path(f"{request.method}-{request.url.path}"))
+        finally:
+            _session_lock.release()
+        response.headers["X-Profile-File"] = os.path.basename(path)
+        return response
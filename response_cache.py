@@ -0,0 +1,194 @@
+# File: response_cache.py
+"""
+Cache of JSON responses of per-user dashboard reads.
+
+A cached body is stored under the endpoint, the resource and the owner's
+users.data_version. The ingestion increments that version in the same transaction
+as the rows it writes (ingest_pipeline.publish_folios), and clearing a user deletes
+the row, so a request that reads the version gets exactly the response the database
+would produce now: after an upload the key changes and the old entry is never
+served again, in every worker and on every replica. Stale entries simply age out.
+
+Checking the version is one primary-key query instead of the endpoint's queries.
+Responses carry an ETag of the body and If-None-Match is answered with 304.
+
+RESPONSE_CACHE_URL picks the backend: empty for a TTL/LRU dict per process, or
+redis://... for one cache shared by all workers (needs the redis package).
+RESPONSE_CACHE_TTL_SECONDS=0 disables caching; ETags still work.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from models import Folio, Scheme, User
+
+logger = logging.getLogger("RESPONSE_CACHE")
+
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+KEY_PREFIX = "mfapi:response:"
+
+
+class MemoryBackend:
+    """Entries of this process, dropped after their TTL or least recently used first."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Entries shared by all workers. A Redis error counts as a miss; the request is still served."""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_URL=redis://... needs redis: pip install redis") from e
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._errors = (redis.RedisError,)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._client.get(KEY_PREFIX + key)
+        except self._errors as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        try:
+            self._client.set(KEY_PREFIX + key, value, px=int(ttl * 1000))
+        except self._errors as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def clear(self) -> None:
+        try:
+            for key in self._client.scan_iter(KEY_PREFIX + "*"):
+                self._client.delete(key)
+        except self._errors as e:
+            logger.warning(f"Response cache clear failed: {e}")
+
+
+def backend_from_url(url: str):
+    if not url or url == "memory":
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported RESPONSE_CACHE_URL: {url}")
+
+
+backend = backend_from_url(RESPONSE_CACHE_URL)
+
+
+class CacheStats:
+    """Hits, misses and 304s per endpoint, for GET /admin/cache."""
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "not_modified": 0})
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, outcome: str) -> None:
+        with self._lock:
+            self._counts[endpoint][outcome] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            counts = {endpoint: dict(values) for endpoint, values in self._counts.items()}
+        for values in counts.values():
+            lookups = values["hits"] + values["misses"]
+            values["hit_ratio"] = round(values["hits"] / lookups, 4) if lookups else None
+        return counts
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+
+
+def user_data_version(db: Session, user_id: str) -> Optional[int]:
+    """The user's data version, or None if the user does not exist."""
+    return db.query(User.data_version).filter(User.user_id == user_id).scalar()
+
+
+def scheme_data_version(db: Session, scheme_id: int) -> Optional[int]:
+    """Data version of the user owning a scheme, or None for an unknown or unowned scheme."""
+    return (
+        db.query(User.data_version)
+        .join(Folio, Folio.user_id == User.user_id)
+        .join(Scheme, Scheme.folio_id == Folio.folio_number)
+        .filter(Scheme.id == scheme_id)
+        .scalar()
+    )
+
+
+def _etag(body: bytes) -> bytes:
+    return b'"' + hashlib.sha256(body).hexdigest()[:32].encode() + b'"'
+
+
+def cached_json(request: Request, endpoint: str, resource: str, version: Optional[int],
+                build: Callable[[], BaseModel]) -> Response:
+    """
+    Returns the endpoint's JSON response for a resource, from the cache when possible.
+
+    Args:
+        request: The request, for If-None-Match.
+        endpoint: Name of the endpoint, used in the key and the stats.
+        resource: The user or scheme id.
+        version: The owner's data version, read in the request's session; None skips the cache.
+        build: Produces the response model on a miss (and raises HTTPException as usual).
+
+    Returns:
+        A JSON response with an ETag, or 304 if the client's copy is current.
+    """
+    key = f"{endpoint}:{resource}:{version}"
+    cached = backend.get(key) if version is not None and RESPONSE_CACHE_TTL_SECONDS > 0 else None
+    if cached is not None:
+        etag, body = cached.split(b"\n", 1)
+        outcome = "hits"
+    else:
+        body = build().model_dump_json().encode("utf-8")
+        etag = _etag(body)
+        if version is not None and RESPONSE_CACHE_TTL_SECONDS > 0:
+            backend.set(key, etag + b"\n" + body, RESPONSE_CACHE_TTL_SECONDS)
+        outcome = "misses"
+    stats.record(endpoint, outcome)
+    headers = {"etag": etag.decode(), "cache-control": "private, no-cache"}
+    if headers["etag"] in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        stats.record(endpoint, "not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,19 @@
+# File: routes/__init__.py
+import importlib
+
+from fastapi import FastAPI
+
+# Modules that define an APIRouter named `router`, in registration order.
+# Listed explicitly so startup does not scan the package or import helper modules twice.
+ROUTER_MODULES = (
+    "routes.auth",
+    "routes.dash",
+    "routes.users",
+    "routes.admin",
+)
+
+
+def include_routers(app: FastAPI) -> None:
+    for module_name in ROUTER_MODULES:
+        module = importlib.import_module(module_name)
+        app.include_router(module.router)
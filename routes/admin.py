@@ -0,0 +1,45 @@
+# File: routes/admin.py
+import logging
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from pdf_workers import get_pool
+from profiler import MAX_WINDOW_SECONDS, profile_window, token_valid
+from response_cache import stats as response_cache_stats
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+logger = logging.getLogger("ADMIN")
+
+
+@router.post("/profile")
+def start_profile(
+    seconds: float = Query(30, gt=0, le=MAX_WINDOW_SECONDS),
+    x_profiler_token: Optional[str] = Header(None),
+):
+    """Samples the whole worker process for a time window; the profile is saved under PROFILE_DIR."""
+    # Answer like an unknown route unless profiling is enabled and the token matches.
+    # (A separate header from X-Profile, which would profile this request itself.)
+    if not token_valid(x_profiler_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    path = profile_window(seconds)
+    if path is None:
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    return {"profile_file": os.path.basename(path), "seconds": seconds}
+
+
+@router.get("/cache")
+def cache_stats(x_profiler_token: Optional[str] = Header(None)):
+    """Hits, misses, hit ratio and 304s of the response cache in this worker, per endpoint."""
+    if not token_valid(x_profiler_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response_cache_stats.snapshot()
+
+
+@router.get("/pdf-workers")
+def pdf_worker_stats(x_profiler_token: Optional[str] = Header(None)):
+    """Outcomes, failure rate and latency percentiles of PDF parsing in this worker."""
+    if not token_valid(x_profiler_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return get_pool().stats()
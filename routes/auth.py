@@ -1,5 +1,5 @@
 # File: routes/auth.py
-from venv import logger
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
@@ -10,6 +10,7 @@ from schemas import Token, UserOut, UserCreate
 from auth import verify_password, get_password_hash, create_access_token, generate_userid
 
 router = APIRouter(prefix="/auth", tags=["Authentication"]) 
+logger = logging.getLogger("AUTH")
 
 @router.post("/register", response_model=UserOut)
 def register(user: UserCreate, db: Session = Depends(get_db)):
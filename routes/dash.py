@@ -1,16 +1,21 @@
 import logging
-from pytest import Session
-from sqlalchemy.orm import joinedload, subqueryload
+from sqlalchemy.orm import Session, joinedload, subqueryload
 from sqlalchemy.exc import SQLAlchemyError
-from fastapi import HTTPException, Depends, APIRouter
+from fastapi import HTTPException, Depends, APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
 from models import User, Folio, Scheme, Transaction, Valuation
 from db import SessionLocal
 from routes.pdf_converter import clear_database_for_identifier
 import os
 from dotenv import load_dotenv
-from db import get_db
-from schemas import UserOut, SchemeOut, PortfolioOut, FolioOut, AMCOut, SchemeDetailsOut, TransactionOut
-import pandas as pd
+from db import get_db, get_read_db
+from schemas import UserOut, SchemeOut, PortfolioOut, FolioOut, AMCOut, SchemeDetailsOut, TransactionOut, XirrReportOut, PortfolioHistoryOut, PortfolioPointOut, CapitalGainsOut
+from analytics import get_user_xirr
+from capital_gains import get_user_capital_gains
+from portfolio_history import get_portfolio_history
+from portfolio_export import EXPORT_FORMATS, export_stream
+from response_cache import cached_json, scheme_data_version, user_data_version
+from typing import Literal
 
 load_dotenv()
 
@@ -21,7 +26,13 @@ logger = logging.getLogger("DASH")
 
 # API Endpoints
 @router.get("/users/{user_id}/portfolio", response_model=PortfolioOut)
-def get_portfolio(user_id: str, db: Session = Depends(get_db)):
+def get_portfolio(user_id: str, request: Request, db: Session = Depends(get_read_db)):
+    """Cached until the user's next upload changes their data (see response_cache.py)."""
+    return cached_json(request, "portfolio", user_id, user_data_version(db, user_id),
+                       lambda: build_portfolio(db, user_id))
+
+
+def build_portfolio(db: Session, user_id: str) -> PortfolioOut:
     user = db.query(User).filter(User.user_id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -68,8 +79,59 @@ def get_portfolio(user_id: str, db: Session = Depends(get_db)):
         total_gain_loss_percent=total_gain_loss_percent,
     )
 
+@router.get("/users/{user_id}/portfolio/history", response_model=PortfolioHistoryOut)
+def get_history(user_id: str, frequency: Literal["daily", "monthly"] = "daily", db: Session = Depends(get_read_db)):
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    rows = get_portfolio_history(db, user_id, frequency)
+    return PortfolioHistoryOut(
+        user_id=user_id,
+        frequency=frequency,
+        points=[PortfolioPointOut.model_validate(row) for row in rows],
+    )
+
+@router.get("/users/{user_id}/xirr", response_model=XirrReportOut)
+def get_xirr(user_id: str, request: Request, db: Session = Depends(get_read_db)):
+    """Cached until the user's next upload changes their data (see response_cache.py)."""
+    return cached_json(request, "xirr", user_id, user_data_version(db, user_id), lambda: build_xirr(db, user_id))
+
+
+def build_xirr(db: Session, user_id: str) -> XirrReportOut:
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return XirrReportOut(**get_user_xirr(db, user_id))
+
+@router.get("/users/{user_id}/capital-gains", response_model=CapitalGainsOut)
+def get_capital_gains(user_id: str, db: Session = Depends(get_read_db)):
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return CapitalGainsOut(**get_user_capital_gains(db, user_id))
+
+@router.get("/users/{user_id}/export")
+def export_portfolio(user_id: str, fmt: Literal["ndjson", "csv", "cas"] = Query("ndjson", alias="format"),
+                     db: Session = Depends(get_read_db)):
+    """Streams the user's whole portfolio; memory use does not depend on the number of transactions."""
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    media_type, extension = EXPORT_FORMATS[fmt]
+    return StreamingResponse(
+        export_stream(db.get_bind(), user_id, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="portfolio-{user_id}.{extension}"'},
+    )
+
 @router.get("/schemes/{scheme_id}", response_model=SchemeDetailsOut)
-def get_scheme_details(scheme_id: int, db: Session = Depends(get_db)):
+def get_scheme_details(scheme_id: int, request: Request, db: Session = Depends(get_read_db)):
+    """Cached until the owner's next upload changes their data (see response_cache.py)."""
+    return cached_json(request, "scheme", str(scheme_id), scheme_data_version(db, scheme_id),
+                       lambda: build_scheme_details(db, scheme_id))
+
+
+def build_scheme_details(db: Session, scheme_id: int) -> SchemeDetailsOut:
     scheme = db.query(Scheme).filter(Scheme.id == scheme_id).first()
     if not scheme:
         raise HTTPException(status_code=404, detail="Scheme not found")
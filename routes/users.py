@@ -6,7 +6,7 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 import logging
 import os
-from db import get_db
+from db import get_read_db
 from models import User, Folio
 from schemas import UserOut
 from auth import SECRET_KEY, ALGORITHM
@@ -16,7 +16,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 logger_module = logging.getLogger(__name__)
 
-def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)) -> User:
     # If middleware already set the user email, use it.
     if hasattr(request.state, "user_email") and request.state.user_email != "Anonymous":
         email = request.state.user_email
@@ -85,4 +85,53 @@ class DashboardOut(BaseModel):
     portfolio_value: float = Field(..., description="Total portfolio value")
     total_investment: float = Field(..., description="Total investment cost")
     total_gain_loss: float = Field(..., description="Total gain or loss")
-    total_gain_loss_percent: float = Field(..., description="Total gain or loss percent")
\ No newline at end of file
+    total_gain_loss_percent: float = Field(..., description="Total gain or loss percent")
+class XirrOut(BaseModel):
+    id: Optional[int] = None
+    name: str
+    invested: float = 0.0
+    current_value: float = 0.0
+    xirr_percent: Optional[float] = None
+    cagr_percent: Optional[float] = None
+
+class XirrReportOut(BaseModel):
+    portfolio: XirrOut
+    amcs: List[XirrOut]
+    schemes: List[XirrOut]
+
+class PortfolioPointOut(BaseModel):
+    history_date: date
+    portfolio_value: float = 0.0
+    invested: float = 0.0
+
+    model_config = {'from_attributes': True}
+
+class PortfolioHistoryOut(BaseModel):
+    user_id: str
+    frequency: str
+    points: List[PortfolioPointOut]
+
+class GainsYearOut(BaseModel):
+    financial_year: str
+    stcg: float = 0.0
+    ltcg: float = 0.0
+    equity_stcg: float = 0.0
+    equity_ltcg: float = 0.0
+    sale_value: float = 0.0
+    cost: float = 0.0
+
+class SchemeGainsOut(BaseModel):
+    scheme_id: int
+    scheme_name: Optional[str] = None
+    financial_year: str
+    stcg: float = 0.0
+    ltcg: float = 0.0
+
+class UnmatchedUnitsOut(BaseModel):
+    scheme_id: int
+    units: float
+
+class CapitalGainsOut(BaseModel):
+    financial_years: List[GainsYearOut]
+    schemes: List[SchemeGainsOut]
+    unmatched: List[UnmatchedUnitsOut]
@@ -0,0 +1,197 @@
+# File: scheme_master.py
+import logging
+import sqlite3
+import threading
+from typing import Dict, Optional, Set
+
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import AMC, SchemeMaster
+
+logger = logging.getLogger("MASTER")
+
+# In-process caches shared by every ingestion. Rows created inside a transaction
+# are staged per session and only published here once that session commits.
+_amc_ids: Dict[str, int] = {}
+_known_isins: Set[str] = set()
+_cache_lock = threading.Lock()
+PENDING_KEY = "scheme_master_pending"
+
+
+def _pending(session: Session) -> dict:
+    return session.info.setdefault(PENDING_KEY, {"amcs": {}, "isins": set()})
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        with _cache_lock:
+            _amc_ids.update(pending["amcs"])
+            _known_isins.update(pending["isins"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    discard_pending(session)
+
+
+def discard_pending(session: Session) -> None:
+    """Drops cache entries staged by the session, e.g. after rolling back a savepoint."""
+    session.info.pop(PENDING_KEY, None)
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _amc_ids.clear()
+        _known_isins.clear()
+
+
+def _isin_db_row(isin: Optional[str], amfi_code: Optional[str]) -> Optional[dict]:
+    """Looks a scheme up in the casparser_isin database bundled with casparser."""
+    try:
+        from casparser_isin.utils import get_isin_db_path
+    except ImportError:
+        return None
+    with sqlite3.connect(get_isin_db_path()) as conn:
+        conn.row_factory = sqlite3.Row
+        if isin:
+            row = conn.execute(
+                "SELECT s.name, s.isin, s.amfi_code, s.type, s.rta, s.rta_code, n.nav AS fmv "
+                "FROM scheme s LEFT JOIN nav20180131 n ON n.isin = s.isin "
+                "WHERE s.isin = ? ORDER BY s.id DESC LIMIT 1",
+                (isin,),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT s.name, s.isin, s.amfi_code, s.type, s.rta, s.rta_code, n.nav AS fmv "
+                "FROM scheme s LEFT JOIN nav20180131 n ON n.isin = s.isin "
+                "WHERE s.amfi_code = ? ORDER BY s.id DESC LIMIT 1",
+                (amfi_code,),
+            ).fetchone()
+    return dict(row) if row else None
+
+
+def get_amc_id(session: Session, name: str) -> int:
+    """Returns the id of the AMC with this name, creating it if needed, without a query on cache hits."""
+    with _cache_lock:
+        amc_id = _amc_ids.get(name)
+    if amc_id is None:
+        amc_id = _pending(session)["amcs"].get(name)
+    if amc_id is not None:
+        return amc_id
+
+    amc_obj = session.query(AMC).filter_by(name=name).first()
+    if amc_obj:
+        with _cache_lock:
+            _amc_ids[name] = amc_obj.id
+        return amc_obj.id
+    try:
+        # Ingestions of different users run in parallel and may create the same AMC.
+        with session.begin_nested():
+            amc_obj = AMC(name=name)
+            session.add(amc_obj)
+            session.flush()  # Assigns id to amc_obj
+    except IntegrityError:
+        amc_obj = session.query(AMC).filter_by(name=name).one()
+        with _cache_lock:
+            _amc_ids[name] = amc_obj.id
+        return amc_obj.id
+    _pending(session)["amcs"][name] = amc_obj.id
+    return amc_obj.id
+
+
+def ensure_scheme_master(session: Session, scheme_data: dict) -> Optional[str]:
+    """
+    Makes sure a master row exists for the scheme in a CAS scheme entry and returns its ISIN.
+
+    The bundled casparser_isin database is the source of truth; the CAS entry is
+    only used for schemes it does not know. Returns None if no ISIN can be found.
+    """
+    isin = scheme_data.get("isin")
+    with _cache_lock:
+        if isin and isin in _known_isins:
+            return isin
+    if isin and isin in _pending(session)["isins"]:
+        return isin
+    if isin and session.get(SchemeMaster, isin) is not None:
+        with _cache_lock:
+            _known_isins.add(isin)
+        return isin
+
+    row = _isin_db_row(isin, scheme_data.get("amfi"))
+    if row is None and not isin:
+        logger.warning(f"No ISIN found for scheme {scheme_data.get('scheme')}; storing it without master data.")
+        return None
+    if row is not None and not isin:
+        isin = row["isin"]
+        if session.get(SchemeMaster, isin) is not None:
+            _pending(session)["isins"].add(isin)
+            return isin
+
+    row = row or {}
+    try:
+        # Another user's ingestion may insert the same scheme concurrently; theirs is as good as ours.
+        with session.begin_nested():
+            session.add(SchemeMaster(
+                isin=isin,
+                amfi_code=row.get("amfi_code") or scheme_data.get("amfi"),
+                scheme_name=row.get("name") or scheme_data.get("scheme"),
+                scheme_type=row.get("type") or scheme_data.get("type"),
+                rta=row.get("rta") or scheme_data.get("rta"),
+                rta_code=row.get("rta_code") or scheme_data.get("rta_code"),
+                fmv_20180131=float(row["fmv"]) if row.get("fmv") else None,
+            ))
+            session.flush()
+    except IntegrityError:
+        with _cache_lock:
+            _known_isins.add(isin)
+        return isin
+    _pending(session)["isins"].add(isin)
+    return isin
+
+
+def load_scheme_master(session: Session) -> int:
+    """Bulk loads every scheme of the bundled casparser_isin database that is not yet in the master table."""
+    from casparser_isin.utils import get_isin_db_path
+
+    existing = {isin for (isin,) in session.query(SchemeMaster.isin)}
+    rows = {}
+    with sqlite3.connect(get_isin_db_path()) as conn:
+        # Ordered by id so the newest entry for an ISIN wins, as in casparser_isin's own lookups.
+        for name, isin, amfi_code, scheme_type, rta, rta_code, fmv in conn.execute(
+            "SELECT s.name, s.isin, s.amfi_code, s.type, s.rta, s.rta_code, n.nav "
+            "FROM scheme s LEFT JOIN nav20180131 n ON n.isin = s.isin "
+            "WHERE s.isin IS NOT NULL ORDER BY s.id"
+        ):
+            if isin in existing:
+                continue
+            rows[isin] = {
+                "isin": isin,
+                "amfi_code": amfi_code,
+                "scheme_name": name,
+                "scheme_type": scheme_type,
+                "rta": rta,
+                "rta_code": rta_code,
+                "fmv_20180131": float(fmv) if fmv else None,
+            }
+    if rows:
+        session.execute(insert(SchemeMaster), list(rows.values()))
+    session.commit()
+    with _cache_lock:
+        _known_isins.update(existing)
+        _known_isins.update(rows)
+    logger.info(f"Scheme master loaded: {len(rows)} new, {len(existing)} existing")
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Loaded {load_scheme_master(db)} schemes into scheme_master.")
+    finally:
+        db.close()
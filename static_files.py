@@ -0,0 +1,167 @@
+# File: static_files.py
+import argparse
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import threading
+from typing import Dict, List, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip variants are always built.
+    brotli = None
+
+logger = logging.getLogger("STATIC")
+
+# Vite-style content hashes, e.g. index-BUcxxRSq.js
+FINGERPRINT_RE = re.compile(r"-(?=[A-Za-z0-9_]*[A-Z0-9])[A-Za-z0-9_]{8}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+# Served encodings in order of preference, with the suffix of the pre-built file.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_SUFFIXES = (".js", ".css", ".html", ".svg", ".json", ".map", ".txt")
+MIN_COMPRESS_SIZE = 1024
+
+_etags: Dict[Tuple[str, float, int], str] = {}
+_etags_lock = threading.Lock()
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Returns the content codings from an Accept-Encoding header that are not refused with q=0."""
+    accepted = []
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.append(token)
+    return accepted
+
+
+def content_etag(full_path: str, stat_result: os.stat_result) -> str:
+    """Strong ETag from the file content, hashed once per (path, mtime, size)."""
+    key = (full_path, stat_result.st_mtime, stat_result.st_size)
+    with _etags_lock:
+        etag = _etags.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(full_path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        etag = digest.hexdigest()[:32]
+        with _etags_lock:
+            _etags[key] = etag
+    return etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves pre-built .br/.gz siblings when the client accepts them.
+
+    Fingerprinted (content-hashed) file names are cached for a year as immutable;
+    everything else must be revalidated. Every representation gets its own strong
+    ETag and If-None-Match is answered with 304.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        base_etag = content_etag(full_path, stat_result)
+        headers = {
+            "vary": "Accept-Encoding",
+            "cache-control": IMMUTABLE_CACHE if FINGERPRINT_RE.search(full_path) else REVALIDATE_CACHE,
+        }
+
+        serve_path, serve_stat, etag = full_path, stat_result, f'"{base_etag}"'
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            # Ignore variants older than the source; they were built from a previous version.
+            if variant_stat.st_mtime < stat_result.st_mtime:
+                continue
+            serve_path, serve_stat = full_path + suffix, variant_stat
+            etag = f'"{base_etag}-{encoding}"'
+            headers["content-encoding"] = encoding
+            break
+        headers["etag"] = etag
+
+        if etag_matches(request_headers.get("if-none-match", ""), etag):
+            return NotModifiedResponse(Headers(headers))
+        return FileResponse(
+            serve_path,
+            status_code=status_code,
+            stat_result=serve_stat,
+            method=scope["method"],
+            media_type=media_type,
+            headers=headers,
+        )
+
+
+def precompress_directory(directory: str) -> int:
+    """
+    Writes .gz (and .br when the brotli package is installed) next to every compressible file.
+    Up-to-date variants are left alone. Returns the number of files written.
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            source = os.path.join(root, name)
+            source_stat = os.stat(source)
+            if source_stat.st_size < MIN_COMPRESS_SIZE:
+                continue
+            with open(source, "rb") as f:
+                data = f.read()
+            variants = [(".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append((".br", lambda raw: brotli.compress(raw, quality=11)))
+            for suffix, compress in variants:
+                target = source + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime >= source_stat.st_mtime:
+                    continue
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    continue
+                tmp = target + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(compressed)
+                shutil.copystat(source, tmp)
+                os.replace(tmp, target)
+                written += 1
+                logger.info(f"{target}: {len(data)} -> {len(compressed)} bytes")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-compress static assets with gzip and brotli.")
+    parser.add_argument("directory", nargs="?", default="static")
+    args = parser.parse_args()
+    print(f"Wrote {precompress_directory(args.directory)} compressed file(s) in {args.directory}.")
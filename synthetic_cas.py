@@ -0,0 +1,393 @@
+# File: synthetic_cas.py
+import argparse
+import json
+import logging
+import os
+import random
+import uuid
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("SYNTHETIC")
+
+AMCS = (
+    "Aditya Birla Sun Life Mutual Fund",
+    "Axis Mutual Fund",
+    "HDFC Mutual Fund",
+    "ICICI Prudential Mutual Fund",
+    "Kotak Mahindra Mutual Fund",
+    "Mirae Asset Mutual Fund",
+    "Nippon India Mutual Fund",
+    "SBI Mutual Fund",
+)
+SCHEME_KINDS = (("Flexi Cap Fund", "EQUITY"), ("Large Cap Fund", "EQUITY"), ("Short Duration Fund", "DEBT"),
+                ("Liquid Fund", "DEBT"), ("ELSS Tax Saver Fund", "EQUITY"), ("Balanced Advantage Fund", "EQUITY"))
+# Schemes are drawn from a shared universe so that users hold the same schemes, as in real data.
+SCHEMES_PER_AMC = 250
+CAS_DATE = "%d-%b-%Y"
+TXN_DATE = "%Y-%m-%d"
+START = date(2015, 1, 1)
+END = date(2025, 2, 15)
+PASSWORD = "synthetic-password"
+
+# (date, type, amount, units, nav, balance, cost after the transaction)
+Txn = Tuple[date, str, float, float, float, float, float]
+
+
+def scheme_info(amc_index: int, slot: int) -> dict:
+    """Master data of a scheme in the shared universe; the same (amc, slot) always gives the same scheme."""
+    code = 100000 + amc_index * SCHEMES_PER_AMC + slot
+    kind, scheme_type = SCHEME_KINDS[slot % len(SCHEME_KINDS)]
+    amc = AMCS[amc_index]
+    return {
+        "scheme": f"{amc.replace(' Mutual Fund', '')} {kind} {slot // len(SCHEME_KINDS) + 1} - Direct Plan Growth",
+        "advisor": "DIRECT",
+        "rta_code": f"S{code}",
+        "rta": "CAMS" if code % 2 else "KFINTECH",
+        "type": scheme_type,
+        "isin": f"INFSYN{code:06d}",
+        "amfi": str(code),
+    }
+
+
+def _timeline(rng: random.Random, scheme_type: str, start: date, end: date, transactions: int) -> List[Txn]:
+    """Transactions of one scheme: a random-walk NAV, SIP purchases and occasional partial redemptions."""
+    nav = rng.uniform(10.0, 200.0)
+    drift = 0.0004 if scheme_type == "EQUITY" else 0.0002
+    balance = cost = 0.0
+    step = max((end - start).days, 1) / max(transactions, 1)
+    rows = []
+    for i in range(transactions):
+        day = start + timedelta(days=int(i * step))
+        nav = max(nav * (1.0 + drift * step + rng.gauss(0.0, 0.01) * step ** 0.5), 1.0)
+        if balance > 0 and rng.random() < 0.1:
+            units = -round(balance * rng.uniform(0.05, 0.3), 3)
+            cost += units / balance * cost
+            txn_type = "REDEMPTION"
+        else:
+            units = round(rng.choice((1000, 2000, 5000, 10000)) / nav, 3)
+            cost += units * nav
+            txn_type = "PURCHASE_SIP"
+        balance = round(balance + units, 3)
+        rows.append((day, txn_type, round(units * nav, 2), units, round(nav, 4), balance, cost))
+    return rows
+
+
+def user_portfolio(
+    seed: int,
+    user: int,
+    folios: int,
+    schemes_per_folio: int,
+    transactions_per_scheme: int,
+    start: date = START,
+    end: date = END,
+) -> dict:
+    """
+    Full transaction history of one synthetic investor.
+
+    Every user has its own random stream derived from (seed, user), so any user
+    can be generated on its own and the output never depends on how many users
+    were generated before it.
+    """
+    rng = random.Random(f"{seed}:{user}")
+    folio_list = []
+    for f in range(folios):
+        amc_index = rng.randrange(len(AMCS))
+        slots = rng.sample(range(SCHEMES_PER_AMC), min(schemes_per_folio, SCHEMES_PER_AMC))
+        schemes = []
+        for slot in slots:
+            info = scheme_info(amc_index, slot)
+            schemes.append((info, _timeline(rng, info["type"], start, end, transactions_per_scheme)))
+        folio_list.append({
+            "folio": f"{seed % 1000:03d}{user:08d}{f:03d} / 0",
+            "amc": AMCS[amc_index],
+            "schemes": schemes,
+        })
+    return {
+        "user_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "email": f"investor{user}.{seed}@example.com",
+        "name": f"SYNTHETIC INVESTOR {user}",
+        "folios": folio_list,
+    }
+
+
+def statement_windows(start: date, end: date, statements: int) -> List[Tuple[date, date]]:
+    """Splits start..end into `statements` periods where each one overlaps half of the previous one."""
+    if statements <= 1:
+        return [(start, end)]
+    span = (end - start).days
+    length = span * 2 // (statements + 1)
+    step = length // 2
+    windows = [(start + timedelta(days=i * step), start + timedelta(days=i * step + length)) for i in range(statements)]
+    windows[-1] = (windows[-1][0], end)
+    return windows
+
+
+def build_statement(portfolio: dict, period_from: date, period_to: date) -> dict:
+    """Formats the part of a portfolio inside one statement period as casparser output (see output.json)."""
+    folios = []
+    for folio in portfolio["folios"]:
+        schemes = []
+        for info, timeline in folio["schemes"]:
+            before = [t for t in timeline if t[0] < period_from]
+            inside = [t for t in timeline if period_from <= t[0] <= period_to]
+            opening = before[-1][5] if before else 0.0
+            last = inside[-1] if inside else (before[-1] if before else None)
+            close = last[5] if last else 0.0
+            scheme = dict(info)
+            scheme.update({
+                "nominees": [],
+                "open": f"{opening:.3f}",
+                "close": f"{close:.3f}",
+                "close_calculated": f"{close:.3f}",
+                "valuation": {
+                    "date": period_to.strftime(TXN_DATE),
+                    "nav": f"{last[4] if last else 0.0:.4f}",
+                    "cost": f"{last[6] if last else 0.0:.2f}",
+                    "value": f"{close * (last[4] if last else 0.0):.2f}",
+                },
+                "transactions": [
+                    {
+                        "date": day.strftime(TXN_DATE),
+                        "description": "SIP Purchase - Instalment" if txn_type == "PURCHASE_SIP" else "Redemption - via Internet",
+                        "amount": f"{amount:.2f}",
+                        "units": f"{units:.3f}",
+                        "nav": f"{nav:.4f}",
+                        "balance": f"{balance:.3f}",
+                        "type": txn_type,
+                        "dividend_rate": None,
+                    }
+                    for day, txn_type, amount, units, nav, balance, _ in inside
+                ],
+            })
+            schemes.append(scheme)
+        folios.append({
+            "folio": folio["folio"],
+            "amc": folio["amc"],
+            "PAN": "AAAPZ0000Z",
+            "KYC": "OK",
+            "PANKYC": "OK",
+            "schemes": schemes,
+        })
+    return {
+        "statement_period": {"from": period_from.strftime(CAS_DATE), "to": period_to.strftime(CAS_DATE)},
+        "folios": folios,
+        "investor_info": {"name": portfolio["name"], "email": portfolio["email"], "address": "", "mobile": ""},
+        "cas_type": "DETAILED",
+        "file_type": "CAMS",
+    }
+
+
+def iter_statements(
+    users: int,
+    folios: int = 4,
+    schemes_per_folio: int = 2,
+    transactions_per_scheme: int = 24,
+    statements: int = 1,
+    seed: int = 0,
+    start: date = START,
+    end: date = END,
+) -> Iterator[Tuple[str, dict]]:
+    """
+    Yields (email, statement) for every statement of every user, one user in memory at a time.
+
+    With statements > 1 each user gets that many CAS statements with overlapping
+    periods, so ingesting them in order exercises the merge of existing folios.
+    """
+    windows = statement_windows(start, end, statements)
+    for user in range(users):
+        portfolio = user_portfolio(seed, user, folios, schemes_per_folio, transactions_per_scheme, start, end)
+        for period_from, period_to in windows:
+            yield portfolio["email"], build_statement(portfolio, period_from, period_to)
+
+
+def generate_cas(
+    folios: int = 4,
+    schemes_per_folio: int = 2,
+    transactions_per_scheme: int = 24,
+    seed: int = 0,
+    start: date = START,
+    end: date = END,
+    email: Optional[str] = None,
+) -> dict:
+    """
+    Builds one casparser-shaped CAS statement covering start..end.
+
+    Args:
+        folios: Number of folios.
+        schemes_per_folio: Schemes in every folio.
+        transactions_per_scheme: Transactions in every scheme, spread evenly over the period.
+        seed: Random seed; the same arguments always produce the same statement.
+        start, end: Statement period.
+        email: Investor email; defaults to the synthetic user's address.
+
+    Returns:
+        The statement as a dict, ready for publish_to_db or json.dump.
+    """
+    portfolio = user_portfolio(seed, 0, folios, schemes_per_folio, transactions_per_scheme, start, end)
+    if email:
+        portfolio["email"] = email
+    return build_statement(portfolio, start, end)
+
+
+def write_files(output: str, statements: Iterator[Tuple[str, dict]]) -> int:
+    """
+    Writes statements as JSON files into a directory, or as one NDJSON file when output ends in .ndjson.
+    Returns the number of statements written.
+    """
+    count = 0
+    if output.endswith(".ndjson"):
+        with open(output, "w") as f:
+            for _, statement in statements:
+                f.write(json.dumps(statement) + "\n")
+                count += 1
+        return count
+    os.makedirs(output, exist_ok=True)
+    per_email: Dict[str, int] = {}
+    for email, statement in statements:
+        per_email[email] = per_email.get(email, 0) + 1
+        with open(os.path.join(output, f"{email.split('@')[0]}_{per_email[email]:02d}.json"), "w") as f:
+            json.dump(statement, f)
+        count += 1
+    return count
+
+
+def bulk_load(
+    session_factory: Callable,
+    users: int,
+    folios: int = 4,
+    schemes_per_folio: int = 2,
+    transactions_per_scheme: int = 24,
+    seed: int = 0,
+    start: date = START,
+    end: date = END,
+    batch_size: int = 50000,
+) -> int:
+    """
+    Streams synthetic users straight into the database with Core bulk inserts.
+
+    Each user is stored as if all of their statements had been ingested (one
+    statement period covering start..end). Rows are flushed and committed every
+    `batch_size` transactions, so memory stays flat however many users are loaded.
+    Portfolio history is not precomputed; it is filled in on first read.
+
+    Returns:
+        The number of transactions inserted.
+    """
+    from sqlalchemy import insert
+
+    from auth import get_password_hash
+    from models import Folio, SchemeMaster, Scheme, StatementPeriod, Transaction, User, Valuation
+    from scheme_master import get_amc_id
+
+    session = session_factory()
+    hashed_password = get_password_hash(PASSWORD)
+    known_isins = {isin for (isin,) in session.query(SchemeMaster.isin)}
+    pending: List[dict] = []
+    pending_txns = 0
+    total = 0
+
+    def flush():
+        session.execute(insert(User), [
+            {"user_id": p["user_id"], "email": p["email"], "hashed_password": hashed_password,
+             "is_active": True, "full_name": p["name"]}
+            for p in pending
+        ])
+        sp_ids = session.execute(
+            insert(StatementPeriod).returning(StatementPeriod.id, sort_by_parameter_order=True),
+            [{"from_date": start, "to_date": end, "user_id": p["user_id"]} for p in pending],
+        ).scalars().all()
+
+        masters = {}
+        for p in pending:
+            for folio in p["folios"]:
+                for info, _ in folio["schemes"]:
+                    if info["isin"] not in known_isins:
+                        masters[info["isin"]] = {
+                            "isin": info["isin"], "amfi_code": info["amfi"], "scheme_name": info["scheme"],
+                            "scheme_type": info["type"], "rta": info["rta"], "rta_code": info["rta_code"],
+                        }
+        if masters:
+            session.execute(insert(SchemeMaster), list(masters.values()))
+            known_isins.update(masters)
+
+        folio_rows, scheme_rows, timelines = [], [], []
+        for p, sp_id in zip(pending, sp_ids):
+            for folio in p["folios"]:
+                amc_id = get_amc_id(session, folio["amc"])
+                folio_rows.append({"folio_number": folio["folio"], "statement_period_id": sp_id,
+                                   "user_id": p["user_id"], "pan": "AAAPZ0000Z", "amc_id": amc_id})
+                for info, timeline in folio["schemes"]:
+                    close = timeline[-1][5] if timeline else 0.0
+                    scheme_rows.append({
+                        "folio_id": folio["folio"], "amc_id": amc_id, "scheme_name": info["scheme"],
+                        "advisor": info["advisor"], "isin": info["isin"], "nominees": [],
+                        "open_units": 0.0, "close_units": close, "close_calculated_units": close,
+                    })
+                    timelines.append(timeline)
+        session.execute(insert(Folio), folio_rows)
+        scheme_ids = session.execute(
+            insert(Scheme).returning(Scheme.id, sort_by_parameter_order=True), scheme_rows
+        ).scalars().all()
+
+        valuation_rows, txn_rows = [], []
+        for scheme_id, timeline in zip(scheme_ids, timelines):
+            if timeline:
+                last = timeline[-1]
+                valuation_rows.append({"scheme_id": scheme_id, "valuation_date": end, "valuation_nav": last[4],
+                                       "valuation_cost": round(last[6], 2), "valuation_value": round(last[5] * last[4], 2)})
+            txn_rows.extend(
+                {"scheme_id": scheme_id, "transaction_date": day, "description": txn_type.title(), "amount": amount,
+                 "units": units, "nav": nav, "balance": balance, "transaction_type": txn_type, "dividend_rate": None}
+                for day, txn_type, amount, units, nav, balance, _ in timeline
+            )
+        if valuation_rows:
+            session.execute(insert(Valuation), valuation_rows)
+        if txn_rows:
+            session.execute(insert(Transaction), txn_rows)
+        session.commit()
+
+    try:
+        for user in range(users):
+            portfolio = user_portfolio(seed, user, folios, schemes_per_folio, transactions_per_scheme, start, end)
+            pending.append(portfolio)
+            pending_txns += folios * schemes_per_folio * transactions_per_scheme
+            if pending_txns >= batch_size:
+                flush()
+                total += pending_txns
+                logger.info(f"Loaded {user + 1} users, {total} transactions")
+                pending, pending_txns = [], 0
+        if pending:
+            flush()
+            total += pending_txns
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    logger.info(f"Bulk load finished: {users} users, {total} transactions")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic CAS statements for scale testing.")
+    parser.add_argument("sink", choices=("files", "db"), help="write JSON/NDJSON files or bulk load DATABASE_URL")
+    parser.add_argument("output", nargs="?", default="synthetic", help="directory, or a .ndjson file (files sink)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--folios", type=int, default=4, help="folios per user")
+    parser.add_argument("--schemes", type=int, default=2, help="schemes per folio")
+    parser.add_argument("--transactions", type=int, default=24, help="transactions per scheme")
+    parser.add_argument("--statements", type=int, default=1, help="overlapping statements per user (files sink)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=50000, help="transactions per commit (db sink)")
+    args = parser.parse_args()
+    if args.sink == "files":
+        written = write_files(args.output, iter_statements(
+            args.users, args.folios, args.schemes, args.transactions, args.statements, args.seed
+        ))
+        print(f"Wrote {written} statement(s) to {args.output}.")
+    else:
+        from db import SessionLocal
+        loaded = bulk_load(SessionLocal, args.users, args.folios, args.schemes, args.transactions, args.seed,
+                           batch_size=args.batch_size)
+        print(f"Loaded {loaded} transactions for {args.users} users.")
@@ -0,0 +1,63 @@
+# File: tests/conftest.py
+# Shared fixtures: a throw-away SQLite database wired into the ingestion code.
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+import scheme_master
+from db import Base, fingerprint, track_queries
+
+
+@pytest.fixture
+def sqlite_sessions(tmp_path, monkeypatch):
+    """Sessionmaker for an empty SQLite database; publish_to_db and friends use it too."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    # SQLite locks the whole file, so the upload progress writer (see ingest_progress.py)
+    # gets its own database instead of contending with the ingestion it reports on.
+    progress_engine = create_engine(f"sqlite:///{tmp_path / 'progress.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(progress_engine)
+    import ingest_progress
+    import routes.pdf_converter
+    monkeypatch.setattr(routes.pdf_converter, "SessionLocal", factory)
+    monkeypatch.setattr(ingest_progress, "SessionLocal", sessionmaker(bind=progress_engine))
+    scheme_master.clear_cache()
+    yield factory
+    scheme_master.clear_cache()
+    engine.dispose()
+    progress_engine.dispose()
+
+
+@pytest.fixture
+def make_user(sqlite_sessions):
+    def _make(email: str = "investor@example.com") -> str:
+        with sqlite_sessions() as db:
+            user_id = str(uuid.uuid4())
+            db.add(models.User(user_id=user_id, email=email, hashed_password="x"))
+            db.commit()
+        return user_id
+    return _make
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Context manager factory asserting that a block runs at most max_queries statements:
+
+        with query_budget(5):
+            client.get("/...")
+    """
+    @contextmanager
+    def _budget(max_queries: int):
+        with track_queries() as stats:
+            yield stats
+        assert stats.count <= max_queries, (
+            f"{stats.count} queries, budget is {max_queries}; slowest:\n"
+            + "\n".join(f"{elapsed * 1000:.1f} ms {fingerprint(statement)}" for statement, elapsed in stats.slowest())
+        )
+    return _budget
@@ -0,0 +1,80 @@
+# File: tests/test_analytics.py
+# Tests and a 500-scheme benchmark for the vectorized XIRR engine.
+import time
+import random
+from datetime import date, timedelta
+
+import numpy as np
+
+from analytics import xirr_batch, build_xirr_report
+
+
+def test_xirr_single_year():
+    d0 = date(2020, 1, 1).toordinal()
+    rates = xirr_batch([-1000.0, 1100.0], [d0, d0 + 365], [0, 0], 1)
+    assert abs(rates[0] - 0.10) < 1e-6
+
+
+def test_xirr_batch_matches_individual_solves():
+    d0 = date(2018, 4, 1).toordinal()
+    series = [
+        ([-5000.0, -5000.0, 12000.0], [d0, d0 + 180, d0 + 900]),
+        ([-10000.0, 9000.0], [d0, d0 + 400]),
+        ([-1000.0, -1000.0], [d0, d0 + 30]),  # no proceeds, no rate
+    ]
+    amounts, days, groups = [], [], []
+    for i, (a, d) in enumerate(series):
+        amounts += a
+        days += d
+        groups += [i] * len(a)
+    batch = xirr_batch(amounts, days, groups, len(series))
+    for i, (a, d) in enumerate(series[:2]):
+        single = xirr_batch(a, d, [0] * len(a), 1)
+        assert abs(batch[i] - single[0]) < 1e-9
+    assert batch[1] < 0
+    assert np.isnan(batch[2])
+
+
+def test_report_groups_by_amc_and_portfolio():
+    schemes = [(1, "Fund A", 10, "AMC X"), (2, "Fund B", 10, "AMC X"), (3, "Fund C", 20, "AMC Y")]
+    transactions = [
+        (1, date(2020, 1, 1), 1000.0, "PURCHASE"),
+        (2, date(2020, 1, 1), 1000.0, "PURCHASE_SIP"),
+        (2, date(2020, 1, 1), 0.05, "STAMP_DUTY_TAX"),
+        (3, date(2020, 1, 1), 2000.0, "PURCHASE"),
+    ]
+    valuations = [(1, date(2021, 1, 1), 1100.0), (2, date(2021, 1, 1), 1100.0), (3, date(2021, 1, 1), 2200.0)]
+    report = build_xirr_report(schemes, transactions, valuations)
+    assert len(report["schemes"]) == 3
+    assert len(report["amcs"]) == 2
+    assert report["portfolio"]["invested"] == 4000.0
+    assert report["portfolio"]["current_value"] == 4400.0
+    assert abs(report["portfolio"]["xirr_percent"] - report["amcs"][0]["xirr_percent"]) < 1e-6
+
+
+def test_benchmark_500_scheme_portfolio():
+    rng = random.Random(42)
+    start = date(2005, 1, 1)
+    schemes, transactions, valuations = [], [], []
+    for scheme_id in range(500):
+        schemes.append((scheme_id, f"Scheme {scheme_id}", scheme_id % 40, f"AMC {scheme_id % 40}"))
+        first = start + timedelta(days=rng.randint(0, 3000))
+        units = 0.0
+        # Monthly SIP for a few years, with the occasional redemption.
+        for month in range(rng.randint(12, 120)):
+            nav = 10 * (1.01 ** month)
+            txn_date = first + timedelta(days=30 * month)
+            transactions.append((scheme_id, txn_date, 5000.0, "PURCHASE_SIP"))
+            units += 5000.0 / nav
+            if month % 37 == 36:
+                transactions.append((scheme_id, txn_date, -2000.0, "REDEMPTION"))
+                units -= 2000.0 / nav
+        valuations.append((scheme_id, date(2025, 2, 14), units * nav * 1.05))
+
+    started = time.perf_counter()
+    report = build_xirr_report(schemes, transactions, valuations)
+    elapsed = time.perf_counter() - started
+    print(f"\nXIRR for 500 schemes / {len(transactions)} transactions: {elapsed * 1000:.1f} ms")
+
+    assert all(entry["xirr_percent"] is not None for entry in report["schemes"])
+    assert elapsed < 5.0
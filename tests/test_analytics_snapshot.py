@@ -0,0 +1,100 @@
+# File: tests/test_analytics_snapshot.py
+# Tests for the columnar analytics snapshot.
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.dataset as pads  # noqa: E402
+
+from analytics_snapshot import load_state, snapshot, user_bucket  # noqa: E402
+from ingest_pipeline import StatementStream, ingest  # noqa: E402
+import ingest_pipeline  # noqa: E402
+from models import IngestionInFlight, Transaction, Valuation  # noqa: E402
+from synthetic_cas import iter_statements  # noqa: E402
+
+
+def ingest_users(sqlite_sessions, make_user, users, first_user=0, chunk_size=0, failed=0):
+    statements = [s for s in iter_statements(users=first_user + users, folios=2, schemes_per_folio=2,
+                                             transactions_per_scheme=6)][first_user:]
+    for email, _ in statements:
+        make_user(email)
+    assert ingest(StatementStream(statements), sqlite_sessions, chunk_size)["failed"] == failed
+
+
+def read(path, fmt="parquet"):
+    return pads.dataset(str(path), format=fmt, partitioning="hive").to_table()
+
+
+def test_snapshot_partitions_by_user_bucket_and_year(tmp_path, sqlite_sessions, make_user):
+    ingest_users(sqlite_sessions, make_user, users=2)
+    report = snapshot(sqlite_sessions, str(tmp_path / "snap"), buckets=4)
+    assert (report["transactions"], report["valuations"]) == (2 * 2 * 2 * 6, 2 * 2 * 2)
+
+    table = read(tmp_path / "snap" / "transactions")
+    assert table.num_rows == 2 * 2 * 2 * 6
+    rows = table.to_pylist()
+    assert all(r["user_bucket"] == user_bucket(r["user_id"], 4) for r in rows)
+    assert all(r["year"] == r["transaction_date"].year for r in rows)
+    with sqlite_sessions() as db:
+        assert sorted(r["id"] for r in rows) == sorted(t.id for t in db.query(Transaction))
+
+
+def test_second_run_appends_only_new_rows(tmp_path, sqlite_sessions, make_user):
+    target = str(tmp_path / "snap")
+    ingest_users(sqlite_sessions, make_user, users=1)
+    first = snapshot(sqlite_sessions, target)
+    assert snapshot(sqlite_sessions, target)["transactions"] == 0
+
+    ingest_users(sqlite_sessions, make_user, users=1, first_user=1)
+    second = snapshot(sqlite_sessions, target)
+    assert second["transactions"] == first["transactions"] and second["valuations"] == 2 * first["valuations"]
+    ids = read(tmp_path / "snap" / "transactions").column("id").to_pylist()
+    assert len(ids) == len(set(ids)) == 2 * first["transactions"]
+    assert load_state(target)["watermark"] == max(ids)
+
+
+def test_running_ingestion_holds_the_watermark(tmp_path, sqlite_sessions, make_user):
+    ingest_users(sqlite_sessions, make_user, users=1)
+    with sqlite_sessions() as db:
+        db.add(IngestionInFlight(start_txn_id=10))
+        db.commit()
+    assert snapshot(sqlite_sessions, str(tmp_path / "snap"))["watermark"] == 10
+
+
+@pytest.mark.parametrize("chunk_size", [0, 1])
+def test_every_ingestion_is_in_flight_until_it_commits(sqlite_sessions, make_user, monkeypatch, chunk_size):
+    seen = []
+    publish_folios = ingest_pipeline.publish_folios
+
+    def checked(session, *args):
+        with sqlite_sessions() as other:  # committed before the ingestion inserts anything
+            seen.append(other.query(IngestionInFlight.start_txn_id).all())
+        return publish_folios(session, *args)
+
+    monkeypatch.setattr(ingest_pipeline, "publish_folios", checked)
+    ingest_users(sqlite_sessions, make_user, users=1, chunk_size=chunk_size)
+    assert seen and all(markers == [(0,)] for markers in seen)
+
+    def failing(session, *args):
+        raise ValueError("bad folio")
+
+    monkeypatch.setattr(ingest_pipeline, "publish_folios", failing)
+    ingest_users(sqlite_sessions, make_user, users=1, first_user=1, chunk_size=chunk_size, failed=1)
+    with sqlite_sessions() as db:
+        assert db.query(IngestionInFlight).count() == 0
+
+
+def test_valuations_are_rewritten_and_arrow_files_memory_map(tmp_path, sqlite_sessions, make_user):
+    target = str(tmp_path / "snap")
+    ingest_users(sqlite_sessions, make_user, users=1)
+    snapshot(sqlite_sessions, target, fmt="arrow")
+    with sqlite_sessions() as db:
+        db.query(Valuation).update({Valuation.valuation_value: 1.0})
+        db.commit()
+    snapshot(sqlite_sessions, target, fmt="arrow")
+
+    assert set(read(tmp_path / "snap" / "valuations", "ipc").column("valuation_value").to_pylist()) == {1.0}
+    part = next((tmp_path / "snap" / "transactions").rglob("*.arrow"))
+    with pa.memory_map(str(part)) as source:
+        assert pa.ipc.open_file(source).read_all().num_rows > 0
+    with pytest.raises(ValueError):
+        snapshot(sqlite_sessions, target, fmt="parquet")
@@ -0,0 +1,94 @@
+# File: tests/test_benchmarks.py
+# Microbenchmarks for the request path, run with pytest-benchmark against SQLite.
+#
+# Record a baseline and compare later runs against it:
+#   pytest tests/test_benchmarks.py --benchmark-storage=benchmarks --benchmark-save=baseline
+#   pytest tests/test_benchmarks.py --benchmark-storage=benchmarks --benchmark-compare --benchmark-compare-fail=mean:25%
+# BENCH_TRANSACTIONS sets the transactions per scheme of the synthetic statement.
+import os
+from collections import defaultdict
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from db import Base
+from routes.dash import build_portfolio
+from routes.pdf_converter import parse_date, publish_to_db
+from synthetic_cas import generate_cas
+
+TRANSACTIONS = int(os.getenv("BENCH_TRANSACTIONS", "24"))
+EMAIL = "bench@example.com"
+
+
+@pytest.fixture
+def statement():
+    return generate_cas(folios=4, schemes_per_folio=2, transactions_per_scheme=TRANSACTIONS, seed=1, email=EMAIL)
+
+
+def test_parse_date(benchmark):
+    values = ["2025-03-05", "2025-Mar-05", "05-Mar-2025"] * 100
+    result = benchmark(lambda: [parse_date(v) for v in values])
+    assert len(result) == 300
+
+
+def test_publish_to_db(benchmark, sqlite_sessions, make_user, statement):
+    engine = sqlite_sessions.kw["bind"]
+
+    def fresh_database():
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        make_user(EMAIL)
+
+    benchmark.pedantic(publish_to_db, args=(statement, EMAIL), setup=fresh_database, rounds=5)
+    with sqlite_sessions() as db:
+        from models import Transaction
+        assert db.query(Transaction).count() == 4 * 2 * TRANSACTIONS
+
+
+def test_publish_update_to_long_history(benchmark, sqlite_sessions, make_user):
+    # A 20-year history with a statement that repeats it and adds the last quarter.
+    from datetime import date, timedelta
+
+    from synthetic_cas import END, build_statement, user_portfolio
+
+    engine = sqlite_sessions.kw["bind"]
+    portfolio = user_portfolio(0, 0, 4, 2, 240, date(2005, 1, 1), END)
+    history = build_statement(portfolio, date(2005, 1, 1), END - timedelta(days=90))
+    update = build_statement(portfolio, date(2005, 1, 1), END)
+
+    def stored_history():
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        make_user(EMAIL)
+        publish_to_db(history, EMAIL)
+
+    benchmark.pedantic(publish_to_db, args=(update, EMAIL), setup=stored_history, rounds=5)
+
+
+def test_get_portfolio(benchmark, sqlite_sessions, make_user, statement):
+    user_id = make_user(EMAIL)
+    publish_to_db(statement, EMAIL)
+    with sqlite_sessions() as db:
+        result = benchmark(build_portfolio, db, user_id)  # the uncached path
+    assert len(result.folios) == 4
+
+
+def test_middlewares(benchmark, monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT", 10 ** 9)
+    monkeypatch.setattr(main, "request_counts", defaultdict(list))
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    app.add_middleware(main.AuthLoggingMiddleware)
+    app.add_middleware(main.RateLimitMiddleware)
+    client = TestClient(app)
+    response = benchmark(client.get, "/ping")
+    assert response.status_code == 200
@@ -0,0 +1,88 @@
+# File: tests/test_bulk_import.py
+# Tests for the offline bulk importer.
+import json
+
+import bulk_import
+import pdf_workers
+from bulk_import import BulkImporter, find_files, load_manifest, parse_file
+from models import Transaction
+from synthetic_cas import iter_statements, write_files
+
+
+def write_corpus(directory, make_user, users=3):
+    statements = list(iter_statements(users=users, folios=2, schemes_per_folio=2, transactions_per_scheme=4))
+    for email, _ in statements:
+        make_user(email)
+    write_files(str(directory), iter(statements))
+    return statements
+
+
+def test_imports_directory_and_reports_throughput(tmp_path, sqlite_sessions, make_user):
+    write_corpus(tmp_path / "cas", make_user)
+    (tmp_path / "cas" / "notes.txt").write_text("not a statement")
+    importer = BulkImporter(sqlite_sessions, str(tmp_path / "manifest.jsonl"), workers=2, max_in_flight=1)
+    report = importer.run(str(tmp_path / "cas"))
+
+    assert (report["files"], report["failed"], report["statements"]) == (3, 0, 3)
+    assert report["rows"] > 3 * 2 * 2 * 4
+    assert report["files_per_second"] > 0 and report["rows_per_second"] > 0
+    with sqlite_sessions() as db:
+        assert db.query(Transaction).count() == 3 * 2 * 2 * 4
+
+
+def test_rerun_skips_files_in_manifest_and_retries_failures(tmp_path, sqlite_sessions, make_user):
+    write_corpus(tmp_path / "cas", make_user)
+    broken = tmp_path / "cas" / "broken.json"
+    broken.write_text("{not json")
+    manifest = str(tmp_path / "manifest.jsonl")
+
+    first = BulkImporter(sqlite_sessions, manifest, workers=2).run(str(tmp_path / "cas"))
+    assert (first["files"], first["failed"]) == (4, 1)
+    assert len(load_manifest(manifest)) == 3
+
+    second = BulkImporter(sqlite_sessions, manifest, workers=2).run(str(tmp_path / "cas"))
+    assert (second["files"], second["skipped"], second["failed"]) == (1, 3, 1)
+    with open(manifest) as f:
+        assert [json.loads(line)["status"] for line in f].count("failed") == 2
+
+
+def test_find_files_is_sorted_and_filtered(tmp_path):
+    for name in ("b.json", "a.PDF", "c.ndjson", "d.txt"):
+        (tmp_path / name).write_text("")
+    assert [p.rsplit("/", 1)[1] for p in find_files(str(tmp_path))] == ["a.PDF", "b.json", "c.ndjson"]
+
+
+def test_existing_portfolio_history_is_refreshed_once_at_the_end(tmp_path, sqlite_sessions, make_user):
+    from models import PortfolioHistory
+    from portfolio_history import refresh_portfolio_history
+    from routes.pdf_converter import publish_to_db
+
+    (first_email, first), (_, second) = iter_statements(users=1, folios=1, transactions_per_scheme=6, statements=2)
+    user_id = make_user(first_email)
+    assert publish_to_db(first, first_email)
+    (tmp_path / "cas").mkdir()
+    (tmp_path / "cas" / "second.json").write_text(json.dumps(second))
+    BulkImporter(sqlite_sessions, str(tmp_path / "manifest.jsonl"), workers=1).run(str(tmp_path / "cas"))
+
+    def series(db):
+        return [(r.history_date, round(r.invested, 2)) for r in
+                db.query(PortfolioHistory).filter_by(user_id=user_id).order_by(PortfolioHistory.history_date)]
+
+    with sqlite_sessions() as db:
+        imported = series(db)
+        db.query(PortfolioHistory).delete()
+        db.commit()
+        refresh_portfolio_history(db, user_id)
+        assert imported == series(db)
+
+
+def test_pool_processes_parse_pdfs_without_a_parser_pool(tmp_path, monkeypatch):
+    def no_pool():
+        raise AssertionError("pdf_workers pool started inside a bulk import process")
+
+    monkeypatch.setattr(pdf_workers, "get_pool", no_pool)
+    monkeypatch.setattr(bulk_import, "read_cas_pdf",
+                        lambda path, password: json.dumps({"investor_info": {"email": "pdf@example.com"}}))
+    assert parse_file(str(tmp_path / "a.pdf"), "secret", None) == [
+        ("pdf@example.com", {"investor_info": {"email": "pdf@example.com"}})
+    ]
@@ -0,0 +1,85 @@
+# File: tests/test_capital_gains.py
+# Tests and a 20-year SIP benchmark for the FIFO capital-gains engine.
+import time
+from datetime import date, timedelta
+
+from capital_gains import LotQueue, compute_capital_gains, financial_year
+
+
+def test_lot_queue_fifo_partial_lots():
+    queue = LotQueue(3)
+    queue.push(1, 10.0, 1.0)
+    queue.push(2, 10.0, 2.0)
+    queue.push(3, 10.0, 3.0)
+    days, units, cost, missing = queue.take(15.0)
+    assert days.tolist() == [1, 2]
+    assert units.tolist() == [10.0, 5.0]
+    assert cost.tolist() == [1.0, 2.0]
+    assert missing == 0.0
+    assert queue.held() == 15.0
+    _, _, _, missing = queue.take(20.0)
+    assert abs(missing - 5.0) < 1e-9
+
+
+def test_short_and_long_term_split():
+    schemes = [(1, "Equity Fund", "EQUITY", None, None), (2, "Debt Fund", "DEBT", None, None)]
+    transactions = [
+        (1, date(2020, 1, 1), 1000.0, 100.0, "PURCHASE"),
+        (1, date(2021, 6, 1), 500.0, 50.0, "PURCHASE_SIP"),
+        (1, date(2021, 9, 1), -3000.0, -150.0, "REDEMPTION"),
+        (2, date(2022, 1, 1), 1000.0, 10.0, "PURCHASE"),
+        (2, date(2023, 6, 1), 1000.0, 10.0, "PURCHASE"),
+        (2, date(2024, 6, 1), -2400.0, -20.0, "REDEMPTION"),
+    ]
+    report = compute_capital_gains(schemes, transactions)
+    years = {row["financial_year"]: row for row in report["financial_years"]}
+    # Equity: 100 units held > 1 year (gain 1000), 50 units held 3 months (gain 500).
+    assert years["FY2021-22"]["ltcg"] == 1000.0
+    assert years["FY2021-22"]["stcg"] == 500.0
+    # Debt: both lots are short term (under 36 months, and the second bought after 1-Apr-2023).
+    assert years["FY2024-25"]["ltcg"] == 0.0
+    assert years["FY2024-25"]["stcg"] == 400.0
+    assert report["unmatched"] == []
+
+
+def test_grandfathered_cost_uses_master_nav():
+    schemes = [(1, "Old Equity Fund", "EQUITY", None, 30.0)]
+    transactions = [
+        (1, date(2015, 1, 1), 1000.0, 100.0, "PURCHASE"),
+        (1, date(2020, 1, 1), -4000.0, -100.0, "REDEMPTION"),
+    ]
+    report = compute_capital_gains(schemes, transactions)
+    # Cost is max(1000, min(100 * 30, 4000)) = 3000.
+    assert report["financial_years"][0]["ltcg"] == 1000.0
+
+
+def test_financial_year_boundaries():
+    assert financial_year(date(2024, 3, 31).toordinal()) == "FY2023-24"
+    assert financial_year(date(2024, 4, 1).toordinal()) == "FY2024-25"
+
+
+def test_benchmark_twenty_years_of_sips():
+    schemes = [(i, f"Scheme {i}", "EQUITY" if i % 3 else "DEBT", None, None) for i in range(40)]
+    transactions = []
+    start = date(2005, 1, 5)
+    for scheme_id, *_ in schemes:
+        held = 0.0
+        for month in range(240):
+            nav = 10 * (1.008 ** month)
+            txn_date = start + timedelta(days=30 * month)
+            units = 5000.0 / nav
+            transactions.append((scheme_id, txn_date, 5000.0, units, "PURCHASE_SIP"))
+            held += units
+            if month % 12 == 11:
+                sold = held / 4
+                transactions.append((scheme_id, txn_date, -sold * nav, -sold, "REDEMPTION"))
+                held -= sold
+
+    started = time.perf_counter()
+    report = compute_capital_gains(schemes, transactions)
+    elapsed = time.perf_counter() - started
+    print(f"\nCapital gains for {len(schemes)} schemes / {len(transactions)} transactions: {elapsed * 1000:.1f} ms")
+
+    assert report["unmatched"] == []
+    assert len(report["financial_years"]) == 20
+    assert elapsed < 5.0
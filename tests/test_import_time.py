@@ -0,0 +1,39 @@
+# File: tests/test_import_time.py
+# Import-time budget for application startup, measured with `python -X importtime`.
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generous default so slow CI machines pass; tighten locally with IMPORT_BUDGET_MS.
+IMPORT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "4000"))
+# Heavy modules that must only be imported on first use.
+DEFERRED_MODULES = ("casparser", "pandas", "pytest")
+
+
+def import_times():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_startup_does_not_import_heavy_modules():
+    times = import_times()
+    loaded = [name for name in times if name.split(".")[0] in DEFERRED_MODULES]
+    assert loaded == [], f"Imported at startup: {loaded}"
+
+
+def test_startup_import_budget():
+    times = import_times()
+    total_ms = times["main"] / 1000
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[:10]
+    print(f"\nimport main: {total_ms:.0f} ms; slowest: {slowest}")
+    assert total_ms < IMPORT_BUDGET_MS
@@ -0,0 +1,49 @@
+# File: tests/test_ingest_checkpoint.py
+# Tests for chunked, resumable ingestion.
+import ingest_pipeline
+from models import Folio, IngestionCheckpoint, Transaction
+from routes.pdf_converter import publish_to_db
+from synthetic_cas import generate_cas
+
+EMAIL = "chunked@example.com"
+
+
+def counts(sessions):
+    with sessions() as db:
+        return db.query(Folio).count(), db.query(Transaction).count()
+
+
+def test_chunked_ingestion_matches_single_transaction(sqlite_sessions, make_user):
+    make_user(EMAIL)
+    statement = generate_cas(folios=5, schemes_per_folio=2, transactions_per_scheme=6, email=EMAIL)
+    assert publish_to_db(statement, EMAIL, chunk_size=2, source_hash="abc")
+    assert counts(sqlite_sessions) == (5, 5 * 2 * 6)
+    with sqlite_sessions() as db:
+        checkpoint = db.query(IngestionCheckpoint).one()
+        assert (checkpoint.status, checkpoint.completed_folios, checkpoint.total_folios) == ("completed", 5, 5)
+
+
+def test_failed_folio_keeps_earlier_batches_and_retry_resumes(sqlite_sessions, make_user, monkeypatch):
+    make_user(EMAIL)
+    statement = generate_cas(folios=5, schemes_per_folio=2, transactions_per_scheme=6, email=EMAIL)
+    real_publish_folios = ingest_pipeline.publish_folios
+    failing_folio = statement["folios"][3]["folio"]
+
+    def flaky_publish_folios(session, user, normalized, folios, *args):
+        real_publish_folios(session, user, normalized, folios, *args)
+        if any(folio["folio"] == failing_folio for folio in folios):
+            raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(ingest_pipeline, "publish_folios", flaky_publish_folios)
+    assert not publish_to_db(statement, EMAIL, chunk_size=2, source_hash="abc")
+    # Folios 1-3 are committed (two full batches would be 4; the fourth rolled back to its savepoint).
+    assert counts(sqlite_sessions) == (3, 3 * 2 * 6)
+    with sqlite_sessions() as db:
+        checkpoint = db.query(IngestionCheckpoint).one()
+        assert (checkpoint.status, checkpoint.completed_folios) == ("failed", 3)
+
+    monkeypatch.setattr(ingest_pipeline, "publish_folios", real_publish_folios)
+    assert publish_to_db(statement, EMAIL, chunk_size=2, source_hash="abc")
+    assert counts(sqlite_sessions) == (5, 5 * 2 * 6)
+    with sqlite_sessions() as db:
+        assert db.query(IngestionCheckpoint).one().status == "completed"
@@ -0,0 +1,130 @@
+# File: tests/test_ingest_lock.py
+# Per-user ingestion locking, including a stress test with 50 concurrent uploads.
+# Set TEST_POSTGRES_URL to a throw-away PostgreSQL database (its tables are dropped) to
+# run the stress test on the advisory-lock path as well.
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import ingest_pipeline
+import routes.pdf_converter as pdf_converter
+from db import Base
+from ingest_lock import lock_key, user_ingest_lock
+from models import Folio, Scheme, Transaction, User
+from synthetic_cas import generate_cas
+
+USERS = 5
+UPLOADS_PER_USER = 10
+
+
+def test_lock_key_is_stable_and_signed_64_bit():
+    assert lock_key("a@example.com") == lock_key("a@example.com")
+    assert lock_key("a@example.com") != lock_key("b@example.com")
+    assert -2 ** 63 <= lock_key("a@example.com") < 2 ** 63
+
+
+def test_same_user_waits_other_users_do_not():
+    engine = create_engine("sqlite://")
+    order = []
+    holding = threading.Event()
+
+    def hold_a():
+        with user_ingest_lock(engine, "A@example.com"):
+            holding.set()
+            time.sleep(0.2)
+            order.append("a1 done")
+
+    thread = threading.Thread(target=hold_a)
+    thread.start()
+    holding.wait()
+    started = time.perf_counter()
+    with user_ingest_lock(engine, "b@example.com"):
+        assert time.perf_counter() - started < 0.1
+    with user_ingest_lock(engine, "a@example.com"):
+        order.append("a2")
+    thread.join()
+    assert order == ["a1 done", "a2"]
+
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def test_ingestion_runs_on_the_lock_connection(tmp_path, monkeypatch):
+    # The only pooled connection is the one holding the lock; a second checkout would time out.
+    engine = create_engine(f"sqlite:///{tmp_path / 'one.db'}", connect_args={"check_same_thread": False},
+                           pool_size=1, max_overflow=0, pool_timeout=1)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    monkeypatch.setattr(pdf_converter, "SessionLocal", factory)
+
+    @contextmanager
+    def connection_lock(lock_engine, user_key):
+        with lock_engine.connect() as conn:
+            yield conn
+
+    monkeypatch.setattr(ingest_pipeline, "user_ingest_lock", connection_lock)
+    with factory() as db:
+        db.add(User(user_id="one", email="one@example.com", hashed_password="x"))
+        db.commit()
+    assert pdf_converter.publish_to_db(generate_cas(folios=2, email="one@example.com"), "one@example.com", 1)
+    with factory() as db:
+        assert db.query(Folio).count() == 2
+    engine.dispose()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def stress_sessions(request, tmp_path, monkeypatch):
+    # The engines keep the default pool (5 + 10 overflow), fewer connections than uploads.
+    if request.param == "sqlite":
+        # A generous busy timeout: SQLite still serialises writers of different users.
+        engine = create_engine(f"sqlite:///{tmp_path / 'stress.db'}",
+                               connect_args={"check_same_thread": False, "timeout": 60})
+    elif TEST_POSTGRES_URL:
+        engine = create_engine(TEST_POSTGRES_URL)
+        Base.metadata.drop_all(engine)
+    else:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    monkeypatch.setattr(pdf_converter, "SessionLocal", factory)
+    yield factory
+    if request.param == "postgresql":
+        Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def test_fifty_concurrent_uploads(stress_sessions):
+    statements = {}
+    with stress_sessions() as db:
+        for u in range(USERS):
+            email = f"stress{u}@example.com"
+            db.add(User(user_id=f"user-{u}", email=email, hashed_password="x", full_name=f"Stress {u}"))
+            statements[email] = generate_cas(folios=3, schemes_per_folio=2, transactions_per_scheme=5,
+                                             seed=u, email=email)
+        db.commit()
+
+    uploads = [email for email in statements for _ in range(UPLOADS_PER_USER)]
+    barrier = threading.Barrier(len(uploads))
+
+    def upload(email):
+        barrier.wait()
+        return pdf_converter.publish_to_db(statements[email], email)
+
+    with ThreadPoolExecutor(max_workers=len(uploads)) as pool:
+        results = list(pool.map(upload, uploads))
+
+    assert all(results)
+    with stress_sessions() as db:
+        for u in range(USERS):
+            user_txns = (
+                db.query(Transaction).join(Scheme).join(Folio)
+                .filter(Folio.user_id == f"user-{u}").count()
+            )
+            # Every upload after the first finds the folios and adds nothing.
+            assert user_txns == 3 * 2 * 5
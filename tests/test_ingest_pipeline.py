@@ -0,0 +1,176 @@
+# File: tests/test_ingest_pipeline.py
+# Tests for the staged ingestion pipeline and its statement sources.
+import json
+from datetime import date, timedelta
+
+import ingest_pipeline
+from ingest_pipeline import (JsonFileSource, STAGES, StatementStream, _index_transactions, ingest,
+                             normalize_statement, transaction_rows, uncovered_ranges)
+from models import Folio, Scheme, SchemeMaster, StatementPeriod, Transaction, Valuation, scheme_metadata
+from synthetic_cas import build_statement, generate_cas, iter_statements, user_portfolio, START, END
+
+EMAIL = "pipeline@example.com"
+
+
+def test_normalize_parses_figures_and_leaves_transactions_for_the_diff():
+    statement = normalize_statement(generate_cas(folios=1, schemes_per_folio=1, transactions_per_scheme=2))
+    scheme = statement["folios"][0]["schemes"][0]
+    assert (statement["from"], statement["to"]) == (START, END)
+    assert isinstance(scheme["close"], float)
+    assert scheme["valuation"]["valuation_date"] == END
+    assert scheme["date_keys"] == [txn["date"] for txn in scheme["transactions"]]
+    assert isinstance(transaction_rows(scheme)[0]["amount"], float)
+
+
+def test_transaction_rows_bisects_inclusive_ranges_in_any_date_layout():
+    scheme = {"transactions": [{"date": d} for d in ("05-Mar-2025", "2025-01-01", "2025-02-01")]}
+    scheme["transactions"], scheme["date_keys"] = _index_transactions(scheme["transactions"])
+    rows = transaction_rows(scheme, date(2025, 2, 1), date(2025, 3, 5))
+    assert [r["transaction_date"] for r in rows] == [date(2025, 2, 1), date(2025, 3, 5)]
+
+
+def test_uncovered_ranges():
+    d = date
+    assert uncovered_ranges(d(2025, 1, 1), d(2025, 3, 31), d(2025, 2, 1), d(2025, 2, 28)) == [
+        (d(2025, 1, 1), d(2025, 1, 31)), (d(2025, 3, 1), d(2025, 3, 31))]
+    assert uncovered_ranges(d(2025, 2, 1), d(2025, 2, 28), d(2025, 1, 1), d(2025, 3, 31)) == []
+
+
+def test_normalize_drops_folios_without_amc_and_schemes_without_codes():
+    data = generate_cas(folios=2, schemes_per_folio=2, transactions_per_scheme=2)
+    data["folios"][0]["amc"] = ""
+    data["folios"][1]["schemes"][0]["isin"] = data["folios"][1]["schemes"][0]["amfi"] = None
+    folios = normalize_statement(data)["folios"]
+    assert [len(f["schemes"]) for f in folios] == [1]
+
+
+def test_json_and_ndjson_sources(tmp_path):
+    statements = [statement for _, statement in iter_statements(users=2, folios=1, transactions_per_scheme=2)]
+    single = tmp_path / "output.json"
+    single.write_text(json.dumps(statements[0]))
+    lines = tmp_path / "statements.ndjson"
+    lines.write_text("".join(json.dumps(s) + "\n" for s in statements))
+
+    assert [email for email, _, _ in JsonFileSource(str(single), EMAIL)] == [EMAIL]
+    assert [email for email, _, _ in JsonFileSource(str(lines))] == [
+        s["investor_info"]["email"] for s in statements
+    ]
+
+
+def test_statement_stream_ingests_every_user_and_times_each_stage(sqlite_sessions, make_user):
+    stream = list(iter_statements(users=3, folios=2, schemes_per_folio=2, transactions_per_scheme=4))
+    for email, _ in stream:
+        make_user(email)
+    report = ingest(StatementStream(stream), sqlite_sessions)
+    assert (report["statements"], report["failed"]) == (3, 0)
+    assert set(report["seconds"]) == set(STAGES)
+    with sqlite_sessions() as db:
+        assert db.query(Folio).count() == 3 * 2
+        assert db.query(Transaction).count() == 3 * 2 * 2 * 4
+
+
+def test_unknown_user_fails_without_writing(sqlite_sessions):
+    report = ingest(StatementStream([generate_cas(folios=1)], email=EMAIL), sqlite_sessions)
+    assert report["failed"] == 1
+    with sqlite_sessions() as db:
+        assert db.query(Folio).count() == 0
+
+
+def test_database_errors_stay_out_of_the_progress_stream(sqlite_sessions, make_user, monkeypatch, caplog):
+    from ingest_progress import ProgressChannel, reporting_to
+
+    def failing(session, *args):
+        raise RuntimeError("INSERT INTO folio (pan) VALUES ('ABCDE1234F') failed")
+
+    make_user(EMAIL)
+    monkeypatch.setattr(ingest_pipeline, "publish_folios", failing)
+    channel = ProgressChannel("job")
+    with reporting_to(channel):
+        assert ingest(StatementStream([generate_cas(folios=1)], email=EMAIL), sqlite_sessions)["failed"] == 1
+    assert channel.messages()[-1] == "Could not store the statement."
+    assert not any("ABCDE1234F" in message for message in channel.messages())
+    assert "ABCDE1234F" in caplog.text  # still in the server log
+
+
+def test_later_statement_adds_new_transactions_and_valuation(sqlite_sessions, make_user):
+    make_user(EMAIL)
+    portfolio = user_portfolio(0, 0, 1, 2, 12, START, END)
+    # Cut off on a transaction date: that transaction belongs to the first statement only.
+    middle = portfolio["folios"][0]["schemes"][0][1][6][0]
+    first = build_statement(portfolio, START, middle)
+    ingest(StatementStream([first, build_statement(portfolio, START, END)], email=EMAIL), sqlite_sessions)
+
+    with sqlite_sessions() as db:
+        stored = sorted((t.scheme_id, t.transaction_date) for t in db.query(Transaction))
+        assert len(stored) == len(set(stored)) == 2 * 12
+        assert {v.valuation_date for v in db.query(Valuation)} == {END}
+
+
+def test_overlapping_statements_store_every_transaction_once(sqlite_sessions, make_user):
+    statements = list(iter_statements(users=1, folios=4, schemes_per_folio=2, transactions_per_scheme=24,
+                                      statements=3))
+    make_user(statements[0][0])
+    report = ingest(StatementStream(statements), sqlite_sessions, chunk_size=3)
+    assert report["failed"] == 0
+    with sqlite_sessions() as db:
+        stored = [(t.scheme_id, t.transaction_date) for t in db.query(Transaction)]
+        assert len(stored) == len(set(stored)) == 4 * 2 * 24
+        assert db.query(StatementPeriod).count() == 1
+
+
+def test_folio_missing_from_a_statement_keeps_its_period(sqlite_sessions, make_user):
+    make_user(EMAIL)
+    portfolio = user_portfolio(0, 0, 2, 1, 12, START, END)
+    middle = START + timedelta(days=1500)
+    first = build_statement(portfolio, START, middle)
+    only_first_folio = build_statement(portfolio, START, END)
+    only_first_folio["folios"] = only_first_folio["folios"][:1]
+    ingest(StatementStream([first, only_first_folio, build_statement(portfolio, START, END)], email=EMAIL),
+           sqlite_sessions)
+    with sqlite_sessions() as db:
+        assert db.query(Transaction).count() == 2 * 12
+        assert {(sp.from_date, sp.to_date) for sp in db.query(StatementPeriod)} == {(START, END)}
+
+
+def test_update_only_converts_the_new_transactions(sqlite_sessions, make_user, monkeypatch):
+    make_user(EMAIL)
+    portfolio = user_portfolio(0, 0, 4, 2, 240, date(2005, 1, 1), END)
+    last_quarter = END - timedelta(days=90)
+    ingest(StatementStream([build_statement(portfolio, date(2005, 1, 1), last_quarter)], email=EMAIL),
+           sqlite_sessions)
+
+    parsed = []
+    real_parse_date = ingest_pipeline.parse_date
+    monkeypatch.setattr(ingest_pipeline, "parse_date", lambda value: parsed.append(value) or real_parse_date(value))
+    update = build_statement(portfolio, date(2005, 1, 1), END)
+    ingest(StatementStream([update], email=EMAIL), sqlite_sessions)
+
+    new = sum(1 for f in update["folios"] for s in f["schemes"] for t in s["transactions"]
+              if t["date"] > last_quarter.isoformat())
+    valuations = 4 * 2
+    assert new and len(parsed) == 2 + valuations + new
+    with sqlite_sessions() as db:
+        assert db.query(Transaction).count() == 4 * 2 * 240
+
+
+def test_schemes_without_master_data_keep_their_metadata(sqlite_sessions, make_user):
+    make_user(EMAIL)
+    statement = generate_cas(folios=1, schemes_per_folio=2, email=EMAIL)
+    no_isin, unknown_isin = statement["folios"][0]["schemes"]
+    no_isin.update(isin=None, amfi="999999", rta_code="X1", rta="KFINTECH", type="DEBT")
+    unknown_isin.update(isin="INFUNKNOWN01", amfi="999998")
+    ingest(StatementStream([statement], email=EMAIL), sqlite_sessions)
+
+    with sqlite_sessions() as db:
+        stored = {scheme.scheme_name: scheme for scheme in db.query(Scheme)}
+        without = stored[no_isin["scheme"]]
+        assert without.master is None
+        assert (without.amfi_code, without.rta, without.rta_code, without.scheme_type) == \
+            ("999999", "KFINTECH", "X1", "DEBT")
+        assert stored[unknown_isin["scheme"]].amfi_code == "999998"  # from the statement, via the master
+        codes = (
+            db.query(Scheme.scheme_name, scheme_metadata("amfi_code"))
+            .outerjoin(SchemeMaster, Scheme.isin == SchemeMaster.isin)
+            .all()
+        )
+        assert dict(codes) == {no_isin["scheme"]: "999999", unknown_isin["scheme"]: "999998"}
@@ -0,0 +1,146 @@
+# File: tests/test_ingest_progress.py
+# Per-upload progress channels and their Server-Sent Events stream.
+import json
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ingest_progress
+import main
+import routes.pdf_converter
+from ingest_progress import ProgressChannel, StoredChannel, report, reporting_to, start_job
+from synthetic_cas import generate_cas
+
+EMAIL = "progress@example.com"
+
+
+@pytest.fixture(autouse=True)
+def fresh_jobs(monkeypatch):
+    monkeypatch.setattr(ingest_progress, "_jobs", ingest_progress.OrderedDict())
+    monkeypatch.setattr(ingest_progress, "_writer", ingest_progress._EventWriter())
+    monkeypatch.setattr(main, "request_counts", defaultdict(list))
+    yield
+    assert ingest_progress.flush_events()
+
+
+def in_another_worker(monkeypatch):
+    """Forgets this worker's jobs, as if the next request went to another worker."""
+    assert ingest_progress.flush_events()
+    monkeypatch.setattr(ingest_progress, "_jobs", ingest_progress.OrderedDict())
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+        if "event" in fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_channel_keeps_the_latest_events():
+    channel = ProgressChannel("job", max_events=3)
+    for i in range(5):
+        channel.publish("commit", f"batch {i}")
+    assert [event["id"] for event in channel.since()] == [3, 4, 5]
+    assert channel.messages() == ["batch 2", "batch 3", "batch 4"]
+    assert [event["id"] for event in channel.since(4)] == [5]
+
+
+def test_nothing_is_published_after_the_terminal_event():
+    channel = ProgressChannel("job")
+    channel.publish("done", "Statement stored")
+    assert channel.finished
+    assert channel.publish("commit", "late") == {}
+    assert channel.messages() == ["Statement stored"]
+
+
+def test_report_goes_to_the_channel_of_the_current_block():
+    channel = ProgressChannel("job")
+    report("parse", "no channel, dropped")
+    with reporting_to(channel):
+        report("commit", "Committed folios 1-2 of 4", folios_committed=2, folios_total=4)
+    report("parse", "dropped again")
+    assert channel.since() == [dict(channel.since()[0], event="commit", folios_committed=2, folios_total=4)]
+
+
+def test_retried_upload_attaches_to_the_running_job(sqlite_sessions):
+    channel, created = start_job(EMAIL, "hash")
+    assert created
+    assert start_job(EMAIL, "hash") == (channel, False)
+    assert start_job("other@example.com", "hash")[1]
+    channel.publish("done", "Statement stored")
+    again, created = start_job(EMAIL, "hash")
+    assert created and again is not channel
+    assert ingest_progress.get_job(channel.job_id) is channel  # kept for reconnecting clients
+
+
+def test_stream_resumes_after_last_event_id(sqlite_sessions):
+    channel = ProgressChannel("job")
+    for kind in ("parse", "commit", "done"):
+        channel.publish(kind, kind)
+    client = TestClient(main.app)
+    ingest_progress._jobs["job"] = channel
+    response = client.get("/uploads/job/events", headers={"Last-Event-ID": "1"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [(i, kind) for i, kind, _ in parse_sse(response.text)] == [(2, "commit"), (3, "done")]
+    assert client.get("/uploads/unknown/events").status_code == 404
+
+
+class StubPdfSource:
+    def __init__(self, path, password, email):
+        self.email = email
+
+    def read(self):
+        return generate_cas(folios=5, email=self.email)
+
+
+def test_upload_streams_batch_commits(tmp_path, monkeypatch, sqlite_sessions, make_user):
+    make_user(EMAIL)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(routes.pdf_converter, "CasPdfSource", StubPdfSource)
+    monkeypatch.setattr(routes.pdf_converter, "INGEST_CHUNK_FOLIOS", 2)
+    client = TestClient(main.app)
+
+    response = client.post("/uploads", files={"file": ("cas.pdf", b"%PDF-1.4 stub")},
+                           data={"password": "secret", "email": EMAIL})
+    assert response.status_code == 202
+    job = response.json()
+    events = parse_sse(client.get(job["events"]).text)
+
+    ids = [i for i, _, _ in events]
+    assert ids == sorted(ids)
+    commits = [data for _, kind, data in events if kind == "commit"]
+    assert [data["folios_committed"] for data in commits] == [2, 4, 5]
+    assert all(data["folios_total"] == 5 for data in commits)
+    assert events[-1][1] == "done"
+
+
+def test_other_workers_stream_and_reuse_the_job(sqlite_sessions, monkeypatch):
+    channel, _ = start_job(EMAIL, "hash")
+    channel.publish("parse", "Reading the CAS PDF")
+    channel.publish("commit", "Committed folios 1-2 of 4", folios_committed=2, folios_total=4)
+    in_another_worker(monkeypatch)
+
+    running, created = start_job(EMAIL, "hash")
+    assert not created and isinstance(running, StoredChannel) and running.job_id == channel.job_id
+    client = TestClient(main.app)
+    ingest_progress._jobs[channel.job_id] = channel  # back in the worker running the job
+    channel.publish("done", "Statement stored")
+    in_another_worker(monkeypatch)
+    response = client.get(f"/uploads/{channel.job_id}/events", headers={"Last-Event-ID": "1"})
+    assert [(i, kind) for i, kind, _ in parse_sse(response.text)] == [(2, "commit"), (3, "done")]
+    assert start_job(EMAIL, "hash")[1]
+
+
+def test_job_of_a_dead_worker_is_failed(sqlite_sessions, monkeypatch):
+    channel, _ = start_job(EMAIL, "hash")
+    channel.publish("parse", "Reading the CAS PDF")
+    in_another_worker(monkeypatch)
+    monkeypatch.setattr(ingest_progress, "PROGRESS_STALE_SECONDS", -1.0)
+
+    again, created = start_job(EMAIL, "hash")
+    assert created and again.job_id != channel.job_id
+    events = StoredChannel(channel.job_id).since()
+    assert [event["event"] for event in events] == ["parse", "failed"]
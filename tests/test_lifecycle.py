@@ -0,0 +1,56 @@
+# File: tests/test_lifecycle.py
+import threading
+import time
+
+from lifecycle import InFlightTracker
+
+
+def test_drain_waits_for_running_work():
+    tracker = InFlightTracker("ingestion")
+    started = threading.Event()
+
+    def work():
+        started.set()
+        time.sleep(0.2)
+        return "done"
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(tracker.call(work)))
+    thread.start()
+    started.wait()
+    assert tracker.active == 1
+    assert tracker.drain(timeout=5) is True
+    assert tracker.draining and tracker.active == 0
+    assert results == ["done"]
+    thread.join()
+
+
+def test_drain_gives_up_after_timeout():
+    tracker = InFlightTracker("ingestion")
+    with tracker.track():
+        assert tracker.drain(timeout=0.05) is False
+    assert tracker.active == 0
+
+
+def test_gunicorn_waits_for_the_whole_shutdown(monkeypatch):
+    import runpy
+    from pathlib import Path
+
+    import db
+
+    monkeypatch.setenv("GRACEFUL_TIMEOUT", "30")
+    monkeypatch.setenv("INGESTION_DRAIN_TIMEOUT", "90")
+    config = runpy.run_path(str(Path(__file__).parents[1] / "gunicorn.conf.py"))
+    assert config["graceful_timeout"] > 30 + 90
+
+    disposed = []
+
+    class Engine:
+        def dispose(self, close=True):
+            disposed.append((self, close))
+
+    writer, replica = Engine(), Engine()
+    monkeypatch.setattr(db, "engine", writer)
+    monkeypatch.setattr(db, "read_engines", [replica])
+    config["post_fork"](None, None)
+    assert disposed == [(writer, False), (replica, False)]
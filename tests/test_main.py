@@ -23,3 +23,18 @@ def test_register_and_login():
     assert login_response.status_code == 200, login_response.text
     token_data = login_response.json()
     assert "access_token" in token_data
+
+def test_index_is_cached_with_etag():
+    first = client.get("/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert client.get("/").content == first.content
+
+    not_modified = client.get("/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+
+def test_upload_result_escapes_messages():
+    from routes.pdf_converter import process_log_messages
+    html = process_log_messages(["<script>alert(1)</script>"])
+    assert "<script>alert(1)</script>" not in html
+    assert "&lt;script&gt;" in html
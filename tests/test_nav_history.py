@@ -0,0 +1,65 @@
+# File: tests/test_nav_history.py
+# Tests for parsing AMFI NAV dumps and as-of lookups in the columnar NAV store.
+from datetime import date
+
+import numpy as np
+
+from nav_history import NavStore, parse_amfi_nav_file, bulk_load
+
+DAILY_DUMP = """Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date
+
+Open Ended Schemes(Equity Scheme - Large Cap Fund)
+
+Aditya Birla Sun Life Mutual Fund
+
+146407;INF209KB1E84;-;ABSL Bal Bhavishya Yojna Direct Growth;19.41;14-Feb-2025
+119551;INF209KA12Z1;INF209KA13Z9;ABSL Banking & PSU Debt Fund - DIRECT - IDCW;N.A.;14-Feb-2025
+"""
+
+HISTORY_DUMP = """Scheme Code;Scheme Name;ISIN Div Payout/ISIN Growth;ISIN Div Reinvestment;Net Asset Value;Repurchase Price;Sale Price;Date
+146407;ABSL Bal Bhavishya Yojna Direct Growth;INF209KB1E84;;10.00;;;11-Feb-2019
+146407;ABSL Bal Bhavishya Yojna Direct Growth;INF209KB1E84;;15.20;;;03-Jan-2022
+119551;ABSL Banking & PSU Debt Fund - DIRECT - IDCW;INF209KA12Z1;;101.5;;;03-Jan-2022
+"""
+
+
+def test_parse_both_layouts(tmp_path):
+    daily = tmp_path / "NAVAll.txt"
+    daily.write_text(DAILY_DUMP)
+    codes, days, navs = parse_amfi_nav_file(str(daily))
+    assert codes.tolist() == [146407]
+    assert days.tolist() == [date(2025, 2, 14).toordinal()]
+    assert navs.tolist() == [19.41]
+
+    history = tmp_path / "history.txt"
+    history.write_text(HISTORY_DUMP)
+    codes, _, navs = parse_amfi_nav_file(str(history))
+    assert codes.tolist() == [146407, 146407, 119551]
+    assert navs.tolist() == [10.0, 15.2, 101.5]
+
+
+def test_as_of_lookup_after_bulk_load(tmp_path):
+    (tmp_path / "a.txt").write_text(HISTORY_DUMP)
+    (tmp_path / "b.txt").write_text(DAILY_DUMP)
+    store_path = str(tmp_path / "store")
+    bulk_load([str(tmp_path / "a.txt"), str(tmp_path / "b.txt")], store_path)
+    store = NavStore.load(store_path)
+    assert len(store) == 4
+
+    navs, nav_days = store.as_of(
+        [146407, 146407, 146407, 119551, 999999],
+        [date(2019, 2, 10), date(2020, 6, 1), date(2025, 3, 1), date(2025, 3, 1), date(2025, 3, 1)],
+    )
+    assert np.isnan(navs[0]) and nav_days[0] == -1
+    assert navs[1] == 10.0
+    assert navs[2] == 19.41
+    assert navs[3] == 101.5
+    assert np.isnan(navs[4])
+
+
+def test_merge_prefers_newer_rows():
+    store = NavStore([1, 1], [100, 200], [1.0, 2.0])
+    store = store.merge(np.array([1]), np.array([200]), np.array([2.5]))
+    assert len(store) == 2
+    navs, _ = store.as_of([1], [250])
+    assert navs[0] == 2.5
@@ -0,0 +1,119 @@
+# File: tests/test_pdf_workers.py
+# PDF parser subprocesses: limits, crash containment and recycling. The jobs below are
+# module-level so the spawned parsers can import them.
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from pdf_workers import ParserPool, PdfParseCrashed, PdfParseError, PdfParseTimeout
+
+
+def pid():
+    return os.getpid()
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+
+def spin():
+    while True:
+        pass
+
+
+def allocate(megabytes):
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def burn(seconds):
+    """Uses `seconds` of CPU time, so the next job's CPU limit must be set higher."""
+    until = time.process_time() + seconds
+    while time.process_time() < until:
+        pass
+    return os.getpid()
+
+
+def crash():
+    os._exit(3)
+
+
+def fail():
+    raise ValueError("not a CAS statement")
+
+
+@pytest.fixture
+def pool():
+    pool = ParserPool(size=1, timeout=5, cpu_seconds=1, memory_mb=1024, jobs_per_worker=3)
+    yield pool
+    pool.close()
+
+
+def test_parsers_are_reused_then_recycled(pool):
+    pids = [pool.run(pid) for _ in range(4)]
+    assert pids[0] != os.getpid()
+    assert pids[0] == pids[1] == pids[2] != pids[3]
+    assert pool.stats()["parsers_started"] == 2
+
+
+def test_failures_are_contained(pool):
+    with pytest.raises(PdfParseError, match="not a CAS statement"):
+        pool.run(fail)
+    with pytest.raises(PdfParseCrashed, match="exit code 3"):
+        pool.run(crash)
+    with pytest.raises(PdfParseCrashed, match="CPU time limit"):
+        pool.run(spin)
+    with pytest.raises(PdfParseError, match="out of memory"):
+        pool.run(allocate, 2048)
+    assert pool.run(allocate, 16) == 16 * 1024 * 1024
+
+    stats = pool.stats()
+    assert (stats["ok"], stats["failed"], stats["crashed"], stats["timeout"]) == (1, 2, 2, 0)
+    assert stats["failure_rate"] == 0.8 and stats["p50_seconds"] is not None
+
+
+def test_slow_parse_is_killed():
+    pool = ParserPool(size=1, timeout=0.5, cpu_seconds=0, memory_mb=0)
+    try:
+        started = time.monotonic()
+        with pytest.raises(PdfParseTimeout):
+            pool.run(sleep, 30)
+        assert time.monotonic() - started < 10
+        assert pool.run(pid) != os.getpid()
+        assert pool.stats()["timeout"] == 1
+    finally:
+        pool.close()
+
+
+def test_closed_pool_refuses_jobs(pool):
+    pool.run(pid)
+    pool.close()
+    with pytest.raises(PdfParseError, match="closed"):
+        pool.run(pid)
+
+
+NON_ROOT_SCRIPT = """
+import sys
+sys.path.insert(0, "tests")
+from pdf_workers import ParserPool
+from test_pdf_workers import burn
+pool = ParserPool(size=1, timeout=30, cpu_seconds=5, memory_mb=1024, jobs_per_worker=10)
+print(len({pool.run(burn, 1.2) for _ in range(3)}))
+pool.close()
+"""
+
+
+def test_parsers_are_reused_without_root():
+    # Raising a hard rlimit needs CAP_SYS_RESOURCE. As root, drop it, as an unprivileged user would lack it.
+    command = [sys.executable, "-c", NON_ROOT_SCRIPT]
+    if os.geteuid() == 0:
+        if shutil.which("setpriv") is None:
+            pytest.skip("setpriv is needed to drop CAP_SYS_RESOURCE")
+        command = ["setpriv", "--bounding-set", "-sys_resource"] + command
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(command, cwd=root, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-1] == "1"  # all three jobs ran in the same parser
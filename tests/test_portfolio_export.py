@@ -0,0 +1,90 @@
+# File: tests/test_portfolio_export.py
+# Tests for the streaming portfolio export.
+import csv
+import io
+import json
+from collections import Counter, defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from db import get_db
+from ingest_pipeline import StatementStream, ingest
+from models import Folio, Scheme, StatementPeriod, Transaction, Valuation
+from portfolio_export import CSV_COLUMNS, export_stream
+from synthetic_cas import iter_statements
+
+EMAIL = "export@example.com"
+
+
+@pytest.fixture
+def client(sqlite_sessions, monkeypatch):
+    def override_get_db():
+        db = sqlite_sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(main, "request_counts", defaultdict(list))
+    main.app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture
+def user_id(sqlite_sessions, make_user):
+    user_id = make_user(EMAIL)
+    statements = iter_statements(users=1, folios=3, schemes_per_folio=2, transactions_per_scheme=10, statements=2)
+    assert ingest(StatementStream(statements, email=EMAIL), sqlite_sessions)["failed"] == 0
+    return user_id
+
+
+def records(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_ndjson_export_streams_every_record(client, user_id):
+    response = client.get(f"/test/users/{user_id}/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert f"portfolio-{user_id}.ndjson" in response.headers["content-disposition"]
+    counts = Counter(record["type"] for record in records(response.text))
+    assert counts == {"folio": 3, "scheme": 6, "valuation": 6, "transaction": 3 * 2 * 10}
+
+
+def test_csv_export_has_one_row_per_transaction(client, user_id):
+    response = client.get(f"/test/users/{user_id}/export", params={"format": "csv"})
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert tuple(rows[0]) == CSV_COLUMNS
+    assert len(rows) == 1 + 3 * 2 * 10
+    assert all(row[0] and row[6] for row in rows[1:])
+
+
+def test_unknown_user_and_format(client, sqlite_sessions):
+    assert client.get("/test/users/nobody/export").status_code == 404
+    assert client.get("/test/users/nobody/export", params={"format": "xml"}).status_code == 422
+
+
+def test_output_is_sent_in_batches(sqlite_sessions, user_id):
+    bind = sqlite_sessions.kw["bind"]
+    chunks = list(export_stream(bind, user_id, "ndjson", batch_rows=8))
+    assert len(chunks) == -(-(3 + 6 + 6 + 60) // 8)
+
+
+def test_cas_export_round_trips_through_the_pipeline(client, sqlite_sessions, user_id):
+    def without_ids(text):
+        return [{k: v for k, v in r.items() if k not in ("id", "scheme_id")} for r in records(text)]
+
+    before = client.get(f"/test/users/{user_id}/export").text
+    statement = json.loads(client.get(f"/test/users/{user_id}/export", params={"format": "cas"}).text)
+    assert statement["investor_info"]["email"] == EMAIL
+
+    with sqlite_sessions() as db:
+        for model in (Transaction, Valuation, Scheme, Folio, StatementPeriod):
+            db.query(model).delete()
+        db.commit()
+    assert ingest(StatementStream([statement], email=EMAIL), sqlite_sessions)["failed"] == 0
+
+    assert without_ids(client.get(f"/test/users/{user_id}/export").text) == without_ids(before)
@@ -0,0 +1,68 @@
+# File: tests/test_portfolio_history.py
+# Tests for the incremental portfolio time-series computation.
+from datetime import date, timedelta
+
+import numpy as np
+
+from models import PortfolioHistory
+from portfolio_history import compute_history, get_portfolio_history
+from routes.pdf_converter import publish_to_db
+from synthetic_cas import generate_cas
+
+TRANSACTIONS = [
+    (0, date(2024, 1, 1), 100.0, 100.0, 10.0, 1000.0, "PURCHASE"),
+    (0, date(2024, 1, 1), None, None, None, 0.05, "STAMP_DUTY_TAX"),
+    (1, date(2024, 1, 5), 50.0, 50.0, 20.0, 1000.0, "PURCHASE_SIP"),
+    (0, date(2024, 2, 1), -40.0, 60.0, 12.5, -500.0, "REDEMPTION"),
+    (1, date(2024, 3, 1), 40.0, 90.0, 25.0, 1000.0, "PURCHASE_SIP"),
+]
+VALUATIONS = [(0, date(2024, 3, 10), 13.0), (1, date(2024, 3, 10), 26.0)]
+
+
+def full_run(end):
+    return compute_history(
+        date(2024, 1, 1), end, [None, None], [0.0, 0.0], [np.nan, np.nan], 0.0, TRANSACTIONS, VALUATIONS
+    )
+
+
+def test_values_follow_units_and_navs():
+    days, values, invested = full_run(date(2024, 3, 10))
+    by_day = dict(zip((date.fromordinal(int(d)) for d in days), zip(values, invested)))
+    assert by_day[date(2024, 1, 1)] == (1000.0, 1000.0)
+    assert by_day[date(2024, 1, 6)] == (100 * 10.0 + 50 * 20.0, 2000.0)
+    assert by_day[date(2024, 2, 1)] == (60 * 12.5 + 50 * 20.0, 1500.0)
+    assert by_day[date(2024, 3, 10)] == (60 * 13.0 + 90 * 26.0, 2500.0)
+
+
+def test_tail_from_opening_state_matches_full_run():
+    end = date(2024, 3, 10)
+    days, values, invested = full_run(end)
+    split = date(2024, 2, 15)
+    i = int(split.toordinal() - days[0])
+    tail = [t for t in TRANSACTIONS if t[1] >= split]
+    tail_days, tail_values, tail_invested = compute_history(
+        split, end, [None, None], [60.0, 50.0], [12.5, 20.0], invested[i - 1], tail, VALUATIONS
+    )
+    assert tail_days[0] == split.toordinal()
+    np.testing.assert_allclose(tail_values, values[i:])
+    np.testing.assert_allclose(tail_invested, invested[i:])
+
+
+def test_reading_the_history_writes_nothing(sqlite_sessions, make_user):
+    email = "history@example.com"
+    user_id = make_user(email)
+    assert publish_to_db(generate_cas(folios=2, email=email), email)  # stores the series up to today
+
+    def points(rows):
+        return [(row.history_date, round(row.portfolio_value, 2), round(row.invested, 2)) for row in rows]
+
+    with sqlite_sessions() as db:
+        stored = points(get_portfolio_history(db, user_id))
+        cutoff = stored[-30][0]
+        db.query(PortfolioHistory).filter(PortfolioHistory.history_date >= cutoff).delete()
+        db.commit()  # as if the last upload was 30 days ago
+
+    with sqlite_sessions() as db:
+        assert points(get_portfolio_history(db, user_id)) == stored
+        assert not db.new and not db.dirty
+        assert db.query(PortfolioHistory).filter(PortfolioHistory.user_id == user_id).count() == len(stored) - 30
@@ -0,0 +1,80 @@
+# File: tests/test_profiler.py
+# Tests for the opt-in sampling profiler.
+import os
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiler
+from profiler import ProfilingMiddleware, SamplingProfiler
+
+
+def busy_work(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def test_sampler_records_folded_stacks(tmp_path):
+    sampler = SamplingProfiler(interval=0.001).start()
+    worker = threading.Thread(target=busy_work, args=(0.2,), name="busy")
+    worker.start()
+    worker.join()
+    samples = sampler.stop()
+    busy = [stack for stack in samples if stack.startswith("busy;") and "busy_work (test_profiler.py:" in stack]
+    assert busy
+    path = sampler.write_folded(str(tmp_path / "out.folded"))
+    lines = open(path).read().splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def make_app():
+    from routes.admin import router
+
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        busy_work(0.05)
+        return {"ok": True}
+
+    app.include_router(router)
+    app.add_middleware(ProfilingMiddleware)
+    return TestClient(app)
+
+
+def test_request_is_profiled_only_with_the_token(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILER_TOKEN", "secret")
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    client = make_app()
+
+    assert "x-profile-file" not in client.get("/slow").headers
+    assert "x-profile-file" not in client.get("/slow", headers={"X-Profile": "wrong"}).headers
+    response = client.get("/slow", headers={"X-Profile": "secret"})
+    assert response.status_code == 200
+    saved = tmp_path / response.headers["x-profile-file"]
+    assert "slow (test_profiler.py:" in saved.read_text()
+
+
+def test_disabled_profiler_hides_admin_endpoint(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILER_TOKEN", "")
+    client = make_app()
+    assert client.post("/admin/profile?seconds=1", headers={"X-Profiler-Token": ""}).status_code == 404
+    assert "x-profile-file" not in client.get("/slow", headers={"X-Profile": ""}).headers
+
+
+def test_time_window_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILER_TOKEN", "secret")
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    client = make_app()
+    response = client.post("/admin/profile?seconds=0.2", headers={"X-Profiler-Token": "secret"})
+    assert response.status_code == 200
+    assert client.post("/admin/profile?seconds=0.2", headers={"X-Profiler-Token": "secret"}).status_code == 409
+    path = tmp_path / response.json()["profile_file"]
+    for _ in range(50):
+        if path.exists() and not profiler._session_lock.locked():
+            break
+        time.sleep(0.05)
+    assert path.exists()
@@ -0,0 +1,94 @@
+# File: tests/test_query_budget.py
+# Query budgets for the main request paths, measured with the db.py statement hooks.
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from auth import create_access_token
+from db import get_db
+from routes.pdf_converter import publish_to_db
+from synthetic_cas import generate_cas
+
+EMAIL = "budget@example.com"
+
+
+@pytest.fixture
+def client(sqlite_sessions, monkeypatch):
+    def override_get_db():
+        db = sqlite_sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(main, "request_counts", defaultdict(list))
+    main.app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture
+def user_id(make_user):
+    user_id = make_user(EMAIL)
+    publish_to_db(generate_cas(folios=4, schemes_per_folio=2, transactions_per_scheme=12, email=EMAIL), EMAIL)
+    return user_id
+
+
+def test_publish_to_db_budget(sqlite_sessions, make_user, query_budget):
+    make_user(EMAIL)
+    statement = generate_cas(folios=4, schemes_per_folio=2, transactions_per_scheme=12, email=EMAIL)
+    with query_budget(90):
+        publish_to_db(statement, EMAIL)
+
+
+def test_portfolio_budget_and_server_timing(client, user_id, query_budget):
+    with query_budget(20) as stats:
+        response = client.get(f"/test/users/{user_id}/portfolio")
+    assert response.status_code == 200
+    assert f'desc="{stats.count} queries"' in response.headers["server-timing"]
+
+
+def test_current_user_budget(client, user_id, query_budget):
+    token = create_access_token({"sub": EMAIL})
+    with query_budget(2):
+        response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+
+
+def test_slow_queries_are_logged_without_parameters(sqlite_sessions, monkeypatch, caplog):
+    import db
+    from sqlalchemy import text
+
+    monkeypatch.setattr(db, "SLOW_QUERY_MS", 0.0)
+    with sqlite_sessions() as session, caplog.at_level("WARNING", logger="SQL"):
+        session.execute(text("SELECT :secret AS value"), {"secret": "ABCDE1234F"}).all()
+    assert "SELECT ? AS value" in caplog.text
+    assert "ABCDE1234F" not in caplog.text
+
+
+def test_query_stats_keep_only_the_slowest_statements():
+    from db import QueryStats
+
+    outer = QueryStats(keep=2)
+    inner = QueryStats(parent=outer, keep=1)
+    for i, elapsed in enumerate([0.3, 0.1, 0.5, 0.2]):
+        inner.record(f"SELECT {i}", elapsed)
+    outer.record("SELECT 4", 0.4)
+    assert (inner.count, round(inner.duration, 3), inner.slowest()) == (4, 1.1, [("SELECT 2", 0.5)])
+    assert (outer.count, round(outer.duration, 3)) == (5, 1.5)
+    assert outer.slowest() == [("SELECT 2", 0.5), ("SELECT 4", 0.4)]
+
+
+def test_failed_statement_does_not_skew_later_timings(sqlite_sessions):
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    with sqlite_sessions() as session:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                session.execute(text("SELECT * FROM no_such_table"))
+            session.rollback()
+        session.execute(text("SELECT 1"))
+        assert session.connection().info["query_start"] == []
@@ -0,0 +1,81 @@
+# File: tests/test_read_replicas.py
+# Read-replica routing, with a second SQLite file standing in for the replica.
+import shutil
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+import db
+import main
+from auth import create_access_token
+from routes.pdf_converter import publish_to_db
+from synthetic_cas import generate_cas
+
+EMAIL = "replica@example.com"
+
+
+@pytest.fixture
+def replica(tmp_path, sqlite_sessions, make_user, monkeypatch):
+    """A replica copied from the writer after the user registered, i.e. before any statement."""
+    user_id = make_user(EMAIL)
+    shutil.copy(tmp_path / "test.db", tmp_path / "replica.db")
+    engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    monkeypatch.setattr(db, "read_engines", [engine])
+    monkeypatch.setattr(db, "_recent_writes", {})
+    assert publish_to_db(generate_cas(folios=2, email=EMAIL), EMAIL)
+    yield user_id
+    engine.dispose()
+
+
+@pytest.fixture
+def client(sqlite_sessions, monkeypatch):
+    def override_get_db():
+        session = sqlite_sessions()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setattr(main, "request_counts", defaultdict(list))
+    main.app.dependency_overrides[db.get_db] = override_get_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.pop(db.get_db, None)
+
+
+def folios(client, user_id, **kwargs):
+    return len(client.get(f"/test/users/{user_id}/portfolio", **kwargs).json()["folios"])
+
+
+def test_reads_stick_to_the_writer_after_an_ingestion(client, replica):
+    assert db.has_recent_write(replica) and db.has_recent_write(EMAIL)
+    assert folios(client, replica) == 2
+
+
+def test_reads_go_to_the_replica_once_the_window_passed(client, replica):
+    db._recent_writes.clear()
+    assert folios(client, replica) == 0  # the replica has not caught up
+
+
+def test_upload_cookie_keeps_other_workers_on_the_writer(client, replica):
+    db._recent_writes.clear()  # as in a worker that did not run the ingestion
+    until = db.mark_recent_write() + 5
+    assert folios(client, replica, headers={"Cookie": f"{db.READ_YOUR_WRITES_COOKIE}={until:.0f}"}) == 2
+    assert folios(client, replica, headers={"Cookie": f"{db.READ_YOUR_WRITES_COOKIE}=1"}) == 0
+
+
+def test_current_user_is_read_by_email(client, replica):
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': EMAIL})}"}
+    assert client.get("/users/me", headers=headers).status_code == 200
+    db._recent_writes.clear()
+    assert client.get("/users/me", headers=headers).status_code == 401  # no folios on the replica yet
+
+
+def test_recent_writes_expire(monkeypatch):
+    monkeypatch.setattr(db, "_recent_writes", {})
+    monkeypatch.setattr(db, "READ_YOUR_WRITES_SECONDS", 0)
+    db.mark_recent_write("user")
+    assert not db.has_recent_write("user")
+    db.mark_recent_write("other")
+    assert "user" not in db._recent_writes
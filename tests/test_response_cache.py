@@ -0,0 +1,109 @@
+# File: tests/test_response_cache.py
+# Versioned response cache of the dashboard reads.
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db
+import main
+import response_cache
+from models import Scheme
+from response_cache import MemoryBackend
+from routes.pdf_converter import clear_database_for_identifier, publish_to_db
+from synthetic_cas import generate_cas
+
+EMAIL = "cache@example.com"
+
+
+@pytest.fixture
+def client(sqlite_sessions, monkeypatch):
+    def override_get_db():
+        session = sqlite_sessions()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setattr(main, "request_counts", defaultdict(list))
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend())
+    monkeypatch.setattr(response_cache, "stats", response_cache.CacheStats())
+    main.app.dependency_overrides[db.get_db] = override_get_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.pop(db.get_db, None)
+
+
+def test_memory_backend_expires_and_evicts(monkeypatch):
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", b"1", ttl=60)
+    backend.set("b", b"2", ttl=60)
+    assert backend.get("a") == b"1"  # now b is the least recently used
+    backend.set("c", b"3", ttl=60)
+    assert backend.get("b") is None and backend.get("a") == b"1"
+    backend.set("d", b"4", ttl=-1)
+    assert backend.get("d") is None
+
+
+def test_portfolio_is_served_from_cache_until_the_next_upload(client, sqlite_sessions, make_user, query_budget):
+    user_id = make_user(EMAIL)
+    assert publish_to_db(generate_cas(folios=2, email=EMAIL, seed=1), EMAIL)
+    first = client.get(f"/test/users/{user_id}/portfolio")
+    assert len(first.json()["folios"]) == 2
+
+    with query_budget(1):  # only the version check
+        again = client.get(f"/test/users/{user_id}/portfolio")
+    assert again.content == first.content and again.headers["etag"] == first.headers["etag"]
+
+    assert publish_to_db(generate_cas(folios=3, email=EMAIL, seed=2), EMAIL)
+    updated = client.get(f"/test/users/{user_id}/portfolio")
+    assert len(updated.json()["folios"]) == 5
+    assert updated.headers["etag"] != first.headers["etag"]
+    assert response_cache.stats.snapshot()["portfolio"] == {
+        "hits": 1, "misses": 2, "not_modified": 0, "hit_ratio": 0.3333,
+    }
+
+
+def test_unchanged_upload_keeps_the_cache(client, make_user):
+    user_id = make_user(EMAIL)
+    statement = generate_cas(folios=2, email=EMAIL, seed=1)
+    assert publish_to_db(statement, EMAIL)
+    etag = client.get(f"/test/users/{user_id}/portfolio").headers["etag"]
+    assert publish_to_db(statement, EMAIL)  # nothing new to store
+    client.get(f"/test/users/{user_id}/portfolio")
+    assert response_cache.stats.snapshot()["portfolio"]["hits"] == 1
+    assert client.get(f"/test/users/{user_id}/portfolio").headers["etag"] == etag
+
+
+def test_if_none_match_returns_304(client, sqlite_sessions, make_user):
+    user_id = make_user(EMAIL)
+    assert publish_to_db(generate_cas(folios=1, email=EMAIL), EMAIL)
+    with sqlite_sessions() as session:
+        scheme_id = session.query(Scheme.id).first()[0]
+    first = client.get(f"/test/schemes/{scheme_id}")
+    assert first.json()["transactions"]
+    response = client.get(f"/test/schemes/{scheme_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert response.status_code == 304 and response.content == b""
+    assert response_cache.stats.snapshot()["scheme"]["not_modified"] == 1
+
+
+def test_cleared_user_is_not_served_from_cache(client, sqlite_sessions, make_user):
+    user_id = make_user(EMAIL)
+    assert publish_to_db(generate_cas(folios=1, email=EMAIL), EMAIL)
+    assert client.get(f"/test/users/{user_id}/portfolio").status_code == 200
+    with sqlite_sessions() as session:
+        clear_database_for_identifier(session, user_id)
+    assert client.get(f"/test/users/{user_id}/portfolio").status_code == 404
+
+
+def test_xirr_follows_the_data_version(client, sqlite_sessions, make_user):
+    user_id = make_user(EMAIL)
+    assert publish_to_db(generate_cas(folios=1, email=EMAIL, seed=1), EMAIL)
+    first = client.get(f"/test/users/{user_id}/xirr")
+    assert client.get(f"/test/users/{user_id}/xirr").content == first.content
+
+    # Written by another worker: nothing in this process is told about the upload.
+    assert publish_to_db(generate_cas(folios=2, email=EMAIL, seed=2), EMAIL)
+    updated = client.get(f"/test/users/{user_id}/xirr")
+    assert len(updated.json()["schemes"]) > len(first.json()["schemes"])
+    assert response_cache.stats.snapshot()["xirr"]["hits"] == 1
+    assert client.get("/test/users/unknown/xirr").status_code == 404
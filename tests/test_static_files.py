@@ -0,0 +1,56 @@
+# File: tests/test_static_files.py
+# Tests for pre-compressed, cache-friendly static file serving.
+import gzip
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from fastapi.testclient import TestClient
+
+from static_files import PrecompressedStaticFiles, precompress_directory, accepted_encodings
+
+BUNDLE = "console.log('hello');\n" * 500
+
+
+def make_client(tmp_path):
+    (tmp_path / "index-BUcxxRSq.js").write_text(BUNDLE)
+    (tmp_path / "app.js").write_text(BUNDLE)
+    precompress_directory(str(tmp_path))
+    app = Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=str(tmp_path)))])
+    return TestClient(app)
+
+
+def test_accept_encoding_parsing():
+    assert accepted_encodings("gzip, deflate, br") == ["gzip", "deflate", "br"]
+    assert accepted_encodings("br;q=0, gzip;q=0.5") == ["gzip"]
+
+
+def test_serves_precompressed_variant(tmp_path):
+    client = make_client(tmp_path)
+    assert (tmp_path / "app.js.gz").exists()
+
+    response = client.get("/static/app.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"].startswith("text/javascript") or "javascript" in response.headers["content-type"]
+    assert response.text == BUNDLE  # decoded transparently by the client
+    assert int(response.headers["content-length"]) == len(gzip.compress(BUNDLE.encode(), 9, mtime=0))
+
+    identity = client.get("/static/app.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] != response.headers["etag"]
+
+
+def test_fingerprinted_assets_are_immutable_and_revalidate(tmp_path):
+    client = make_client(tmp_path)
+    hashed = client.get("/static/index-BUcxxRSq.js", headers={"Accept-Encoding": "gzip"})
+    assert "immutable" in hashed.headers["cache-control"]
+    plain = client.get("/static/app.js")
+    assert plain.headers["cache-control"] == "no-cache"
+
+    cached = client.get(
+        "/static/index-BUcxxRSq.js",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": hashed.headers["etag"]},
+    )
+    assert cached.status_code == 304
+    assert cached.content == b""
@@ -0,0 +1,46 @@
+# File: tests/test_synthetic_cas.py
+# Tests for the synthetic CAS generator used by benchmarks and scale tests.
+from routes.pdf_converter import parse_date
+from synthetic_cas import bulk_load, iter_statements, statement_windows, user_portfolio, START, END
+
+
+def test_generation_is_deterministic_per_user():
+    first = list(iter_statements(users=3, statements=2, seed=7))
+    again = list(iter_statements(users=3, statements=2, seed=7))
+    assert first == again
+    # A user does not depend on how many users come before it.
+    assert user_portfolio(7, 2, 4, 2, 24) == user_portfolio(7, 2, 4, 2, 24)
+    assert list(iter_statements(users=1, seed=8)) != list(iter_statements(users=1, seed=7))
+
+
+def test_statements_overlap_and_cover_the_history():
+    windows = statement_windows(START, END, 3)
+    assert windows[0][0] == START and windows[-1][1] == END
+    for (_, prev_to), (next_from, _) in zip(windows, windows[1:]):
+        assert next_from < prev_to
+
+    statements = [s for _, s in iter_statements(users=1, statements=3, seed=1)]
+    seen = set()
+    for statement in statements:
+        period_from = parse_date(statement["statement_period"]["from"])
+        period_to = parse_date(statement["statement_period"]["to"])
+        for folio in statement["folios"]:
+            for scheme in folio["schemes"]:
+                for txn in scheme["transactions"]:
+                    assert period_from <= parse_date(txn["date"]) <= period_to
+                    seen.add((folio["folio"], scheme["isin"], txn["date"], txn["units"]))
+    assert len(seen) == 4 * 2 * 24
+
+
+def test_bulk_load_streams_into_the_database(sqlite_sessions):
+    from models import Folio, SchemeMaster, Transaction, User, Valuation
+
+    loaded = bulk_load(sqlite_sessions, users=5, folios=2, schemes_per_folio=2, transactions_per_scheme=10,
+                       seed=3, batch_size=50)
+    assert loaded == 5 * 2 * 2 * 10
+    with sqlite_sessions() as db:
+        assert db.query(User).count() == 5
+        assert db.query(Folio).count() == 10
+        assert db.query(Transaction).count() == loaded
+        assert db.query(Valuation).count() == 20
+        assert db.query(SchemeMaster).count() <= 20
@@ -0,0 +1,65 @@
+# File: tests/test_transaction_partitioning.py
+# The scheme-keyed transaction layout: index, NOT NULL scheme_id and per-user deletes by scheme id.
+import importlib.util
+from pathlib import Path
+
+import pytest
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+
+from ingest_pipeline import StatementStream, ingest
+from models import Folio, Scheme, Transaction, User
+from routes.pdf_converter import clear_database_for_identifier
+from synthetic_cas import iter_statements
+
+
+def test_transaction_table_is_indexed_by_scheme_and_date(sqlite_sessions):
+    with sqlite_sessions() as db:
+        indexes = inspect(db.get_bind()).get_indexes("transaction")
+        columns = {c["name"]: c for c in inspect(db.get_bind()).get_columns("transaction")}
+    index = next(i for i in indexes if i["name"] == "ix_transaction_scheme_id_date")
+    assert index["column_names"] == ["scheme_id", "transaction_date"]
+    assert columns["scheme_id"]["nullable"] is False
+
+
+def test_clearing_a_user_deletes_only_their_transactions(sqlite_sessions, make_user):
+    statements = list(iter_statements(users=2, folios=2, schemes_per_folio=2, transactions_per_scheme=5))
+    for email, _ in statements:
+        make_user(email)
+    assert ingest(StatementStream(statements), sqlite_sessions)["failed"] == 0
+
+    with sqlite_sessions() as db:
+        clear_database_for_identifier(db, statements[0][0], "email")
+        kept = db.query(User.email).join(Folio).join(Scheme).join(Transaction).distinct().all()
+        assert kept == [(statements[1][0],)]
+        assert db.query(Transaction).count() == 2 * 2 * 5
+
+
+def run_partition_migration(conn):
+    path = Path(__file__).parents[1] / "alembic" / "versions" / "6f3a8c1d2e75_partition_transaction.py"
+    spec = importlib.util.spec_from_file_location("partition_migration", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with Operations.context(MigrationContext.configure(conn)):
+        migration.upgrade()
+
+
+def test_migration_keeps_transactions_without_a_scheme_unless_told(monkeypatch, caplog):
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE "transaction" (id INTEGER PRIMARY KEY, scheme_id INTEGER, '
+                          'transaction_date DATE, amount FLOAT)'))
+        conn.execute(text('INSERT INTO "transaction" (id, scheme_id) VALUES (1, 7), (2, NULL)'))
+    monkeypatch.delenv("TRANSACTION_DELETE_ORPHANS", raising=False)
+    with engine.begin() as conn, pytest.raises(RuntimeError, match="1 transaction rows have no scheme_id"):
+        run_partition_migration(conn)
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM "transaction"')).scalar() == 2
+
+    monkeypatch.setenv("TRANSACTION_DELETE_ORPHANS", "1")
+    with engine.begin() as conn, caplog.at_level("WARNING"):
+        run_partition_migration(conn)
+    assert "Deleting 1 transaction rows without a scheme_id" in caplog.text
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT id FROM "transaction"')).scalars().all() == [1]